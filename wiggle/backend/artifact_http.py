@@ -0,0 +1,186 @@
+"""
+HTTP responses for artifact downloads
+
+Artifacts never change once written for a build ID, so downloads carry a
+strong ETag and `Cache-Control: immutable`, answer conditional requests
+with 304, serve single byte ranges with 206 and prefer the precompressed
+brotli/gzip sidecars when the client accepts them. Stores that can serve
+clients directly (S3) answer with a redirect to a presigned URL instead.
+"""
+
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+
+from artifact_store import IMMUTABLE_CACHE_CONTROL, ArtifactExpired, ArtifactStore
+
+RANGE_CHUNK_SIZE = 256 * 1024
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Parse Accept-Encoding into {coding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match comparison (weak comparison, as RFC 9110 requires)"""
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Single "bytes=" range as inclusive (start, end); None when unsatisfiable
+
+    Raises ValueError for malformed or multi-range headers, which are served
+    as a normal 200 response.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if first == "":
+        suffix = int(last)
+        if suffix <= 0:
+            return None
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and start > end:
+        raise ValueError(header)
+    if start >= size:
+        return None
+    return start, min(end, size - 1)
+
+
+async def _read_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def artifact_response(
+    request: Request,
+    store: ArtifactStore,
+    path: Path,
+    filename: str,
+    media_type: str
+) -> Response:
+    """Serve an artifact with validators, caching, ranges and precompression"""
+    base_etag = await store.etag(filename)
+    variants = store.variants(filename)
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes"
+    }
+    if variants:
+        headers["Vary"] = "Accept-Encoding"
+
+    # Ranges always address the identity representation
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() != f'"{base_etag}"':
+        range_header = None
+
+    encoding = None
+    if not range_header and variants:
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        for candidate in variants:
+            if accepted.get(candidate, 0) > 0:
+                encoding = candidate
+                break
+
+    etag = f'"{base_etag}-{encoding}"' if encoding else f'"{base_etag}"'
+    headers["ETag"] = etag
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return FileResponse(path=variants[encoding], filename=filename, media_type=media_type, headers=headers)
+
+    if range_header:
+        size = path.stat().st_size
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            # Malformed or multi-range request: send the whole file
+            byte_range = (0, size - 1)
+            range_header = None
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if range_header:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+            return StreamingResponse(
+                _read_range(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers
+            )
+
+    return FileResponse(path=path, filename=filename, media_type=media_type, headers=headers)
+
+
+async def artifact_download(
+    request: Request,
+    store: ArtifactStore,
+    filename: str,
+    label: str,
+    media_type: str,
+    on_miss: Optional[Callable[[], Awaitable[bool]]] = None
+) -> Response:
+    """Download endpoint body: presigned redirect or local response, 410/404 otherwise
+
+    With ?redirect=false the presigned URL is returned as JSON instead of a
+    307 redirect, for clients that want to hand it to another component.
+    on_miss is awaited when the file is unknown (e.g. to reload a shared
+    volume); the lookup is retried once if it returns True.
+    """
+    for attempt in range(2):
+        try:
+            url = await store.download_url(filename, media_type)
+            path = None if url else store.resolve(filename)
+            break
+        except ArtifactExpired:
+            raise HTTPException(status_code=410, detail=f"{label} file has expired")
+        except FileNotFoundError:
+            if attempt or on_miss is None or not await on_miss():
+                raise HTTPException(status_code=404, detail=f"{label} file not found")
+
+    if url:
+        # The URL itself expires, so the redirect must not be cached
+        headers = {"Cache-Control": "no-store"}
+        if request.query_params.get("redirect", "true").lower() in ("0", "false"):
+            return JSONResponse({"url": url, "expiresIn": store.presign_seconds}, headers=headers)
+        return RedirectResponse(url, status_code=307, headers=headers)
+
+    return await artifact_response(request, store, path, filename, media_type)
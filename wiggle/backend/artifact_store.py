@@ -0,0 +1,730 @@
+"""
+Bounded, content-addressed storage for generated artifacts
+
+Uploads, textures, models and baked animations are written through an
+artifact store instead of straight to disk. Artifacts keep their public
+names (front_<build>.png, <build>_model.glb, ...) but the bytes live in
+content-addressed blobs sharded by hash:
+
+    blobs/ab/cd/abcd1234...      the content, stored once
+    refs/<name hash[:2]>/<name>  one reference per artifact name
+
+Identical uploads or textures across builds share one blob; a blob is
+deleted once no artifact name refers to it any more, and the bytes saved
+by deduplication are reported. Artifacts expire after a TTL (download URLs
+are documented as valid for 24 hours) and stored bytes are kept under a
+size cap by evicting the least recently used artifacts. A background
+sweeper enforces both; downloads of artifacts that expired or were
+evicted get a 410 instead of a 404.
+
+Backends (ARTIFACT_BACKEND=local|s3):
+- LocalArtifactStore: a directory (the Modal volume or uploads/). Text
+  blobs (OBJ models, VAT metadata) get precompressed gzip and, when the
+  optional "brotli" package is installed, brotli sidecars (<blob>.gz /
+  <blob>.br) that share the blob's lifetime.
+- S3ArtifactStore: any S3-compatible bucket (AWS, MinIO via
+  S3_ENDPOINT_URL). Downloads are answered with presigned URLs so clients
+  fetch directly from storage instead of through the API process. Needs
+  the optional "boto3" package.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import importlib.util
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Names of evicted artifacts remembered so their downloads can answer 410
+TOMBSTONE_LIMIT = 10000
+
+# Content-Encoding -> sidecar suffix, in order of preference
+SIDECAR_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+TEXT_EXTENSIONS = (".obj", ".mtl", ".json", ".gltf", ".txt", ".svg")
+# Binary formats that never compress well (PNG, JPEG, EXR, GLB)
+BINARY_MAGIC = (b"\x89PNG", b"\xff\xd8", b"\x76\x2f\x31\x01", b"glTF")
+# Sidecars must save at least this fraction of the original size
+MIN_COMPRESSION_SAVING = 0.1
+
+# Unreferenced blobs younger than this are kept: another writer may be
+# about to add its reference (refs are written after the blob)
+BLOB_GC_GRACE_SECONDS = 300.0
+
+HAS_BROTLI = importlib.util.find_spec("brotli") is not None
+
+# Artifacts are immutable per build ID; let browsers and CDNs keep them
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def is_compressible(name: str, data: bytes) -> bool:
+    """Text formats by extension or by content (OBJ data saved as .glb)"""
+    if name.endswith(TEXT_EXTENSIONS):
+        return True
+    head = data[:8192]
+    return not head.startswith(BINARY_MAGIC) and b"\0" not in head
+
+
+def compress_variants(data: bytes) -> Dict[str, bytes]:
+    """gzip (and brotli when available) encodings worth keeping"""
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if HAS_BROTLI:
+        import brotli
+        variants["br"] = brotli.compress(data, quality=11)
+    limit = len(data) * (1 - MIN_COMPRESSION_SAVING)
+    return {encoding: body for encoding, body in variants.items() if len(body) <= limit}
+
+
+def check_name(name: str) -> str:
+    """Reject artifact names that are empty, hidden, sidecars or contain a path"""
+    if (
+        not name or Path(name).name != name or name.startswith(".")
+        or name.endswith(tuple(SIDECAR_SUFFIXES.values()))
+    ):
+        raise FileNotFoundError(name)
+    return name
+
+
+def blob_key(sha: str) -> str:
+    """Sharded location of a blob: blobs/ab/cd/<sha>"""
+    return f"blobs/{sha[:2]}/{sha[2:4]}/{sha}"
+
+
+class ArtifactExpired(Exception):
+    """Raised when an artifact existed but has expired or been evicted"""
+
+
+class ArtifactStore:
+    """Named artifacts over deduplicated blobs, with TTL, size cap and LRU eviction"""
+
+    name = "base"
+
+    def __init__(
+        self,
+        ttl_seconds: float = 24 * 3600,
+        max_bytes: int = 10 * 1024 ** 3,
+        sweep_interval: float = 300.0
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        # Last download time per artifact, for LRU ordering (creation otherwise)
+        self._last_access: Dict[str, float] = {}
+        self._tombstones: "OrderedDict[str, str]" = OrderedDict()
+        # References per blob, rebuilt from the refs on every sweep
+        self._refcounts: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+        # Last put per blob; the sweeper never frees a blob put within the
+        # grace period, and frees blobs only while holding _gc_lock
+        self._put_at: Dict[str, float] = {}
+        self._gc_lock = threading.Lock()
+        self._files = 0
+        self._bytes = 0
+        self._logical_bytes = 0
+        self._dedup_hits = 0
+        self._expired = 0
+        self._evicted = 0
+        self._evicted_bytes = 0
+        self._gone_hits = 0
+        self._last_sweep: Optional[Dict[str, Any]] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweeper())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def put(self, name: str, data: bytes) -> Union[Path, str]:
+        """Store an artifact, reusing an existing blob with the same content
+
+        Returns the blob location (path or URI).
+        """
+        check_name(name)
+        sha = hashlib.sha256(data).hexdigest()
+        written = await asyncio.to_thread(self._put_blob, sha, name, data)
+        location = await asyncio.to_thread(self._write_ref, name, sha)
+        if written:
+            self._bytes += written
+        else:
+            self._dedup_hits += 1
+        self._refcounts[sha] += 1
+        self._logical_bytes += len(data)
+        self._files += 1
+        self._tombstones.pop(name, None)
+        self._last_access[name] = time.time()
+        return location
+
+    async def delete(self, name: str) -> None:
+        """Drop an artifact name that is no longer needed (not counted as eviction)
+
+        The blob is freed by the next sweep once nothing refers to it.
+        """
+        ref = await asyncio.to_thread(self._read_ref, check_name(name))
+        if ref is None:
+            return
+        await asyncio.to_thread(self._delete_ref, name, ref[0])
+        self._release(ref[0])
+        self._files -= 1
+        self._last_access.pop(name, None)
+
+    async def download_url(self, name: str, media_type: str) -> Optional[str]:
+        """URL clients can fetch directly, or None when the API serves the file"""
+        return None
+
+    def resolve(self, name: str) -> Path:
+        """Local path of a live artifact for download"""
+        raise NotImplementedError
+
+    async def sweep(self) -> Dict[str, Any]:
+        """Evict expired artifacts, then LRU ones until under the size cap"""
+        started = time.perf_counter()
+        result = await asyncio.to_thread(self._sweep)
+        result["durationMs"] = int((time.perf_counter() - started) * 1000)
+        result["at"] = datetime.now().isoformat()
+        self._last_sweep = result
+        if result["expired"] or result["evicted"] or result["blobsFreed"]:
+            logger.info(
+                f"Artifact sweep ({self.name}): {result['expired']} expired, "
+                f"{result['evicted']} evicted for size, {result['blobsFreed']} blobs freed, "
+                f"{result['bytes']} bytes remaining"
+            )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "files": self._files,
+            "blobs": sum(1 for count in self._refcounts.values() if count > 0),
+            "bytes": self._bytes,
+            "logicalBytes": self._logical_bytes,
+            "dedupSavedBytes": max(self._logical_bytes - self._bytes, 0),
+            "dedupHits": self._dedup_hits,
+            "maxBytes": self.max_bytes,
+            "usage": round(self._bytes / self.max_bytes, 3) if self.max_bytes else None,
+            "ttlSeconds": self.ttl_seconds,
+            "expired": self._expired,
+            "evictedForSize": self._evicted,
+            "evictedBytes": self._evicted_bytes,
+            "goneResponses": self._gone_hits,
+            "lastSweep": self._last_sweep
+        }
+
+    def _check_gone(self, name: str, ref: Optional[Tuple[str, float]]) -> str:
+        """Blob hash of a live artifact; raises ArtifactExpired / FileNotFoundError"""
+        if name in self._tombstones:
+            self._gone_hits += 1
+            raise ArtifactExpired(f"{name} was {self._tombstones[name]}")
+        if ref is None:
+            raise FileNotFoundError(name)
+        sha, created = ref
+        if time.time() - created > self.ttl_seconds:
+            self._remove(name, sha, "expired")
+            self._expired += 1
+            self._gone_hits += 1
+            raise ArtifactExpired(f"{name} has expired")
+        self._last_access[name] = time.time()
+        return sha
+
+    def _release(self, sha: str) -> None:
+        self._refcounts[sha] -= 1
+        if self._refcounts[sha] <= 0:
+            del self._refcounts[sha]
+
+    def _put_blob(self, sha: str, name: str, data: bytes) -> int:
+        with self._gc_lock:
+            self._put_at[sha] = time.time()
+        return self._write_blob(sha, name, data)
+
+    async def _sweeper(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Artifact sweep failed: {str(e)}")
+            await asyncio.sleep(self.sweep_interval)
+
+    # Backend primitives, called from worker threads
+
+    def _write_blob(self, sha: str, name: str, data: bytes) -> int:
+        """Store a blob unless present; returns bytes written (0 if deduplicated)"""
+        raise NotImplementedError
+
+    def _write_ref(self, name: str, sha: str) -> Union[Path, str]:
+        raise NotImplementedError
+
+    def _read_ref(self, name: str) -> Optional[Tuple[str, float]]:
+        """(blob hash, created) for an artifact name"""
+        raise NotImplementedError
+
+    def _delete_ref(self, name: str, sha: str) -> None:
+        raise NotImplementedError
+
+    def _delete_blob(self, sha: str) -> None:
+        raise NotImplementedError
+
+    def _blob_modified(self, sha: str) -> Optional[float]:
+        """Current modification time of a blob, or None if it is gone"""
+        raise NotImplementedError
+
+    def _list_refs(self) -> List[Tuple[str, str, float]]:
+        """(name, blob hash, created) for every artifact"""
+        raise NotImplementedError
+
+    def _list_blobs(self) -> Dict[str, Tuple[int, float]]:
+        """blob hash -> (size incl. sidecars, modified)"""
+        raise NotImplementedError
+
+    def _sweep(self) -> Dict[str, Any]:
+        now = time.time()
+        blobs = self._list_blobs()
+        expired = 0
+        live = []
+        for name, sha, created in self._list_refs():
+            if now - created > self.ttl_seconds:
+                self._remove(name, sha, "expired")
+                expired += 1
+            elif sha not in blobs:
+                # Blob lost (e.g. deleted by hand); the reference is useless
+                self._delete_ref(name, sha)
+            else:
+                live.append((self._last_access.get(name, created), name, sha))
+
+        counts = Counter(sha for _, _, sha in live)
+        stored = sum(blobs[sha][0] for sha in counts)
+        evicted = 0
+        if stored > self.max_bytes:
+            for _, name, sha in sorted(live):
+                if stored <= self.max_bytes:
+                    break
+                self._remove(name, sha, "evicted")
+                evicted += 1
+                counts[sha] -= 1
+                if counts[sha] == 0:
+                    del counts[sha]
+                    stored -= blobs[sha][0]
+                    self._evicted_bytes += blobs[sha][0]
+
+        # Blobs nothing refers to any more (past the grace period). A put may
+        # have refreshed one and added a reference since the listing, so each
+        # is checked again against recent puts and its current mtime first.
+        freed = 0
+        for sha, (size, modified) in blobs.items():
+            if sha in counts or now - modified <= BLOB_GC_GRACE_SECONDS:
+                continue
+            with self._gc_lock:
+                cutoff = time.time() - BLOB_GC_GRACE_SECONDS
+                if self._put_at.get(sha, 0.0) > cutoff:
+                    continue
+                modified = self._blob_modified(sha)
+                if modified is None or modified > cutoff:
+                    continue
+                self._delete_blob(sha)
+            freed += 1
+        with self._gc_lock:
+            cutoff = time.time() - BLOB_GC_GRACE_SECONDS
+            self._put_at = {sha: at for sha, at in self._put_at.items() if at > cutoff}
+
+        # Forget access times of artifacts deleted elsewhere
+        present = {name for _, name, _ in live}
+        for name in list(self._last_access):
+            if name not in present:
+                del self._last_access[name]
+
+        self._refcounts = counts
+        self._expired += expired
+        self._evicted += evicted
+        self._files = sum(counts.values())
+        self._bytes = stored
+        self._logical_bytes = sum(blobs[sha][0] * count for sha, count in counts.items())
+        return {
+            "expired": expired,
+            "evicted": evicted,
+            "blobsFreed": freed,
+            "files": self._files,
+            "blobs": len(counts),
+            "bytes": stored
+        }
+
+    def _remove(self, name: str, sha: str, reason: str) -> None:
+        self._delete_ref(name, sha)
+        self._last_access.pop(name, None)
+        self._tombstones[name] = reason
+        while len(self._tombstones) > TOMBSTONE_LIMIT:
+            self._tombstones.popitem(last=False)
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Content-addressed artifact directory, served by the API process"""
+
+    name = "local"
+
+    def __init__(
+        self,
+        root: str,
+        precompress: bool = True,
+        precompress_min_bytes: int = 1024,
+        **limits: Any
+    ):
+        super().__init__(**limits)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.precompress = precompress
+        self.precompress_min_bytes = precompress_min_bytes
+        self._migrated = False
+
+    def blob_path(self, sha: str) -> Path:
+        return self.root / blob_key(sha)
+
+    def ref_path(self, name: str) -> Path:
+        shard = hashlib.sha256(name.encode()).hexdigest()[:2]
+        return self.root / "refs" / shard / name
+
+    def resolve(self, name: str) -> Path:
+        """Blob path of a live artifact for download
+
+        Raises ArtifactExpired for artifacts past their TTL or evicted, and
+        FileNotFoundError for names the store has never seen.
+        """
+        check_name(name)
+        ref = self._read_ref(name) if name not in self._tombstones else None
+        if ref is None and name not in self._tombstones and (self.root / name).is_file():
+            # Flat file from before the blob layout, not migrated yet
+            return self.root / name
+        return self.blob_path(self._check_gone(name, ref))
+
+    async def etag(self, name: str) -> str:
+        """Strong validator for an artifact: its blob hash"""
+        ref = self._read_ref(name)
+        if ref is None:
+            return await asyncio.to_thread(self._hash_file, self.root / name)
+        return ref[0]
+
+    def variants(self, name: str) -> Dict[str, Path]:
+        """Precompressed sidecars of the artifact's blob, keyed by Content-Encoding"""
+        ref = self._read_ref(name)
+        if ref is None:
+            return {}
+        blob = self.blob_path(ref[0])
+        found = {}
+        for encoding, suffix in SIDECAR_SUFFIXES.items():
+            sidecar = blob.with_name(blob.name + suffix)
+            if sidecar.exists():
+                found[encoding] = sidecar
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(super().stats(), root=str(self.root))
+
+    async def sweep(self) -> Dict[str, Any]:
+        if not self._migrated:
+            await asyncio.to_thread(self._migrate_flat_files)
+            self._migrated = True
+        return await super().sweep()
+
+    def _write_blob(self, sha: str, name: str, data: bytes) -> int:
+        blob = self.blob_path(sha)
+        if blob.exists():
+            # Refresh mtime so the GC grace period covers the new reference
+            os.utime(blob)
+            return 0
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        written = self._write_atomic(blob, data)
+        if self.precompress and len(data) >= self.precompress_min_bytes and is_compressible(name, data):
+            for encoding, body in compress_variants(data).items():
+                written += self._write_atomic(blob.with_name(blob.name + SIDECAR_SUFFIXES[encoding]), body)
+        return written
+
+    def _write_ref(self, name: str, sha: str) -> Path:
+        ref = self.ref_path(name)
+        ref.parent.mkdir(parents=True, exist_ok=True)
+        self._write_atomic(ref, sha.encode())
+        return self.blob_path(sha)
+
+    def _read_ref(self, name: str) -> Optional[Tuple[str, float]]:
+        ref = self.ref_path(name)
+        try:
+            return ref.read_text().strip(), ref.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _delete_ref(self, name: str, sha: str) -> None:
+        self.ref_path(name).unlink(missing_ok=True)
+
+    def _delete_blob(self, sha: str) -> None:
+        blob = self.blob_path(sha)
+        blob.unlink(missing_ok=True)
+        for suffix in SIDECAR_SUFFIXES.values():
+            blob.with_name(blob.name + suffix).unlink(missing_ok=True)
+
+    def _blob_modified(self, sha: str) -> Optional[float]:
+        try:
+            return self.blob_path(sha).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _list_refs(self) -> List[Tuple[str, str, float]]:
+        refs = []
+        for shard in self._subdirs(self.root / "refs"):
+            with os.scandir(shard) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.startswith("."):
+                        with open(entry.path) as f:
+                            refs.append((entry.name, f.read().strip(), entry.stat().st_mtime))
+        return refs
+
+    def _list_blobs(self) -> Dict[str, Tuple[int, float]]:
+        blobs: Dict[str, Tuple[int, float]] = {}
+        sidecar_bytes: Counter = Counter()
+        suffixes = tuple(SIDECAR_SUFFIXES.values())
+        for first in self._subdirs(self.root / "blobs"):
+            for second in self._subdirs(first):
+                with os.scandir(second) as it:
+                    for entry in it:
+                        if not entry.is_file() or entry.name.startswith("."):
+                            continue
+                        stat = entry.stat()
+                        if entry.name.endswith(suffixes):
+                            sidecar_bytes[os.path.splitext(entry.name)[0]] += stat.st_size
+                        else:
+                            blobs[entry.name] = (stat.st_size, stat.st_mtime)
+        return {sha: (size + sidecar_bytes[sha], modified) for sha, (size, modified) in blobs.items()}
+
+    def _migrate_flat_files(self) -> None:
+        """Move artifacts written before the blob layout into it, keeping their age"""
+        suffixes = tuple(SIDECAR_SUFFIXES.values())
+        moved = 0
+        with os.scandir(self.root) as it:
+            entries = [entry for entry in it if entry.is_file() and not entry.name.startswith(".")]
+        for entry in entries:
+            path = Path(entry.path)
+            if entry.name.endswith(suffixes):
+                path.unlink(missing_ok=True)
+                continue
+            created = entry.stat().st_mtime
+            data = path.read_bytes()
+            sha = hashlib.sha256(data).hexdigest()
+            self._write_blob(sha, entry.name, data)
+            self._write_ref(entry.name, sha)
+            os.utime(self.ref_path(entry.name), (created, created))
+            path.unlink()
+            moved += 1
+        if moved:
+            logger.info(f"Moved {moved} flat artifacts in {self.root} into the blob layout")
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> int:
+        """Write via a temp file + rename so readers never see partial content"""
+        # Unique temp name: concurrent puts of the same content must not share it
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return len(data)
+
+    @staticmethod
+    def _subdirs(path: Path) -> List[Path]:
+        try:
+            with os.scandir(path) as it:
+                return [Path(entry.path) for entry in it if entry.is_dir()]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+class S3ArtifactStore(ArtifactStore):
+    """Content-addressed artifacts in an S3-compatible bucket, downloaded via presigned URLs
+
+    References are empty objects at refs/<name>/<blob hash>, so one listing
+    of the refs prefix yields every name with its blob.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        presign_seconds: int = 3600,
+        **limits: Any
+    ):
+        super().__init__(**limits)
+        import boto3
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url
+        self.presign_seconds = presign_seconds
+        # Path-style addressing works for MinIO and AWS alike
+        self._s3 = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(s3={"addressing_style": "path"}, max_pool_connections=32)
+        )
+        self._presigned = 0
+
+    async def download_url(self, name: str, media_type: str) -> str:
+        """Presigned GET URL for a live artifact's blob
+
+        Raises ArtifactExpired for artifacts past their TTL or evicted, and
+        FileNotFoundError for unknown names.
+        """
+        check_name(name)
+        ref = None if name in self._tombstones else await asyncio.to_thread(self._read_ref, name)
+        sha = self._check_gone(name, ref)
+        self._presigned += 1
+        return await asyncio.to_thread(
+            self._s3.generate_presigned_url,
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.prefix + blob_key(sha),
+                "ResponseContentType": media_type,
+                "ResponseContentDisposition": f'attachment; filename="{name}"'
+            },
+            ExpiresIn=self.presign_seconds
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            super().stats(),
+            bucket=self.bucket,
+            prefix=self.prefix,
+            endpointUrl=self.endpoint_url,
+            presignedUrls=self._presigned,
+            presignSeconds=self.presign_seconds
+        )
+
+    def _write_blob(self, sha: str, name: str, data: bytes) -> int:
+        from botocore.exceptions import ClientError
+
+        key = self.prefix + blob_key(sha)
+        try:
+            self._s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                raise
+        else:
+            # Refresh LastModified so the GC grace period covers the new reference
+            self._s3.copy_object(
+                Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+                MetadataDirective="REPLACE", CacheControl=IMMUTABLE_CACHE_CONTROL
+            )
+            return 0
+        self._s3.put_object(Bucket=self.bucket, Key=key, Body=data, CacheControl=IMMUTABLE_CACHE_CONTROL)
+        return len(data)
+
+    def _write_ref(self, name: str, sha: str) -> str:
+        # Replace any earlier reference under the same name
+        for old_sha, _ in self._refs_for(name):
+            if old_sha != sha:
+                self._delete_ref(name, old_sha)
+        self._s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}refs/{name}/{sha}", Body=b"")
+        return f"s3://{self.bucket}/{self.prefix}{blob_key(sha)}"
+
+    def _read_ref(self, name: str) -> Optional[Tuple[str, float]]:
+        refs = self._refs_for(name)
+        return max(refs, key=lambda ref: ref[1]) if refs else None
+
+    def _delete_ref(self, name: str, sha: str) -> None:
+        self._s3.delete_object(Bucket=self.bucket, Key=f"{self.prefix}refs/{name}/{sha}")
+
+    def _delete_blob(self, sha: str) -> None:
+        self._s3.delete_object(Bucket=self.bucket, Key=self.prefix + blob_key(sha))
+
+    def _blob_modified(self, sha: str) -> Optional[float]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self._s3.head_object(Bucket=self.bucket, Key=self.prefix + blob_key(sha))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["LastModified"].timestamp()
+
+    def _refs_for(self, name: str) -> List[Tuple[str, float]]:
+        response = self._s3.list_objects_v2(Bucket=self.bucket, Prefix=f"{self.prefix}refs/{name}/")
+        return [
+            (obj["Key"].rsplit("/", 1)[1], obj["LastModified"].timestamp())
+            for obj in response.get("Contents", [])
+        ]
+
+    def _list_objects(self, prefix: str) -> List[Dict[str, Any]]:
+        objects = []
+        paginator = self._s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            objects.extend(page.get("Contents", []))
+        return objects
+
+    def _list_refs(self) -> List[Tuple[str, str, float]]:
+        refs = []
+        for obj in self._list_objects("refs/"):
+            parts = obj["Key"][len(self.prefix):].split("/")
+            if len(parts) == 3:
+                refs.append((parts[1], parts[2], obj["LastModified"].timestamp()))
+        return refs
+
+    def _list_blobs(self) -> Dict[str, Tuple[int, float]]:
+        return {
+            obj["Key"].rsplit("/", 1)[1]: (obj["Size"], obj["LastModified"].timestamp())
+            for obj in self._list_objects("blobs/")
+        }
+
+
+def artifact_store_from_env(root: str, prefix: str = "") -> ArtifactStore:
+    """Select the backend from ARTIFACT_BACKEND (local directory by default)
+
+    root is the local directory; prefix is the key prefix used in the bucket.
+    """
+    limits = {
+        "ttl_seconds": float(os.getenv("ARTIFACT_TTL_SECONDS", str(24 * 3600))),
+        "max_bytes": int(float(os.getenv("ARTIFACT_MAX_MB", "10240")) * 1024 * 1024),
+        "sweep_interval": float(os.getenv("ARTIFACT_SWEEP_SECONDS", "300"))
+    }
+    kind = os.getenv("ARTIFACT_BACKEND", "local")
+    if kind == "local":
+        return LocalArtifactStore(
+            root,
+            precompress=os.getenv("ARTIFACT_PRECOMPRESS", "1") == "1",
+            **limits
+        )
+    if kind == "s3":
+        bucket = os.getenv("ARTIFACT_S3_BUCKET")
+        if not bucket:
+            raise ValueError("ARTIFACT_S3_BUCKET is required when ARTIFACT_BACKEND=s3")
+        return S3ArtifactStore(
+            bucket,
+            prefix=os.getenv("ARTIFACT_S3_PREFIX", prefix),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            region=os.getenv("AWS_REGION") or None,
+            presign_seconds=int(os.getenv("ARTIFACT_PRESIGN_SECONDS", "3600")),
+            **limits
+        )
+    raise ValueError(f"Unknown ARTIFACT_BACKEND: {kind} (expected 'local' or 's3')")
@@ -0,0 +1,246 @@
+import bpy
+import sys
+import os
+import json
+import math
+
+# 预设动作: 只驱动物体自身的变换，布料模拟负责产生甩动/抖动
+MOTIONS = ("sway", "spin", "bounce", "shake")
+
+
+def import_model(model_path):
+    """按文件头导入 GLB 或 OBJ，返回第一个网格对象"""
+    with open(model_path, "rb") as f:
+        is_gltf = f.read(4) == b"glTF"
+
+    if is_gltf:
+        bpy.ops.import_scene.gltf(filepath=model_path)
+    elif hasattr(bpy.ops.wm, "obj_import"):
+        bpy.ops.wm.obj_import(filepath=model_path)
+    else:
+        bpy.ops.import_scene.obj(filepath=model_path)
+
+    for obj in bpy.context.scene.objects:
+        if obj.type == 'MESH':
+            return obj
+    return None
+
+
+def prepare_mesh(obj, min_vertices=200):
+    """应用变换；顶点过少时细分，保证布料能产生形变"""
+    bpy.ops.object.select_all(action='DESELECT')
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+    bpy.ops.object.transform_apply(location=False, rotation=True, scale=True)
+
+    if len(obj.data.vertices) < min_vertices:
+        bpy.ops.object.mode_set(mode='EDIT')
+        bpy.ops.mesh.select_all(action='SELECT')
+        bpy.ops.mesh.subdivide(number_cuts=8)
+        bpy.ops.object.mode_set(mode='OBJECT')
+        print(f"细分后顶点数: {len(obj.data.vertices)}")
+
+
+def add_pin_group(obj, top_ratio=0.1):
+    """把最高处 top_ratio 高度范围内的顶点固定（肩部）"""
+    zs = [v.co.z for v in obj.data.vertices]
+    z_max, z_min = max(zs), min(zs)
+    threshold = z_max - (z_max - z_min) * top_ratio
+
+    group = obj.vertex_groups.new(name="Pin")
+    pinned = [v.index for v in obj.data.vertices if v.co.z >= threshold]
+    group.add(pinned, 1.0, 'REPLACE')
+    print(f"固定顶点数: {len(pinned)}")
+    return group
+
+
+def add_cloth(obj, frame_end):
+    """添加布料修改器（棉质参数）"""
+    mod = obj.modifiers.new(name="Cloth", type='CLOTH')
+    settings = mod.settings
+    settings.quality = 5
+    settings.mass = 0.3
+    settings.tension_stiffness = 15
+    settings.compression_stiffness = 15
+    settings.shear_stiffness = 5
+    settings.bending_stiffness = 0.5
+    settings.vertex_group_mass = "Pin"
+    mod.collision_settings.use_self_collision = False
+    mod.point_cache.frame_start = 1
+    mod.point_cache.frame_end = frame_end
+    return mod
+
+
+def keyframe_motion(obj, motion, frame_end):
+    """为物体写入预设动作的关键帧"""
+    for frame in range(1, frame_end + 1, 2):
+        t = (frame - 1) / max(1, frame_end - 1)
+        obj.location = (0.0, 0.0, 0.0)
+        obj.rotation_euler = (0.0, 0.0, 0.0)
+
+        if motion == "sway":
+            obj.rotation_euler[2] = math.radians(25) * math.sin(t * 4 * math.pi)
+        elif motion == "spin":
+            obj.rotation_euler[2] = t * 2 * math.pi
+        elif motion == "bounce":
+            obj.location[2] = 0.3 * abs(math.sin(t * 3 * math.pi))
+        elif motion == "shake":
+            obj.location[0] = 0.15 * math.sin(t * 10 * math.pi)
+
+        obj.keyframe_insert(data_path="location", frame=frame)
+        obj.keyframe_insert(data_path="rotation_euler", frame=frame)
+
+
+def simulate(obj, frame_end, step):
+    """逐帧推进模拟，采样每 step 帧的局部坐标"""
+    scene = bpy.context.scene
+    samples = []
+    for frame in range(1, frame_end + 1):
+        scene.frame_set(frame)
+        if (frame - 1) % step == 0 or frame == frame_end:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            evaluated = obj.evaluated_get(depsgraph)
+            samples.append((frame, [tuple(v.co) for v in evaluated.data.vertices]))
+    print(f"模拟完成，采样 {len(samples)} 帧")
+    return samples
+
+
+def write_morph_targets(obj, samples):
+    """把采样帧写成形态键，并用关键帧在相邻形态键之间线性过渡"""
+    obj.shape_key_add(name="Basis", from_mix=False)
+    keys = []
+    for frame, coords in samples:
+        key = obj.shape_key_add(name=f"f{frame:04d}", from_mix=False)
+        for i, co in enumerate(coords):
+            key.data[i].co = co
+        keys.append((frame, key))
+
+    for index, (frame, key) in enumerate(keys):
+        prev_frame = keys[index - 1][0] if index > 0 else None
+        next_frame = keys[index + 1][0] if index + 1 < len(keys) else None
+        if prev_frame is not None:
+            key.value = 0.0
+            key.keyframe_insert(data_path="value", frame=prev_frame)
+        key.value = 1.0
+        key.keyframe_insert(data_path="value", frame=frame)
+        if next_frame is not None:
+            key.value = 0.0
+            key.keyframe_insert(data_path="value", frame=next_frame)
+
+
+def write_vertex_animation_texture(obj, samples, texture_path, meta_path, fps):
+    """顶点动画贴图: 每列一个顶点，每行一帧，RGB = 相对静止位置的偏移"""
+    rest = [tuple(v.co) for v in obj.data.vertices]
+    width = len(rest)
+    height = len(samples)
+    if width > 16384:
+        raise RuntimeError(f"顶点数 {width} 超出贴图宽度上限 16384，请改用 morph 格式")
+
+    pixels = []
+    bounds = [0.0, 0.0]
+    # 图像像素从下往上存储，最后一帧写在最前面使第 0 行对应第一帧（顶部）
+    for frame, coords in reversed(samples):
+        for (x, y, z), (rx, ry, rz) in zip(coords, rest):
+            dx, dy, dz = x - rx, y - ry, z - rz
+            bounds[0] = min(bounds[0], dx, dy, dz)
+            bounds[1] = max(bounds[1], dx, dy, dz)
+            pixels.extend((dx, dy, dz, 1.0))
+
+    image = bpy.data.images.new("VAT", width=width, height=height, alpha=True, float_buffer=True)
+    image.pixels = pixels
+    image.filepath_raw = texture_path
+    image.file_format = 'OPEN_EXR'
+    image.save()
+
+    # 第二套 UV: 每个顶点指向自己所在的贴图列
+    uv_layer = obj.data.uv_layers.new(name="VAT_UV")
+    for loop in obj.data.loops:
+        uv_layer.data[loop.index].uv = ((loop.vertex_index + 0.5) / width, 0.0)
+
+    with open(meta_path, "w") as f:
+        json.dump({
+            "vertexCount": width,
+            "frameCount": height,
+            "frames": [frame for frame, _ in samples],
+            "fps": fps,
+            "offsetMin": bounds[0],
+            "offsetMax": bounds[1],
+            "uvLayer": "VAT_UV"
+        }, f)
+    print(f"顶点动画贴图: {width}x{height} -> {texture_path}")
+
+
+def bake(model_path, output_path, motion, fmt, frame_end=72, fps=24, step=3):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    scene = bpy.context.scene
+    scene.render.fps = fps
+    scene.frame_start = 1
+    scene.frame_end = frame_end
+
+    obj = import_model(model_path)
+    if obj is None:
+        print("错误: 模型中没有网格对象")
+        return False
+
+    prepare_mesh(obj)
+    add_pin_group(obj)
+    add_cloth(obj, frame_end)
+    keyframe_motion(obj, motion, frame_end)
+    samples = simulate(obj, frame_end, step)
+
+    # 烘焙结果已采样，移除布料修改器，导出时不再实时模拟
+    obj.modifiers.remove(obj.modifiers["Cloth"])
+    scene.frame_set(1)
+
+    if fmt == "vat":
+        base, _ = os.path.splitext(output_path)
+        write_vertex_animation_texture(obj, samples, f"{base}.vat.exr", f"{base}.vat.json", fps)
+        # 静止网格 + 物体动作；顶点偏移由贴图提供，只清除网格形态键上的动画，保留物体的预设动作
+        shape_keys = obj.data.shape_keys
+        if shape_keys is not None and shape_keys.animation_data is not None:
+            shape_keys.animation_data_clear()
+    else:
+        write_morph_targets(obj, samples)
+
+    bpy.ops.object.select_all(action='DESELECT')
+    obj.select_set(True)
+    bpy.ops.export_scene.gltf(
+        filepath=output_path,
+        export_format='GLB',
+        use_selection=True,
+        export_texcoords=True,
+        export_materials='EXPORT',
+        export_animations=True,
+        export_morph=(fmt != "vat"),
+        export_apply=False
+    )
+    print(f"✓ 导出: {output_path}")
+    return True
+
+
+if __name__ == "__main__":
+    argv = sys.argv
+    if "--" not in argv:
+        print("用法: blender --background --python bake_cloth_animation.py -- <model> <output.glb> <motion> [morph|vat] [frames] [fps]")
+        sys.exit(1)
+    argv = argv[argv.index("--") + 1:]
+
+    if len(argv) < 3:
+        print("用法: blender --background --python bake_cloth_animation.py -- <model> <output.glb> <motion> [morph|vat] [frames] [fps]")
+        sys.exit(1)
+
+    model_path, output_path, motion = argv[0], argv[1], argv[2]
+    fmt = argv[3] if len(argv) > 3 else "morph"
+    frame_end = int(argv[4]) if len(argv) > 4 else 72
+    fps = int(argv[5]) if len(argv) > 5 else 24
+
+    if motion not in MOTIONS:
+        print(f"错误: 未知动作 {motion}，可选: {', '.join(MOTIONS)}")
+        sys.exit(1)
+
+    if not os.path.exists(model_path):
+        print(f"错误: 模型文件不存在: {model_path}")
+        sys.exit(1)
+
+    success = bake(model_path, output_path, motion, fmt, frame_end, fps)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Throughput comparison for the query and n8n helper services under concurrent load
+
+Runs the same request mix against one or more running deployments and
+prints requests/s and latency percentiles side by side, e.g. the previous
+Flask debug server against the uvicorn service:
+
+    python bench_query_api.py \
+        --target flask=http://localhost:5001 \
+        --target asgi=http://localhost:5002 \
+        --path /health --path "/api/builds?limit=10" --path /api/builds/build_123 \
+        --concurrency 64 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+
+async def run_target(
+    base_url: str,
+    paths: List[str],
+    method: str,
+    body: Any,
+    concurrency: int,
+    duration: float,
+    warmup: float
+) -> Dict[str, Any]:
+    """Keep `concurrency` requests in flight for `duration` seconds, cycling through paths"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        async def worker(index: int, until: float, record: bool) -> None:
+            n = index
+            while time.perf_counter() < until:
+                path = paths[n % len(paths)]
+                n += concurrency
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                if record:
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+        if warmup > 0:
+            until = time.perf_counter() + warmup
+            await asyncio.gather(*(worker(i, until, False) for i in range(concurrency)))
+
+        started = time.perf_counter()
+        until = started + duration
+        await asyncio.gather(*(worker(i, until, True) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 1) if ordered else 0.0
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "4")))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requestsPerSecond": round(len(latencies) / elapsed, 1),
+        "meanMs": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+        "p50Ms": percentile(0.50),
+        "p95Ms": percentile(0.95),
+        "p99Ms": percentile(0.99),
+        "statuses": statuses
+    }
+
+
+def print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    columns = ("requests", "errors", "requestsPerSecond", "meanMs", "p50Ms", "p95Ms", "p99Ms")
+    width = max(len(name) for name in results) + 2
+    print("target".ljust(width) + "".join(column.rjust(19) for column in columns))
+    for name, result in results.items():
+        print(name.ljust(width) + "".join(str(result[column]).rjust(19) for column in columns))
+
+    if len(results) > 1:
+        names = list(results)
+        baseline = results[names[0]]["requestsPerSecond"] or 1
+        for name in names[1:]:
+            ratio = results[name]["requestsPerSecond"] / baseline
+            print(f"{name}: {ratio:.2f}x the throughput of {names[0]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", action="append", required=True, help="NAME=BASE_URL (repeatable; the first is the baseline)")
+    parser.add_argument("--path", action="append", help="Request path (repeatable, requests cycle through them; default /health)")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", help="JSON request body (for POST endpoints)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests kept in flight")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per target")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before each run")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    targets = dict(target.split("=", 1) for target in args.target)
+    paths = args.path or ["/health"]
+    body = json.loads(args.body) if args.body else None
+
+    results = {}
+    for name, base_url in targets.items():
+        print(f"Benchmarking {name} ({base_url}): {args.concurrency} concurrent, {args.duration:g} s")
+        results[name] = asyncio.run(run_target(
+            base_url, paths, args.method, body, args.concurrency, args.duration, args.warmup
+        ))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Read-through cache for build records
+
+Frontends poll GET /api/builds/{build_id} while a build runs. Records are
+served from an in-process TTL/LRU cache and only fetched from Weaviate on a
+miss. Writers refresh the cached entry as they go, so polls in the same
+process see every status change without a Weaviate round trip. Finished
+builds (completed/failed) rarely change and are kept longer than running
+ones.
+
+With BUILD_CACHE_REDIS_URL set (needs the optional "redis" package) the
+cache is shared through Redis so several workers see the same entries;
+writers that only know a few fields (the n8n helper) invalidate the shared
+entry instead of patching it.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("completed", "failed")
+
+
+class BuildCache:
+    """In-process TTL/LRU cache of build records keyed by buildId"""
+
+    name = "memory"
+
+    def __init__(self, ttl_seconds: float = 10.0, final_ttl_seconds: float = 300.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.final_ttl_seconds = final_ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._invalidations = 0
+
+    def get(self, build_id: str, load: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Cached record, or load() on a miss (None results are not cached)"""
+        record = self._get(build_id)
+        if record is not None:
+            self._hits += 1
+            return record
+        self._misses += 1
+        record = load()
+        if record is not None:
+            self.put(build_id, record)
+        return record
+
+    def lookup(self, build_id: str) -> Optional[Dict[str, Any]]:
+        """Cached record or None, counted as a hit or miss (for async callers that load themselves)"""
+        record = self._get(build_id)
+        if record is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return record
+
+    def put(self, build_id: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[build_id] = (time.monotonic() + self._ttl(record), dict(record))
+            self._entries.move_to_end(build_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def merge(self, build_id: str, properties: Dict[str, Any], create: bool = False) -> None:
+        """Apply a write: patch a cached entry (or start one for a new build)"""
+        record = self._get(build_id)
+        if record is None and not create:
+            return
+        record = dict(record or {}, **properties)
+        self._refreshes += 1
+        self.put(build_id, record)
+
+    def invalidate(self, build_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(build_id, None) is not None:
+                self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "backend": self.name,
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hitRatio": round(self._hits / lookups, 3) if lookups else 0,
+            "refreshes": self._refreshes,
+            "invalidations": self._invalidations
+        }
+
+    def _ttl(self, record: Dict[str, Any]) -> float:
+        return self.final_ttl_seconds if record.get("status") in FINAL_STATUSES else self.ttl_seconds
+
+    def _get(self, build_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(build_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[build_id]
+                return None
+            self._entries.move_to_end(build_id)
+            return dict(entry[1])
+
+
+class RedisBuildCache(BuildCache):
+    """Build records shared through Redis; Redis errors degrade to cache misses"""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "wiggle:build:", **ttls: Any):
+        super().__init__(**ttls)
+        import redis
+
+        self.prefix = prefix
+        # Short timeouts: a slow cache must never be slower than Weaviate
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.5)
+        self._errors = 0
+
+    def put(self, build_id: str, record: Dict[str, Any]) -> None:
+        try:
+            self._redis.set(
+                self.prefix + build_id,
+                json.dumps(record, default=str),
+                ex=max(int(self._ttl(record)), 1)
+            )
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Build cache write failed: {str(e)}")
+
+    def invalidate(self, build_id: str) -> None:
+        try:
+            if self._redis.delete(self.prefix + build_id):
+                self._invalidations += 1
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Build cache invalidation failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(super().stats(), errors=self._errors)
+        stats.pop("entries")
+        return stats
+
+    def _get(self, build_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = self._redis.get(self.prefix + build_id)
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Build cache read failed: {str(e)}")
+            return None
+        return json.loads(raw) if raw else None
+
+
+def build_cache_from_env() -> BuildCache:
+    """In-process cache, or Redis when BUILD_CACHE_REDIS_URL is set"""
+    ttls = {
+        "ttl_seconds": float(os.getenv("BUILD_CACHE_TTL", "10")),
+        "final_ttl_seconds": float(os.getenv("BUILD_CACHE_FINAL_TTL", "300")),
+        "max_entries": int(os.getenv("BUILD_CACHE_SIZE", "10000"))
+    }
+    redis_url = os.getenv("BUILD_CACHE_REDIS_URL")
+    if redis_url:
+        return RedisBuildCache(redis_url, **ttls)
+    return BuildCache(**ttls)
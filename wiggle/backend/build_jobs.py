@@ -0,0 +1,443 @@
+"""
+Background build jobs with stage-by-stage progress
+
+The orchestration APIs accept a build, answer 202 with its build ID and run
+the texture + model pipeline on a pool of background workers. Each stage
+transition is recorded on the job and pushed to subscribers, which the APIs
+stream to clients as Server-Sent Events.
+
+Builds carry a content key (hash of the uploads and options). A request
+whose key matches a build that is still running, or one that completed
+within the reuse window, is attached to that build instead of starting
+new texture and Blender work (single-flight). Builds may also carry a
+perceptual fingerprint of their uploads (see perceptual_hash.py); with a
+near-duplicate index configured, a request whose images are close enough to
+those of a build with the same scope is attached to that build as well.
+
+With several replicas behind one URL, a status poll may reach a replica
+that is not running the build. Given a shared status store, the manager
+mirrors every job snapshot into it, and replicas answer polls and event
+streams for builds they do not hold from that store.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Protocol, Tuple
+
+from perceptual_hash import NearDuplicateIndex
+
+logger = logging.getLogger(__name__)
+
+# Progress stages in pipeline order; "failed" can follow any stage
+BUILD_STAGES = ("queued", "uploaded", "texture_generated", "model_generated", "completed", "failed")
+TERMINAL_STAGES = ("completed", "failed")
+
+# Seconds between SSE keep-alive comments so proxies do not drop idle streams
+SSE_KEEPALIVE_SECONDS = 15.0
+
+
+class JobStatusStore(Protocol):
+    """Shared key-value store for job snapshots (e.g. a modal.Dict adapter)"""
+
+    async def put(self, build_id: str, snapshot: Dict[str, Any]) -> None: ...
+
+    async def get(self, build_id: str) -> Optional[Dict[str, Any]]: ...
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue has no room for another build"""
+
+
+class BuildFailed(Exception):
+    """Raised to callers waiting on a build that failed"""
+
+
+def build_key(*parts: Any) -> str:
+    """Content hash of a build's inputs (bytes, strings, numbers, lists)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = json.dumps(part, sort_keys=True).encode()
+        # Length prefix so ("ab", "c") and ("a", "bc") hash differently
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class BuildJob:
+    """One build moving through the pipeline, with its progress history"""
+
+    def __init__(
+        self,
+        build_id: str,
+        user_id: str,
+        inputs: Optional[Dict[str, Any]] = None,
+        key: Optional[str] = None,
+        fingerprint: Optional[Tuple[int, ...]] = None,
+        scope: str = "",
+        reuse_similar: bool = True,
+        account_id: Optional[str] = None
+    ):
+        self.build_id = build_id
+        self.user_id = user_id
+        # Tenant key of the build record when builds are stored per account
+        self.account_id = account_id
+        self.inputs = inputs or {}
+        self.key = key
+        # Perceptual hashes of the uploads and the options they must share with a match
+        self.fingerprint = fingerprint
+        self.scope = scope
+        self.reuse_similar = reuse_similar
+        # Set when this request was attached to a near-duplicate build
+        self.near_duplicate: Optional[Dict[str, Any]] = None
+        self.stage = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self._subscribers: List[asyncio.Queue] = []
+        # Called after every stage transition once the job is tracked
+        self._listener: Optional[Callable[["BuildJob"], None]] = None
+        self._finished = asyncio.Event()
+        self.report("queued")
+
+    @property
+    def done(self) -> bool:
+        return self.stage in TERMINAL_STAGES
+
+    def report(self, stage: str, **data: Any) -> None:
+        """Record a stage transition and notify subscribers"""
+        if stage not in BUILD_STAGES:
+            raise ValueError(f"Unknown build stage: {stage}")
+        self.stage = stage
+        event = {
+            "buildId": self.build_id,
+            "stage": stage,
+            "timestamp": datetime.now().isoformat(),
+            **data
+        }
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+        if self._listener is not None:
+            self._listener(self)
+
+    def complete(self, result: Dict[str, Any]) -> None:
+        self.result = result
+        self.finished_at = time.time()
+        # Reuse only needs the result; drop the upload bytes
+        self.inputs = {}
+        self.report("completed", result=result)
+        self._finished.set()
+
+    def fail(self, error: str) -> None:
+        self.error = error
+        self.finished_at = time.time()
+        self.inputs = {}
+        self.report("failed", error=error)
+        self._finished.set()
+
+    async def wait(self) -> Dict[str, Any]:
+        """Wait for the build to finish; raises BuildFailed if it failed"""
+        await self._finished.wait()
+        if self.error is not None:
+            raise BuildFailed(self.error)
+        return self.result
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield past events, then live ones until the job finishes"""
+        queue: asyncio.Queue = asyncio.Queue()
+        backlog = list(self.events)
+        self._subscribers.append(queue)
+        try:
+            for event in backlog:
+                yield event
+            if self.done:
+                return
+            while True:
+                event = await queue.get()
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view of the job"""
+        return {
+            "buildId": self.build_id,
+            "userId": self.user_id,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "events": self.events
+        }
+
+
+class BuildJobManager:
+    """Bounded job queue drained by a fixed pool of asyncio workers"""
+
+    def __init__(
+        self,
+        runner: Callable[[BuildJob], Awaitable[Dict[str, Any]]],
+        workers: int = 2,
+        max_queued: int = 100,
+        retention_seconds: float = 3600.0,
+        reuse_seconds: float = 0.0,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        max_tracked: int = 1000,
+        shared_status: Optional[JobStatusStore] = None,
+        shared_poll_seconds: float = 1.0
+    ):
+        self.runner = runner
+        self.shared_status = shared_status
+        self.shared_poll_seconds = shared_poll_seconds
+        self.near_duplicates = near_duplicates
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self.max_tracked = max_tracked
+        self.reuse_seconds = min(reuse_seconds, retention_seconds)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self.jobs: Dict[str, BuildJob] = {}
+        self._by_key: Dict[str, BuildJob] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._busy = 0
+        self._coalesced = 0
+        self._reused = 0
+        self._near_reused = 0
+        # Jobs whose latest snapshot still has to be written to shared_status
+        self._unpublished: Dict[str, BuildJob] = {}
+        self._publish_wakeup = asyncio.Event()
+        self._publisher: Optional[asyncio.Task] = None
+        self._published = 0
+        self._publish_errors = 0
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        if self.shared_status is not None:
+            self._publisher = asyncio.create_task(self._publish_loop())
+        logger.info(f"Started {self.workers} build workers")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Builds still waiting in the queue will not run on this replica
+        while not self.queue.empty():
+            self.queue.get_nowait().fail("Build was interrupted by shutdown")
+            self.queue.task_done()
+        if self._publisher is not None:
+            self._publisher.cancel()
+            await asyncio.gather(self._publisher, return_exceptions=True)
+            self._publisher = None
+            await self._publish_pending()
+
+    def submit(self, job: BuildJob) -> BuildJob:
+        """Queue a job, or return the matching in-flight/reusable build
+
+        Raises JobQueueFull when the queue is at capacity.
+        """
+        self._prune()
+        existing = self.find(job.key) or self.find_similar(job)
+        if existing is not None:
+            return existing
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Build queue is full ({self.queue.maxsize} waiting)")
+        self._track(job)
+        return job
+
+    async def run(self, job: BuildJob) -> Dict[str, Any]:
+        """Run a job in the caller's task, or wait on the matching build"""
+        self._prune()
+        existing = self.find(job.key) or self.find_similar(job)
+        if existing is not None:
+            return await existing.wait()
+        self._track(job)
+        await self._execute(job)
+        return await job.wait()
+
+    def find(self, key: Optional[str]) -> Optional[BuildJob]:
+        """Build with this key that is running or completed within the reuse window"""
+        job = self._by_key.get(key) if key else None
+        if job is None or job.stage == "failed":
+            return None
+        if not job.done:
+            self._coalesced += 1
+            logger.info(f"Attaching duplicate request to in-flight build {job.build_id}")
+            return job
+        if job.finished_at >= time.time() - self.reuse_seconds:
+            self._reused += 1
+            logger.info(f"Reusing completed build {job.build_id}")
+            return job
+        return None
+
+    def find_similar(self, job: BuildJob) -> Optional[BuildJob]:
+        """Running or reusable build whose uploads are near-duplicates of this job's"""
+        if self.near_duplicates is None or job.fingerprint is None or not job.reuse_similar:
+            return None
+        match = self.near_duplicates.find(job.scope, job.fingerprint)
+        existing = self.jobs.get(match[0]) if match else None
+        if existing is None or existing.stage == "failed":
+            return None
+        if existing.done and existing.finished_at < time.time() - self.reuse_seconds:
+            return None
+        self._near_reused += 1
+        job.near_duplicate = {"buildId": existing.build_id, "distance": match[1]}
+        logger.info(f"Reusing build {existing.build_id} for near-duplicate uploads (distance {match[1]})")
+        return existing
+
+    def get(self, build_id: str) -> Optional[BuildJob]:
+        return self.jobs.get(build_id)
+
+    async def snapshot(self, build_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a build tracked here, else the one another replica shared"""
+        job = self.jobs.get(build_id)
+        if job is not None:
+            return job.snapshot()
+        if self.shared_status is None:
+            return None
+        return await self.shared_status.get(build_id)
+
+    async def shared_events(self, build_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Progress of a build held by another replica, polled from the shared store"""
+        seen = 0
+        while True:
+            snapshot = await self.shared_status.get(build_id)
+            if snapshot is None:
+                return
+            for event in snapshot["events"][seen:]:
+                yield event
+            seen = len(snapshot["events"])
+            if snapshot["stage"] in TERMINAL_STAGES:
+                return
+            await asyncio.sleep(self.shared_poll_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "busy": self._busy,
+            "queued": self.queue.qsize(),
+            "tracked": len(self.jobs),
+            "maxTracked": self.max_tracked,
+            "coalesced": self._coalesced,
+            "reused": self._reused,
+            "reuseSeconds": self.reuse_seconds,
+            "nearDuplicateReused": self._near_reused,
+            "nearDuplicates": self.near_duplicates.stats() if self.near_duplicates else None,
+            "sharedStatus": {
+                "published": self._published,
+                "errors": self._publish_errors,
+                "pending": len(self._unpublished)
+            } if self.shared_status is not None else None
+        }
+
+    def _track(self, job: BuildJob) -> None:
+        self.jobs[job.build_id] = job
+        if job.key:
+            self._by_key[job.key] = job
+        if self.near_duplicates is not None and job.fingerprint is not None:
+            self.near_duplicates.add(job.scope, job.fingerprint, job.build_id)
+        if self.shared_status is not None:
+            job._listener = self._mark_unpublished
+            self._mark_unpublished(job)
+
+    def _mark_unpublished(self, job: BuildJob) -> None:
+        self._unpublished[job.build_id] = job
+        self._publish_wakeup.set()
+
+    async def _publish_loop(self) -> None:
+        """Write the latest snapshot of changed jobs to the shared store, coalescing bursts"""
+        while True:
+            await self._publish_wakeup.wait()
+            self._publish_wakeup.clear()
+            await self._publish_pending()
+
+    async def _publish_pending(self) -> None:
+        while self._unpublished:
+            build_id = next(iter(self._unpublished))
+            job = self._unpublished.pop(build_id)
+            try:
+                await self.shared_status.put(build_id, job.snapshot())
+                self._published += 1
+            except Exception as e:
+                self._publish_errors += 1
+                logger.warning(f"Could not share status of build {build_id}: {e}")
+
+    async def _execute(self, job: BuildJob) -> None:
+        """Run the pipeline for a job and record the outcome on it"""
+        try:
+            result = await self.runner(job)
+            job.complete(result)
+        except asyncio.CancelledError:
+            # Release anyone attached to this build before propagating
+            job.fail("Build was cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Build {job.build_id} failed: {str(e)}")
+            job.fail(str(e))
+        if job.stage == "failed" and self.near_duplicates is not None:
+            # Failed builds must not shadow older, successful near-duplicates
+            self.near_duplicates.remove(job.build_id)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self.queue.get()
+            self._busy += 1
+            try:
+                await self._execute(job)
+            finally:
+                self._busy -= 1
+                self.queue.task_done()
+
+    def _prune(self) -> None:
+        """Forget finished jobs older than the retention window, then the oldest beyond max_tracked"""
+        cutoff = time.time() - self.retention_seconds
+        finished = [build_id for build_id, job in self.jobs.items() if job.finished_at is not None]
+        expired = [build_id for build_id in finished if self.jobs[build_id].finished_at < cutoff]
+        # Jobs are tracked in arrival order, so the first finished ones are the oldest
+        excess = len(self.jobs) - len(expired) - self.max_tracked
+        if excess > 0:
+            expired_ids = set(expired)
+            expired += [build_id for build_id in finished if build_id not in expired_ids][:excess]
+        for build_id in expired:
+            job = self.jobs.pop(build_id)
+            if job.key and self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            if self.near_duplicates is not None:
+                self.near_duplicates.remove(build_id)
+
+
+async def sse_events(job: BuildJob) -> AsyncIterator[str]:
+    """Format a job's progress as a Server-Sent Events stream"""
+    async for chunk in sse_stream(job.subscribe()):
+        yield chunk
+
+
+async def sse_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Format progress events as a Server-Sent Events stream with keep-alives"""
+    next_event = asyncio.ensure_future(events.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_event}, timeout=SSE_KEEPALIVE_SECONDS)
+            if not done:
+                yield ": keep-alive\n\n"
+                continue
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                return
+            yield f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+            next_event = asyncio.ensure_future(events.__anext__())
+    finally:
+        if not next_event.done():
+            next_event.cancel()
+            await asyncio.gather(next_event, return_exceptions=True)
+        await events.aclose()
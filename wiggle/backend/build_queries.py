@@ -0,0 +1,150 @@
+"""
+Cursor pagination and counting for build listings
+
+Offset paging makes Weaviate walk every skipped object, so deep pages get
+slower and slower. Listings page with a keyset instead: objects are sorted
+by a timestamp property (newest first) and the next page starts below the
+last timestamp returned, so every page costs the same. Unfiltered listings
+use Weaviate's native `after=<uuid>` cursor. Either way clients only see an
+opaque `next` token.
+
+Totals are optional: `exact` runs an aggregate count, `estimate` reuses a
+recent count for the same filters.
+
+Single builds are read by their ID derived from buildId; records written
+before IDs were derived that way are found with a buildId filter instead.
+"""
+
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from weaviate.classes.query import Filter, Sort
+from weaviate.util import generate_uuid5
+
+# How long an estimated total may be reused for the same filters
+COUNT_CACHE_TTL = 30.0
+COUNT_CACHE_SIZE = 1000
+
+_count_cache: Dict[str, Tuple[float, int]] = {}
+_count_lock = threading.Lock()
+
+
+def legacy_build_uuid(collection, build_id: str) -> Optional[str]:
+    """ID of a record stored under a random UUID (written before IDs were derived from buildId)"""
+    response = collection.query.fetch_objects(
+        filters=Filter.by_property("buildId").equal(build_id), limit=1, return_properties=[]
+    )
+    return str(response.objects[0].uuid) if response.objects else None
+
+
+def fetch_build_object(collection, build_id: str, include_vector: bool = False):
+    """Build object by generate_uuid5(buildId), falling back to a buildId filter for older records"""
+    obj = collection.query.fetch_object_by_id(generate_uuid5(build_id), include_vector=include_vector)
+    if obj is None:
+        response = collection.query.fetch_objects(
+            filters=Filter.by_property("buildId").equal(build_id), limit=1, include_vector=include_vector
+        )
+        obj = response.objects[0] if response.objects else None
+    return obj
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """Inverse of encode_cursor; raises ValueError for tokens we did not issue"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(state, dict) or not ({"a", "v"} & state.keys()):
+        raise ValueError("Invalid pagination cursor")
+    return state
+
+
+def _dump_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, datetime):
+        return {"d": value.isoformat()}
+    return {"s": value}
+
+
+def _load_value(dumped: Dict[str, Any]) -> Any:
+    return datetime.fromisoformat(dumped["d"]) if "d" in dumped else dumped["s"]
+
+
+def fetch_page(
+    collection,
+    filters,
+    limit: int,
+    cursor: Optional[str] = None,
+    sort_property: str = "timestamp",
+    offset: int = 0
+) -> Tuple[List[Any], Optional[str]]:
+    """One page of objects and the token for the next page (None at the end)
+
+    offset is only honoured for the first page (no cursor), for old clients.
+    """
+    state = decode_cursor(cursor) if cursor else {}
+
+    if filters is None and "v" not in state:
+        # Native cursor: ordered by UUID, constant cost without filters
+        after = state.get("a")
+        response = collection.query.fetch_objects(
+            limit=limit,
+            after=after,
+            offset=None if after else (offset or None)
+        )
+        objects = list(response.objects)
+        next_token = encode_cursor({"a": str(objects[-1].uuid)}) if len(objects) == limit else None
+        return objects, next_token
+
+    # Keyset: newest first, resuming at the last timestamp; objects already
+    # returned with exactly that timestamp are skipped by UUID
+    seen = set(state.get("ids", []))
+    if "v" in state:
+        boundary = Filter.by_property(sort_property).less_or_equal(_load_value(state["v"]))
+        filters = boundary if filters is None else filters & boundary
+    response = collection.query.fetch_objects(
+        filters=filters,
+        sort=Sort.by_property(sort_property, ascending=False),
+        limit=limit + len(seen) + 1,
+        offset=None if state else (offset or None)
+    )
+    candidates = [obj for obj in response.objects if str(obj.uuid) not in seen]
+    objects = candidates[:limit]
+    if len(candidates) <= limit or not objects:
+        return objects, None
+
+    last = objects[-1].properties.get(sort_property)
+    ids = [str(obj.uuid) for obj in objects if obj.properties.get(sort_property) == last]
+    if "v" in state and _load_value(state["v"]) == last:
+        ids = list(seen) + ids
+    return objects, encode_cursor({"v": _dump_value(last), "ids": ids})
+
+
+def count_objects(collection, filters, mode: Optional[str], key: str = "") -> Optional[int]:
+    """Total matching objects: "exact" (aggregate), "estimate" (cached) or None
+
+    key identifies the filters for the estimate cache (e.g. the query parameters).
+    """
+    if mode not in ("exact", "estimate"):
+        return None
+    key = f"{collection.name}:{key}"
+    if mode == "estimate":
+        with _count_lock:
+            cached = _count_cache.get(key)
+        if cached and time.monotonic() - cached[0] < COUNT_CACHE_TTL:
+            return cached[1]
+
+    total = collection.aggregate.over_all(filters=filters, total_count=True).total_count or 0
+    with _count_lock:
+        _count_cache[key] = (time.monotonic(), total)
+        if len(_count_cache) > COUNT_CACHE_SIZE:
+            del _count_cache[next(iter(_count_cache))]
+    return total
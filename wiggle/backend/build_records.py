@@ -0,0 +1,304 @@
+"""
+Write-behind persistence for build status records
+
+Status transitions (processing -> texture_generated -> completed/failed)
+are queued in memory and written to Weaviate by a background flusher in
+batches through the v4 batch API, so a build never waits for a Weaviate
+round trip. Writes to the same build that are still queued are coalesced
+into one object, failed batches are retried with backoff, and the queue is
+bounded: when it is full, writes for new builds are dropped (and counted)
+rather than stalling generation.
+
+Objects are stored under generate_uuid5(buildId), so no write looks the
+record up first. Only the initial create goes through the batch API, which
+replaces whole objects; every later write is a partial update of the
+queued fields, so fields written meanwhile by other processes (the n8n
+helper, other workers or containers) are kept. With per-user tenants (build_tenants) every record is written to
+its user's tenant, taken from the record's userId/accountId or from the
+builds this writer has already seen.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from weaviate.exceptions import UnexpectedStatusCodeError
+from weaviate.util import generate_uuid5
+
+from build_cache import BuildCache
+from build_queries import legacy_build_uuid
+from build_tenants import BuildTenancy, TenantRequired
+from weaviate_pool import WeaviateClientManager
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    """Unflushed properties of one build plus the callers waiting for them"""
+
+    __slots__ = ("properties", "vector", "tenant", "create", "attempts", "waiters")
+
+    def __init__(self):
+        self.properties: Dict[str, Any] = {}
+        self.vector: Optional[List[float]] = None
+        self.tenant: Optional[str] = None
+        self.create = False
+        self.attempts = 0
+        self.waiters: List[asyncio.Future] = []
+
+
+class BuildRecordWriter:
+    """Bounded write-behind queue flushing build records to Weaviate in batches"""
+
+    def __init__(
+        self,
+        db: WeaviateClientManager,
+        collection: str = "TshirtBuild",
+        max_pending: int = 1000,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_retries: int = 5,
+        cache: Optional[BuildCache] = None,
+        tenancy: Optional[BuildTenancy] = None
+    ):
+        self.db = db
+        self.cache = cache
+        self.tenancy = tenancy if tenancy is not None else BuildTenancy(collection=collection)
+        self.collection = collection
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._pending: "OrderedDict[str, _Pending]" = OrderedDict()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._writes = 0
+        self._coalesced = 0
+        self._flushed = 0
+        self._batches = 0
+        self._retries = 0
+        self._dropped = 0
+        self._failed = 0
+        self._last_flush_ms: Optional[int] = None
+
+    @classmethod
+    def from_env(
+        cls,
+        db: WeaviateClientManager,
+        collection: str = "TshirtBuild",
+        cache: Optional[BuildCache] = None,
+        tenancy: Optional[BuildTenancy] = None
+    ) -> "BuildRecordWriter":
+        return cls(
+            db,
+            collection,
+            max_pending=int(os.getenv("BUILD_RECORD_QUEUE_SIZE", "1000")),
+            batch_size=int(os.getenv("BUILD_RECORD_BATCH_SIZE", "100")),
+            flush_interval=float(os.getenv("BUILD_RECORD_FLUSH_SECONDS", "0.5")),
+            max_retries=int(os.getenv("BUILD_RECORD_RETRIES", "5")),
+            cache=cache,
+            tenancy=tenancy
+        )
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flusher())
+
+    async def close(self) -> None:
+        """Stop the flusher after writing what is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._pending:
+            if not await self._flush_once():
+                break
+        for entry in self._pending.values():
+            self._settle(entry, error=RuntimeError("Build record writer closed"))
+        self._pending.clear()
+
+    def write(
+        self,
+        build_id: str,
+        properties: Dict[str, Any],
+        create: bool = False,
+        vector: Optional[List[float]] = None,
+        tenant: Optional[str] = None
+    ) -> asyncio.Future:
+        """Queue properties (and optionally the object's vector) for a build and return immediately
+
+        The returned future resolves to True once the record is stored, or to
+        False when updating a build that does not exist; it may be ignored.
+        With tenancy on it fails with TenantRequired when the build's tenant
+        is neither passed nor known.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # Pipeline callers do not wait; keep unobserved failures out of the log
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._writes += 1
+        entry = self._pending.get(build_id)
+        if self.tenancy.enabled:
+            tenant = tenant or self._tenant_of(build_id, properties, entry)
+            if tenant is None:
+                future.set_exception(TenantRequired(f"Unknown tenant for build {build_id}; pass its userId"))
+                return future
+            self.tenancy.remember(build_id, tenant)
+        if entry is None:
+            if len(self._pending) >= self.max_pending:
+                self._dropped += 1
+                logger.error(f"Build record queue full, dropping write for {build_id}")
+                future.set_exception(RuntimeError("Build record queue is full"))
+                return future
+            entry = self._pending[build_id] = _Pending()
+        else:
+            self._coalesced += 1
+        entry.properties.update(properties)
+        entry.tenant = tenant or entry.tenant
+        entry.create = entry.create or create
+        if vector is not None:
+            entry.vector = vector
+        entry.waiters.append(future)
+        # Readers see the change right away, before it reaches Weaviate
+        if self.cache is not None:
+            self.cache.merge(build_id, properties, create)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return future
+
+    def unflushed(self, build_id: str) -> Optional[Dict[str, Any]]:
+        """Properties queued for a build but not written yet (read-your-writes)"""
+        entry = self._pending.get(build_id)
+        return dict(entry.properties) if entry else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "maxPending": self.max_pending,
+            "writes": self._writes,
+            "coalesced": self._coalesced,
+            "flushed": self._flushed,
+            "batches": self._batches,
+            "retries": self._retries,
+            "dropped": self._dropped,
+            "failed": self._failed,
+            "lastFlushMs": self._last_flush_ms
+        }
+
+    def _tenant_of(self, build_id: str, properties: Dict[str, Any], entry: Optional[_Pending]) -> Optional[str]:
+        if entry is not None and entry.tenant:
+            return entry.tenant
+        return self.tenancy.tenant_of(properties) or self.tenancy.lookup(build_id)
+
+    async def _flusher(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._pending:
+                if not await self._flush_once():
+                    # Back off before retrying; new writes keep queueing meanwhile
+                    attempts = max((entry.attempts for entry in self._pending.values()), default=0)
+                    await asyncio.sleep(min(self.flush_interval * 2 ** attempts, 30.0))
+                    break
+
+    async def _flush_once(self) -> bool:
+        """Write one batch; returns False when the batch failed and was requeued"""
+        build_ids = list(self._pending)[:self.batch_size]
+        batch = {build_id: self._pending.pop(build_id) for build_id in build_ids}
+        started = time.perf_counter()
+        try:
+            failed, missing = await self.db.run(self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"Build record flush failed ({len(batch)} records): {str(e)}")
+            self._requeue(batch, e)
+            return False
+
+        self._batches += 1
+        self._last_flush_ms = int((time.perf_counter() - started) * 1000)
+        for build_id, entry in batch.items():
+            if build_id in failed:
+                self._requeue({build_id: entry}, RuntimeError(failed[build_id]))
+            elif build_id in missing:
+                self._settle(entry, result=False)
+            else:
+                self._flushed += 1
+                self._settle(entry, result=True)
+        return not failed
+
+    def _write_batch(self, client, batch: Dict[str, _Pending]):
+        """Create new records in batches and patch existing ones in place (worker thread)"""
+        # New records: full objects under IDs derived from buildId, one batch per tenant
+        creates: Dict[Optional[str], List[str]] = {}
+        for build_id, entry in batch.items():
+            if entry.create:
+                creates.setdefault(entry.tenant, []).append(build_id)
+        failed_ids = {}
+        for tenant, build_ids in creates.items():
+            collection = self.tenancy.collection(client, tenant)
+            with collection.batch.fixed_size(batch_size=len(build_ids)) as writer:
+                for build_id in build_ids:
+                    entry = batch[build_id]
+                    writer.add_object(properties=entry.properties, uuid=generate_uuid5(build_id), vector=entry.vector)
+            failed_ids.update({str(error.object_.uuid): error.message for error in collection.batch.failed_objects})
+        failed = {}
+        for build_ids in creates.values():
+            for build_id in build_ids:
+                object_id = str(generate_uuid5(build_id))
+                if object_id in failed_ids:
+                    failed[build_id] = failed_ids[object_id]
+
+        # Later status changes: partial updates, so fields written by others are kept
+        missing = set()
+        for build_id, entry in batch.items():
+            if entry.create:
+                continue
+            collection = self.tenancy.collection(client, entry.tenant)
+            try:
+                collection.data.update(uuid=generate_uuid5(build_id), properties=entry.properties, vector=entry.vector)
+            except UnexpectedStatusCodeError as e:
+                if e.status_code != 404:
+                    # Retried on its own; creates in this batch are already stored
+                    failed[build_id] = str(e)
+                    continue
+                # Records written before IDs were derived from buildId keep their random UUID
+                legacy_uuid = legacy_build_uuid(collection, build_id)
+                if legacy_uuid is None:
+                    missing.add(build_id)
+                else:
+                    collection.data.update(uuid=legacy_uuid, properties=entry.properties, vector=entry.vector)
+        return failed, missing
+
+    def _requeue(self, batch: Dict[str, _Pending], error: Exception) -> None:
+        """Put failed records back, under any writes queued since; give up after max_retries"""
+        for build_id, entry in batch.items():
+            entry.attempts += 1
+            if entry.attempts > self.max_retries:
+                self._failed += 1
+                logger.error(f"Giving up on build record {build_id} after {self.max_retries} retries: {str(error)}")
+                self._settle(entry, error=error)
+                continue
+            self._retries += 1
+            newer = self._pending.pop(build_id, None)
+            if newer is not None:
+                entry.properties.update(newer.properties)
+                entry.vector = newer.vector or entry.vector
+                entry.tenant = newer.tenant or entry.tenant
+                entry.create = entry.create or newer.create
+                entry.waiters.extend(newer.waiters)
+            self._pending[build_id] = entry
+            self._pending.move_to_end(build_id, last=False)
+
+    @staticmethod
+    def _settle(entry: _Pending, result: Optional[bool] = None, error: Optional[Exception] = None) -> None:
+        for future in entry.waiters:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
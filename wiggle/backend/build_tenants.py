@@ -0,0 +1,170 @@
+"""
+Per-user or per-account Weaviate tenants for build records
+
+With BUILD_TENANCY=user (or account) TshirtBuild is a multi-tenant
+collection: each user's (or account's) builds live in their own tenant,
+so history queries only touch that tenant's shard and index instead of
+filtering the whole collection by userId, and tenants of users who stopped
+building can be set INACTIVE or OFFLOADED to free hot index memory
+(weaviate_migrations.py tenants offload). Tenants are created by the first
+batch write and inactive ones are re-activated on access by Weaviate
+(auto tenant creation/activation); offloaded tenants are onloaded on
+request and answered with TenantUnavailable until they are back.
+
+Every read and write needs the tenant, derived from userId (or accountId,
+falling back to userId) by tenant_name. Lookups that only have a buildId
+resolve it through an in-process directory of recently seen builds.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+
+TENANCY_MODES = ("off", "user", "account")
+
+# Weaviate tenant names: 1-64 letters, digits, underscores and hyphens
+_TENANT_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class TenantRequired(ValueError):
+    """Raised when a multi-tenant request does not identify its user or account"""
+
+
+class TenantUnavailable(Exception):
+    """Raised while an offloaded tenant is being restored"""
+
+
+def tenant_name(key: str) -> str:
+    """Tenant for a user or account id; ids that are not valid tenant names are hashed"""
+    if _TENANT_NAME.match(key):
+        return key
+    return "t-" + hashlib.sha256(key.encode()).hexdigest()[:40]
+
+
+class BuildTenancy:
+    """Resolves the tenant of build records and the collection handle to use for it"""
+
+    def __init__(
+        self,
+        mode: str = "off",
+        collection: str = "TshirtBuild",
+        directory_size: int = 100000,
+        status_ttl: float = 60.0
+    ):
+        if mode not in TENANCY_MODES:
+            raise ValueError(f"BUILD_TENANCY must be one of {', '.join(TENANCY_MODES)}, got {mode!r}")
+        self.mode = mode
+        self.collection_name = collection
+        self.directory_size = directory_size
+        self.status_ttl = status_ttl
+        # build_id -> tenant of builds written or read by this process
+        self._directory: "OrderedDict[str, str]" = OrderedDict()
+        # tenant -> (checked at, exists) for tenants known to be readable
+        self._status: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._onloads = 0
+
+    @classmethod
+    def from_env(cls, collection: str = "TshirtBuild") -> "BuildTenancy":
+        return cls(
+            os.getenv("BUILD_TENANCY", "off").lower(),
+            collection,
+            directory_size=int(os.getenv("TENANT_DIRECTORY_SIZE", "100000")),
+            status_ttl=float(os.getenv("TENANT_STATUS_TTL", "60"))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def per_user(self) -> bool:
+        """True when a tenant holds exactly one user's builds, so no userId filter is needed"""
+        return self.mode == "user"
+
+    def tenant(self, user_id: Optional[str] = None, account_id: Optional[str] = None) -> Optional[str]:
+        """Tenant for a request; None when tenancy is off"""
+        if not self.enabled:
+            return None
+        key = (account_id or user_id) if self.mode == "account" else user_id
+        if not key:
+            raise TenantRequired(
+                f"{'account_id or user_id' if self.mode == 'account' else 'user_id'} is required "
+                "when builds are stored per tenant"
+            )
+        return tenant_name(key)
+
+    def tenant_of(self, properties: Dict[str, Any]) -> Optional[str]:
+        """Tenant of a build record from its userId/accountId, or None if they are missing"""
+        if not self.enabled:
+            return None
+        key = (properties.get("accountId") or properties.get("userId")) if self.mode == "account" else properties.get("userId")
+        return tenant_name(key) if key else None
+
+    def remember(self, build_id: str, tenant: Optional[str]) -> None:
+        if not tenant:
+            return
+        with self._lock:
+            self._directory[build_id] = tenant
+            self._directory.move_to_end(build_id)
+            while len(self._directory) > self.directory_size:
+                self._directory.popitem(last=False)
+
+    def lookup(self, build_id: str) -> Optional[str]:
+        """Tenant of a build this process has seen"""
+        with self._lock:
+            return self._directory.get(build_id)
+
+    def collection(self, client, tenant: Optional[str] = None):
+        """Collection handle, scoped to the tenant when tenancy is on"""
+        collection = client.collections.get(self.collection_name)
+        if not self.enabled:
+            return collection
+        if not tenant:
+            raise TenantRequired("A tenant is required when builds are stored per tenant")
+        return collection.with_tenant(tenant)
+
+    def readable(self, client, tenant: Optional[str]):
+        """Tenant-scoped collection for reads, or None when the tenant has no builds yet (worker thread)
+
+        Inactive tenants are activated by Weaviate on access; offloaded ones
+        are onloaded here and raise TenantUnavailable until they are back.
+        """
+        if not self.enabled:
+            return self.collection(client)
+        if not tenant:
+            raise TenantRequired("A tenant is required when builds are stored per tenant")
+        now = time.monotonic()
+        cached = self._status.get(tenant)
+        if cached is None or now - cached[0] >= self.status_ttl:
+            collection = client.collections.get(self.collection_name)
+            found = collection.tenants.get_by_name(tenant)
+            if found is None:
+                # Not cached: the tenant appears with the user's first build
+                return None
+            if found.activity_status in (TenantActivityStatus.OFFLOADED, TenantActivityStatus.ONLOADING):
+                if found.activity_status == TenantActivityStatus.OFFLOADED:
+                    collection.tenants.update(Tenant(name=tenant, activity_status=TenantActivityStatus.ACTIVE))
+                    self._onloads += 1
+                raise TenantUnavailable(f"Builds for tenant {tenant} are being restored from offload storage, retry shortly")
+            self._status[tenant] = (now, True)
+        return self.collection(client, tenant)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "directory": len(self._directory),
+            "knownTenants": len(self._status),
+            "onloads": self._onloads
+        }
+
+
+def build_tenancy_from_env(collection: str = "TshirtBuild") -> BuildTenancy:
+    """Tenancy configured by BUILD_TENANCY=off|user|account (default off)"""
+    return BuildTenancy.from_env(collection)
@@ -3,31 +3,66 @@ Direct API for Cloth Physics Simulation
 Replaces n8n workflow with FastAPI endpoints
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-import httpx
+from fastapi.responses import JSONResponse, StreamingResponse
 import weaviate
 import weaviate.classes as wvc
 from weaviate.classes.query import Filter
+from weaviate.util import generate_uuid5
 import uuid
 import os
 import tempfile
-import shutil
 from datetime import datetime
 from typing import Optional, List
 import asyncio
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
+from artifact_http import artifact_download
+from artifact_store import artifact_store_from_env
+from build_cache import build_cache_from_env
+from build_jobs import BuildJob, BuildJobManager, JobQueueFull, build_key, sse_events
+from build_queries import count_objects, fetch_build_object, fetch_page
+from build_records import BuildRecordWriter
+from build_tenants import TenantUnavailable, build_tenancy_from_env
+from image_embeddings import image_embedder_from_env
+from perceptual_hash import near_duplicate_index_from_env
+from pipeline import Stage, StagedPipeline
+from texture_backends import TextureBackendError, texture_backend_from_env
+from weaviate_pool import WeaviateClientManager
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared clients and run background build workers for the lifetime of the app"""
+    await texture_backend.start()
+    await weaviate_db.start()
+    await build_records.start()
+    if image_embedder:
+        await image_embedder.start()
+    await artifacts.start()
+    await build_pipeline.start()
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    await build_pipeline.stop()
+    await artifacts.close()
+    if image_embedder:
+        await image_embedder.close()
+    await build_records.close()
+    await weaviate_db.close()
+    await texture_backend.close()
+
 app = FastAPI(
     title="Wiggle Cloth Physics API",
     description="Direct API for 3D cloth physics simulation and texture generation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -42,13 +77,39 @@ app.add_middleware(
 # Configuration
 WEAVIATE_GRPC_ENDPOINT = os.getenv("WEAVIATE_GRPC_ENDPOINT", "grpc-aoj6v69aspmruwn6zlgma.c0.europe-west3.gcp.weaviate.cloud")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "N08rcE1Ua0pJTlB1RVh0cF9XeEJjMVRGZE5MdjF1YkpqanZKc1RHaTV3ajc4c3BaOEZiOTA5ZXBlay9nPV92MjAw")
-MODAL_API_URL = "https://ykzou1214--tshirt-texture-modal--asgi-app.modal.run"
+MODAL_API_URL = os.getenv("MODAL_API_URL", "https://ykzou1214--tshirt-texture-modal--asgi-app.modal.run")
 BLENDER_API_URL = "https://ykzou1214--tshirt-blender-service-apply-texture-to-model.modal.run"
 
+# Texture backend (TEXTURE_BACKEND=remote|local); the remote backend keeps a
+# shared keep-alive connection pool to the Modal service (TEXTURE_HTTP_* settings)
+texture_backend = texture_backend_from_env(MODAL_API_URL)
+
+# Background build workers for /api/texture/submit (0 = match pipeline capacity)
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS", "0"))
+BUILD_QUEUE_SIZE = int(os.getenv("BUILD_QUEUE_SIZE", "100"))
+# Identical requests attach to a running build; completed builds are reused
+# for this many seconds (0 disables reuse, in-flight coalescing always applies)
+BUILD_REUSE_SECONDS = float(os.getenv("BUILD_REUSE_SECONDS", "300"))
+# Finished builds kept for status polls and reuse (oldest are dropped first)
+BUILD_TRACKED_JOBS = int(os.getenv("BUILD_TRACKED_JOBS", "1000"))
+# Re-encoded/resized copies of earlier uploads reuse that build too: uploads
+# are perceptually hashed and matched within NEAR_DUPLICATE_MAX_DISTANCE bits
+near_duplicates = near_duplicate_index_from_env()
+
+# Workers per pipeline stage and the bounded queue in front of each stage
+TEXTURE_STAGE_WORKERS = int(os.getenv("TEXTURE_STAGE_WORKERS", "2"))
+MODEL_STAGE_WORKERS = int(os.getenv("MODEL_STAGE_WORKERS", "2"))
+STAGE_QUEUE_SIZE = int(os.getenv("STAGE_QUEUE_SIZE", "4"))
+
 # Global variables for file storage
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Generated files expire after ARTIFACT_TTL_SECONDS (24 h) and storage is kept
+# under ARTIFACT_MAX_MB by a background LRU sweeper. ARTIFACT_BACKEND=s3 stores
+# them in a bucket and answers downloads with presigned URLs.
+artifacts = artifact_store_from_env(str(UPLOAD_DIR), prefix="direct-api")
+
 def get_weaviate_client():
     """Get Weaviate client connection"""
     return weaviate.connect_to_weaviate_cloud(
@@ -56,6 +117,52 @@ def get_weaviate_client():
         auth_credentials=wvc.init.Auth.api_key(WEAVIATE_API_KEY)
     )
 
+# One shared Weaviate connection for all endpoints; calls run on a thread pool
+weaviate_db = WeaviateClientManager.from_env(get_weaviate_client)
+
+# Build lookups polled by the frontend are served from a read-through cache
+# that the record writer keeps current (BUILD_CACHE_* settings)
+build_cache = build_cache_from_env()
+
+# With BUILD_TENANCY=user|account each user's (or account's) builds live in
+# their own Weaviate tenant; reads and writes are routed to it
+tenancy = build_tenancy_from_env()
+
+# Build status writes are queued and flushed to Weaviate in batches, off
+# the request path (BUILD_RECORD_* settings)
+build_records = BuildRecordWriter.from_env(weaviate_db, cache=build_cache, tenancy=tenancy)
+
+# Image vectors for /api/builds/search/similar, computed locally with an ONNX
+# model (EMBEDDING_* settings); None when EMBEDDING_MODEL_PATH is unset
+image_embedder = image_embedder_from_env()
+
+def fetch_build(client, tenant: Optional[str], build_id: str) -> Optional[dict]:
+    """Fetch a build record by buildId (stored under generate_uuid5(buildId))"""
+    collection = tenancy.readable(client, tenant)
+    obj = fetch_build_object(collection, build_id) if collection else None
+    
+    if obj is None:
+        return None
+    
+    build = obj.properties
+    build["id"] = str(obj.uuid)
+    return build
+
+def fetch_builds(client, tenant: Optional[str], where_filter, limit: int, cursor: Optional[str], offset: int, total_mode: Optional[str], count_key: str) -> tuple:
+    """Fetch a page of build records (newest first), the next cursor and the optional total"""
+    collection = tenancy.readable(client, tenant)
+    if collection is None:
+        # No tenant yet: the user has no builds
+        return [], None, 0 if total_mode else None
+    objects, next_cursor = fetch_page(collection, where_filter, limit, cursor, sort_property="createdAt", offset=offset)
+    
+    builds = []
+    for obj in objects:
+        build = obj.properties
+        build["id"] = str(obj.uuid)
+        builds.append(build)
+    return builds, next_cursor, count_objects(collection, where_filter, total_mode, count_key)
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -64,28 +171,23 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
-    try:
-        # Test Weaviate connection
-        client = get_weaviate_client()
-        client.close()
-        weaviate_status = "connected"
-    except Exception as e:
-        weaviate_status = f"error: {str(e)}"
+    # Cached Weaviate status from the shared connection
+    weaviate_status = (await weaviate_db.health())["status"]
     
-    # Test Modal API connection
-    try:
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(f"{MODAL_API_URL}/health", timeout=5.0)
-            modal_status = "connected" if response.status_code == 200 else f"error: {response.status_code}"
-    except Exception as e:
-        modal_status = f"error: {str(e)}"
+    # Test texture backend (Modal API connection for the remote backend)
+    texture_status = await texture_backend.health()
     
     return {
         "status": "healthy",
         "services": {
             "weaviate": weaviate_status,
-            "modal": modal_status
+            "texture": f"{texture_backend.name}: {texture_status}"
         },
+        "jobs": job_manager.stats(),
+        "pipeline": build_pipeline.stats(),
+        "texture": texture_backend.stats(),
+        "weaviatePool": weaviate_db.stats(),
+        "buildRecords": build_records.stats(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -93,15 +195,13 @@ async def health_check():
 async def create_build_record(
     userId: str = Form(...),
     frontImageUrl: str = Form(default=""),
-    backImageUrl: str = Form(default="")
+    backImageUrl: str = Form(default=""),
+    accountId: str = Form(default="")
 ):
     """Create a new build record in Weaviate"""
     try:
         build_id = str(uuid.uuid4())
         
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
         # Create build record
         build_data = {
             "buildId": build_id,
@@ -112,9 +212,10 @@ async def create_build_record(
             "createdAt": datetime.now().isoformat(),
             "updatedAt": datetime.now().isoformat()
         }
+        if accountId:
+            build_data["accountId"] = accountId
         
-        collection.data.insert(build_data)
-        client.close()
+        await build_records.write(build_id, build_data, create=True)
         
         logger.info(f"Created build record: {build_id}")
         return {"buildId": build_id, "status": "created"}
@@ -128,23 +229,15 @@ async def update_build_record(
     buildId: str = Form(...),
     status: str = Form(default=""),
     textureUrl: str = Form(default=""),
-    errorMessage: str = Form(default="")
+    errorMessage: str = Form(default=""),
+    userId: str = Form(default=""),
+    accountId: str = Form(default="")
 ):
-    """Update build record status and details"""
+    """Update build record status and details
+    
+    With tenancy on, userId (or accountId) locates builds not created by this process
+    """
     try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        # Find and update the build record
-        response = collection.query.fetch_objects(
-            filters=Filter.by_property("buildId").equal(buildId),
-            limit=1
-        )
-        
-        if not response.objects:
-            client.close()
-            raise HTTPException(status_code=404, detail="Build record not found")
-        
         # Update the record
         update_data = {
             "status": status,
@@ -155,269 +248,364 @@ async def update_build_record(
             update_data["textureUrl"] = textureUrl
         if errorMessage:
             update_data["errorMessage"] = errorMessage
-            
-        collection.data.update(
-            uuid=response.objects[0].uuid,
-            properties=update_data
-        )
         
-        client.close()
+        tenant = tenancy.tenant(userId, accountId) if (userId or accountId) else None
+        if not await build_records.write(buildId, update_data, tenant=tenant):
+            raise HTTPException(status_code=404, detail="Build record not found")
+        
         logger.info(f"Updated build record: {buildId}")
         return {"buildId": buildId, "status": "updated"}
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error updating build record: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to update build record: {str(e)}")
 
-@app.post("/api/texture/generate")
-async def generate_texture(
-    background_tasks: BackgroundTasks,
-    userId: str = Form(...),
-    front: UploadFile = File(...),
-    back: UploadFile = File(...)
-):
+async def request_texture(front: tuple, back: tuple) -> tuple:
     """
-    Generate complete 3D model with texture from front and back images
-    This endpoint now handles the full pipeline: texture generation + 3D model creation
+    Generate a texture with the configured backend
+    front/back are (filename, bytes, content_type) tuples forwarded as-is
+    Returns (texture bytes, latency in ms)
     """
-    build_id = str(uuid.uuid4())
-    temp_files = []
-    
     try:
-        logger.info(f"Starting complete model generation for user: {userId}, build: {build_id}")
-        
-        # Step 1: Create build record in Weaviate
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        build_data = {
-            "buildId": build_id,
-            "userId": userId,
-            "status": "processing",
-            "frontImageUrl": f"/api/uploads/{build_id}_front_{front.filename}",
-            "backImageUrl": f"/api/uploads/{build_id}_back_{back.filename}",
-            "createdAt": datetime.now().isoformat(),
-            "updatedAt": datetime.now().isoformat()
-        }
-        
-        collection.data.insert(build_data)
-        client.close()
-        
-        # Step 2: Save uploaded files temporarily
-        front_path = UPLOAD_DIR / f"{build_id}_front_{front.filename}"
-        back_path = UPLOAD_DIR / f"{build_id}_back_{back.filename}"
-        temp_files = [front_path, back_path]
-        
-        with open(front_path, "wb") as f:
-            shutil.copyfileobj(front.file, f)
-        with open(back_path, "wb") as f:
-            shutil.copyfileobj(back.file, f)
-        
-        # Step 3: Call Modal API for texture generation
-        logger.info(f"Step 1/2: Generating texture using Modal API for build: {build_id}")
-        
-        texture_data = None
-        try:
-            async with httpx.AsyncClient(timeout=300.0) as http_client:  # Increased timeout for Modal cold start
-                with open(front_path, "rb") as f_front, open(back_path, "rb") as f_back:
-                    files = {
-                        "front": (front.filename, f_front, front.content_type),
-                        "back": (back.filename, f_back, back.content_type)
-                    }
-                    data = {
-                        "style": "preserve"  # Add default style parameter
-                    }
-                    
-                    logger.info(f"Calling Modal API: {MODAL_API_URL}/build-texture")
-                    texture_response = await http_client.post(
-                        f"{MODAL_API_URL}/build-texture",
-                        files=files,
-                        data=data
-                    )
-                    
-                    logger.info(f"Modal API response status: {texture_response.status_code}")
-            
-            if texture_response.status_code != 200:
-                error_msg = f"Texture generation failed with status {texture_response.status_code}: {texture_response.text}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
-                
-        except httpx.TimeoutException as e:
-            error_msg = f"Modal API timeout: {str(e)}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
-        except httpx.RequestError as e:
-            error_msg = f"Modal API request error: {str(e)}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
-        except Exception as e:
-            error_msg = f"Modal API call failed: {str(e)}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
-        
-        texture_data = texture_response.content
-        logger.info(f"Texture generated successfully, size: {len(texture_data)} bytes")
-        
-        # Step 4: Update status to texture_generated
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        response_query = collection.query.fetch_objects(
-            filters=Filter.by_property("buildId").equal(build_id),
-            limit=1
+        return await texture_backend.generate(front, back, style="preserve")
+    except TextureBackendError as e:
+        logger.error(str(e))
+        raise
+    except Exception as e:
+        error_msg = f"Texture backend call failed: {str(e)}"
+        logger.error(error_msg)
+        raise Exception(error_msg)
+
+async def store_build_embedding(build_id: str, images: List[bytes]) -> None:
+    """Embed a build's images and store the vector on its record"""
+    try:
+        vector = await image_embedder.embed_build(images)
+        build_records.write(build_id, {}, vector=vector)
+    except Exception as e:
+        # Builds without a vector are simply not found by similarity search
+        logger.error(f"Embedding failed for build {build_id}: {str(e)}")
+
+async def texture_stage(job: BuildJob, state: dict) -> None:
+    """Pipeline stage 1: create the build record and generate the texture"""
+    build_id = job.build_id
+    userId = job.user_id
+    front_name, front_bytes, front_type = job.inputs["front"]
+    back_name, back_bytes, back_type = job.inputs["back"]
+    
+    logger.info(f"Starting complete model generation for user: {userId}, build: {build_id}")
+    
+    # Step 1: Queue the build record (written to Weaviate in the background)
+    build_data = {
+        "buildId": build_id,
+        "userId": userId,
+        "status": "processing",
+        "frontImageUrl": f"/api/uploads/{build_id}_front_{front_name}",
+        "backImageUrl": f"/api/uploads/{build_id}_back_{back_name}",
+        "createdAt": datetime.now().isoformat(),
+        "updatedAt": datetime.now().isoformat()
+    }
+    if job.account_id:
+        build_data["accountId"] = job.account_id
+    
+    build_records.write(build_id, build_data, create=True)
+    
+    # Step 2: Persist uploads asynchronously while the same in-memory
+    # bytes are forwarded to the texture service (no disk round trip)
+    front_key = f"{build_id}_front_{front_name}"
+    back_key = f"{build_id}_back_{back_name}"
+    state["uploads"] = [front_key, back_key]
+    state["tempFiles"].extend(state["uploads"])
+    job.report("uploaded")
+    
+    # Step 3: Generate texture with the configured backend
+    logger.info(f"Step 1/2: Generating texture using {texture_backend.name} backend for build: {build_id}")
+    
+    texture_result, persisted = await asyncio.gather(
+        request_texture(job.inputs["front"], job.inputs["back"]),
+        asyncio.gather(artifacts.put(front_key, front_bytes), artifacts.put(back_key, back_bytes)),
+        return_exceptions=True
+    )
+    for outcome in (texture_result, persisted):
+        if isinstance(outcome, BaseException):
+            raise outcome
+    texture_data, texture_latency_ms = texture_result
+    state["texture"] = texture_data
+    
+    # Embed front/back/texture while the model stage runs Blender
+    if image_embedder:
+        state["embedding"] = asyncio.create_task(
+            store_build_embedding(build_id, [front_bytes, back_bytes, texture_data])
         )
+    
+    logger.info(f"Texture generated successfully, size: {len(texture_data)} bytes, {texture_latency_ms} ms")
+    
+    # Step 4: Update status to texture_generated, recording which backend ran
+    build_records.write(build_id, {
+        "status": "texture_generated",
+        "textureBackend": texture_backend.name,
+        "textureLatencyMs": texture_latency_ms,
+        "updatedAt": datetime.now().isoformat()
+    })
+    job.report("texture_generated", textureBytes=len(texture_data), textureBackend=texture_backend.name, textureLatencyMs=texture_latency_ms)
+
+def render_with_blender(texture_data: bytes) -> bytes:
+    """Call the Blender Modal function (blocking; run off the event loop)"""
+    # Import the Blender app and function directly
+    from blender_app import app as blender_app, apply_texture_to_model
+    
+    # Call the Modal function with texture data using proper app context
+    with blender_app.run():
+        return apply_texture_to_model.remote(texture_data)
+
+async def model_stage(job: BuildJob, state: dict) -> dict:
+    """Pipeline stage 2: apply the texture to the 3D model in Blender"""
+    build_id = job.build_id
+    texture_data = state.pop("texture")
+    
+    # Step 5: Call Blender Modal function for 3D model generation
+    logger.info(f"Step 2/2: Applying texture to 3D model using Blender Modal function for build: {build_id}")
+    
+    try:
+        logger.info(f"Calling Blender Modal function with texture data ({len(texture_data)} bytes)")
         
-        if response_query.objects:
-            collection.data.update(
-                uuid=response_query.objects[0].uuid,
-                properties={
-                    "status": "texture_generated",
-                    "updatedAt": datetime.now().isoformat()
-                }
-            )
-        client.close()
-        
-        # Step 5: Call Blender Modal function for 3D model generation
-        logger.info(f"Step 2/2: Applying texture to 3D model using Blender Modal function for build: {build_id}")
+        # Blocking Modal call runs in a thread so the texture stage keeps going
+        model_data = await asyncio.to_thread(render_with_blender, texture_data)
         
-        try:
-            # Import the Blender app and function directly
-            from blender_app import app as blender_app, apply_texture_to_model
-            
-            logger.info(f"Calling Blender Modal function with texture data ({len(texture_data)} bytes)")
+        logger.info(f"Blender Modal function completed successfully, received {len(model_data)} bytes")
             
-            # Call the Modal function with texture data using proper app context
-            with blender_app.run():
-                model_data = apply_texture_to_model.remote(texture_data)
-            
-            logger.info(f"Blender Modal function completed successfully, received {len(model_data)} bytes")
-                
-        except Exception as e:
-            error_msg = f"Blender Modal function call failed: {str(e)}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
-        
-        # Step 6: Save generated 3D model
-        model_filename = f"{build_id}_model.glb"
-        model_path = UPLOAD_DIR / model_filename
-        temp_files.append(model_path)
-        
-        with open(model_path, "wb") as f:
-            f.write(model_data)
-        
-        logger.info(f"3D model generated successfully, size: {len(model_data)} bytes")
-        
-        # Step 7: Update build record with final success
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        response_query = collection.query.fetch_objects(
-            filters=Filter.by_property("buildId").equal(build_id),
-            limit=1
-        )
-        
-        if response_query.objects:
-            collection.data.update(
-                uuid=response_query.objects[0].uuid,
-                properties={
-                    "status": "completed",
-                    "modelUrl": f"/api/model/download/{model_filename}",
-                    "updatedAt": datetime.now().isoformat()
-                }
-            )
-        
-        client.close()
-        
-        # Schedule cleanup of temporary files (keep model file for download)
-        cleanup_files = [front_path, back_path]  # Don't cleanup model file immediately
-        background_tasks.add_task(cleanup_temp_files, cleanup_files)
-        
-        logger.info(f"Complete model generation finished for build: {build_id}")
-        
-        return {
-            "buildId": build_id,
-            "status": "completed",
-            "modelUrl": f"/api/model/download/{model_filename}",
-            "message": "3D model with texture generated successfully"
-        }
+    except Exception as e:
+        error_msg = f"Blender Modal function call failed: {str(e)}"
+        logger.error(error_msg)
+        raise Exception(error_msg)
+    
+    # Step 6: Save generated 3D model
+    model_filename = f"{build_id}_model.glb"
+    state["tempFiles"].append(model_filename)
+    
+    await artifacts.put(model_filename, model_data)
+    
+    logger.info(f"3D model generated successfully, size: {len(model_data)} bytes")
+    job.report("model_generated", modelBytes=len(model_data))
+    
+    if "embedding" in state:
+        await state.pop("embedding")
+    
+    # Step 7: Update build record with final success
+    build_records.write(build_id, {
+        "status": "completed",
+        "modelUrl": f"/api/model/download/{model_filename}",
+        "updatedAt": datetime.now().isoformat()
+    })
+    
+    # Clean up temporary upload files (keep model file for download)
+    await cleanup_temp_files(state["uploads"])
+    
+    logger.info(f"Complete model generation finished for build: {build_id}")
+    
+    return {
+        "buildId": build_id,
+        "status": "completed",
+        "modelUrl": f"/api/model/download/{model_filename}",
+        "message": "3D model with texture generated successfully"
+    }
+
+# Texture and Blender stages have their own workers and bounded queues, so
+# one build can be in Blender while the next is generating its texture
+build_pipeline = StagedPipeline([
+    Stage("texture", texture_stage, workers=TEXTURE_STAGE_WORKERS, queue_size=STAGE_QUEUE_SIZE),
+    Stage("model", model_stage, workers=MODEL_STAGE_WORKERS, queue_size=STAGE_QUEUE_SIZE)
+])
+
+async def run_build_pipeline(job: BuildJob) -> dict:
+    """
+    Generate complete 3D model with texture for one build
+    Runs the build through the texture and model stages, reporting each stage on the job
+    """
+    build_id = job.build_id
+    state = {"tempFiles": []}
+    
+    try:
+        return await build_pipeline.run(job, state)
         
     except Exception as e:
         logger.error(f"Error in model generation: {str(e)}")
         
         # Update build record with error status
         if build_id:
-            try:
-                client = get_weaviate_client()
-                collection = client.collections.get("TshirtBuild")
-                
-                response_query = collection.query.fetch_objects(
-                    filters=Filter.by_property("buildId").equal(build_id),
-                    limit=1
-                )
-                
-                if response_query.objects:
-                    collection.data.update(
-                        uuid=response_query.objects[0].uuid,
-                        properties={
-                            "status": "failed",
-                            "errorMessage": str(e),
-                            "updatedAt": datetime.now().isoformat()
-                        }
-                    )
-                
-                client.close()
-            except Exception as update_error:
-                logger.error(f"Failed to update error status: {str(update_error)}")
+            build_records.write(build_id, {
+                "status": "failed",
+                "errorMessage": str(e),
+                "updatedAt": datetime.now().isoformat()
+            })
         
-        # Schedule cleanup of temporary files
-        if temp_files:
-            background_tasks.add_task(cleanup_temp_files, temp_files)
+        if "embedding" in state:
+            state.pop("embedding").cancel()
         
+        # Clean up temporary files
+        if state["tempFiles"]:
+            await cleanup_temp_files(state["tempFiles"])
+        
+        raise
+
+# Admits builds into the pipeline; enough workers to keep every stage busy
+job_manager = BuildJobManager(
+    run_build_pipeline,
+    workers=BUILD_WORKERS or build_pipeline.capacity,
+    max_queued=BUILD_QUEUE_SIZE,
+    reuse_seconds=BUILD_REUSE_SECONDS,
+    near_duplicates=near_duplicates,
+    max_tracked=BUILD_TRACKED_JOBS
+)
+
+async def read_build_inputs(front: UploadFile, back: UploadFile) -> dict:
+    """Read uploads into memory so the pipeline can outlive the request"""
+    return {
+        "front": (front.filename, await front.read(), front.content_type),
+        "back": (back.filename, await back.read(), back.content_type)
+    }
+
+async def new_build_job(userId: str, inputs: dict, reuse_similar: bool = True, account_id: str = "") -> BuildJob:
+    """Create a job keyed by user, account, image content and options for de-duplication"""
+    # The account is part of the key: its builds are written to the account's tenant
+    key = build_key(userId, account_id, inputs["front"][1], inputs["back"][1], "preserve")
+    fingerprint = None
+    if near_duplicates:
+        fingerprint = await asyncio.to_thread(near_duplicates.fingerprint, [inputs["front"][1], inputs["back"][1]])
+    return BuildJob(
+        str(uuid.uuid4()), userId, inputs, key=key,
+        fingerprint=fingerprint, scope=build_key(userId, account_id, "preserve"), reuse_similar=reuse_similar,
+        account_id=account_id or None
+    )
+
+@app.post("/api/texture/generate")
+async def generate_texture(
+    userId: str = Form(...),
+    front: UploadFile = File(...),
+    back: UploadFile = File(...),
+    reuseSimilar: bool = Form(default=True),
+    accountId: str = Form(default="")
+):
+    """
+    Generate complete 3D model with texture from front and back images
+    This endpoint now handles the full pipeline: texture generation + 3D model creation
+    and holds the request open until it finishes; see /api/texture/submit for the async variant
+    With reuseSimilar (default), near-duplicates of a recent build's uploads reuse that build
+    """
+    job = await new_build_job(userId, await read_build_inputs(front, back), reuseSimilar, accountId)
+    
+    try:
+        result = await job_manager.run(job)
+    except Exception as e:
         raise HTTPException(status_code=500, detail=f"Model generation failed: {str(e)}")
+    
+    # Duplicate of a running or recent build: same result, no new work
+    if result["buildId"] != job.build_id:
+        result = dict(result, deduplicated=True, nearDuplicate=job.near_duplicate)
+    return result
 
-@app.get("/api/texture/download/{filename}")
-async def download_texture(filename: str):
-    """Download generated texture file"""
-    file_path = UPLOAD_DIR / filename
+@app.post("/api/texture/submit", status_code=202)
+async def submit_texture_build(
+    userId: str = Form(...),
+    front: UploadFile = File(...),
+    back: UploadFile = File(...),
+    reuseSimilar: bool = Form(default=True),
+    accountId: str = Form(default="")
+):
+    """
+    Queue a texture + 3D model build and return immediately
+    Progress is available from /api/texture/jobs/{build_id}/events (Server-Sent Events)
+    """
+    requested = await new_build_job(userId, await read_build_inputs(front, back), reuseSimilar, accountId)
     
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Texture file not found")
+    try:
+        job = job_manager.submit(requested)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type="image/png"
+    if job is requested:
+        logger.info(f"Queued build {job.build_id} for user: {userId}")
+    return {
+        "buildId": job.build_id,
+        "status": job.stage,
+        "deduplicated": job is not requested,
+        "nearDuplicate": requested.near_duplicate,
+        "statusUrl": f"/api/texture/jobs/{job.build_id}",
+        "eventsUrl": f"/api/texture/jobs/{job.build_id}/events"
+    }
+
+@app.get("/api/texture/jobs/{build_id}")
+async def get_texture_job(build_id: str):
+    """Get current stage and result of a queued build"""
+    job = job_manager.get(build_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Build job not found")
+    return job.snapshot()
+
+@app.get("/api/texture/jobs/{build_id}/events")
+async def stream_texture_job(build_id: str):
+    """Stream build progress as Server-Sent Events"""
+    job = job_manager.get(build_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Build job not found")
+    
+    return StreamingResponse(
+        sse_events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for connection pools and background workers"""
+    return {
+        "texture": texture_backend.stats(),
+        "weaviate": weaviate_db.stats(),
+        "buildRecords": build_records.stats(),
+        "buildCache": build_cache.stats(),
+        "tenancy": tenancy.stats(),
+        "jobs": job_manager.stats(),
+        "pipeline": build_pipeline.stats(),
+        "artifacts": artifacts.stats(),
+        "embeddings": image_embedder.stats() if image_embedder else None,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/texture/download/{filename}")
+async def download_texture(filename: str, request: Request):
+    """Download generated texture file"""
+    return await artifact_download(request, artifacts, filename, "Texture", "image/png")
+
 @app.get("/api/model/download/{filename}")
-async def download_model(filename: str):
+async def download_model(filename: str, request: Request):
     """Download generated 3D model file"""
-    file_path = UPLOAD_DIR / filename
-    
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Model file not found")
-    
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type="model/gltf-binary"
-    )
+    return await artifact_download(request, artifacts, filename, "Model", "model/gltf-binary")
 
 @app.get("/api/builds")
 async def get_builds(
     user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
     status: Optional[str] = None,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    total: Optional[str] = None,
     offset: int = 0
 ):
-    """Get build records with optional filtering"""
+    """Get build records with optional filtering
+    
+    Pages are keyset-paginated: pass the returned `next` token as `cursor`
+    to continue. total=exact|estimate adds the number of matching builds.
+    With tenancy on, user_id (or account_id) selects the tenant to query.
+    """
     try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
+        tenant = tenancy.tenant(user_id, account_id)
         
-        # Build query filters
+        # Build query filters; a per-user tenant already holds only that user's builds
         filters = []
-        if user_id:
+        if user_id and not tenancy.per_user:
             filters.append(Filter.by_property("userId").equal(user_id))
         if status:
             filters.append(Filter.by_property("status").equal(status))
@@ -430,66 +618,80 @@ async def get_builds(
                 where_filter = where_filter & f
         
         # Execute query
-        response = collection.query.fetch_objects(
-            filters=where_filter,
-            limit=min(limit, 100),
-            offset=offset
+        builds, next_cursor, total_count = await weaviate_db.run(
+            fetch_builds, tenant, where_filter, min(limit, 100), cursor, offset, total, f"{tenant}:{user_id}:{status}"
         )
         
-        builds = []
-        for obj in response.objects:
-            build = obj.properties
-            build["id"] = str(obj.uuid)
-            builds.append(build)
-        
-        client.close()
-        
         return {
             "builds": builds,
-            "total": len(builds),
+            "count": len(builds),
+            "total": total_count,
             "limit": limit,
-            "offset": offset
+            "next": next_cursor
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TenantUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching builds: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch builds: {str(e)}")
 
 @app.get("/api/builds/{build_id}")
-async def get_build(build_id: str):
-    """Get specific build record by ID"""
+async def get_build(build_id: str, user_id: Optional[str] = None, account_id: Optional[str] = None):
+    """Get specific build record by ID
+    
+    With tenancy on, builds from this process are found by ID alone; others need user_id (or account_id)
+    """
     try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        response = collection.query.fetch_objects(
-            filters=Filter.by_property("buildId").equal(build_id),
-            limit=1
-        )
-        
-        if not response.objects:
-            client.close()
+        tenant = None
+        if tenancy.enabled:
+            tenant = tenancy.tenant(user_id, account_id) if (user_id or account_id) else tenancy.lookup(build_id)
+        
+        build = build_cache.lookup(build_id)
+        if build is not None and tenant is not None and tenancy.tenant_of(build) not in (tenant, None):
+            # The cache is keyed by buildId alone; never serve another tenant's build
+            build = None
+        if build is None and (tenant is not None or not tenancy.enabled):
+            build = await weaviate_db.run(fetch_build, tenant, build_id)
+            if build:
+                tenancy.remember(build_id, tenant)
+                build_cache.put(build_id, build)
+        elif build is not None and "id" not in build:
+            # Entry started by the writer before the record was read back
+            build["id"] = generate_uuid5(build_id)
+        
+        # Include status changes that are still queued for Weaviate
+        unflushed = build_records.unflushed(build_id)
+        if unflushed:
+            build = dict(build or {}, **unflushed)
+        
+        if not build:
+            if tenancy.enabled and tenant is None:
+                raise HTTPException(status_code=400, detail="user_id is required to look up builds stored per tenant")
             raise HTTPException(status_code=404, detail="Build not found")
         
-        build = response.objects[0].properties
-        build["id"] = str(response.objects[0].uuid)
-        
-        client.close()
         return build
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TenantUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching build {build_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch build: {str(e)}")
 
-async def cleanup_temp_files(file_paths: List[Path]):
-    """Background task to clean up temporary files"""
-    for file_path in file_paths:
+async def cleanup_temp_files(names: List[str]):
+    """Background task to clean up temporary artifacts"""
+    for name in names:
         try:
-            if file_path.exists():
-                file_path.unlink()
-                logger.info(f"Cleaned up temp file: {file_path}")
+            await artifacts.delete(name)
+            logger.info(f"Cleaned up temp file: {name}")
         except Exception as e:
-            logger.error(f"Failed to cleanup {file_path}: {str(e)}")
+            logger.error(f"Failed to cleanup {name}: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
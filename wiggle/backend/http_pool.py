@@ -0,0 +1,154 @@
+"""
+Shared pooled HTTP clients for calls to upstream services
+
+One httpx.AsyncClient per upstream service, opened for the lifetime of the
+app, so texture and image-fetch calls reuse keep-alive (and HTTP/2 when available)
+connections instead of paying TCP + TLS setup on every request.
+"""
+
+import importlib.util
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class PooledHTTPClient:
+    """Lifespan-managed httpx.AsyncClient with pool utilization counters"""
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 60.0,
+        timeout: float = 300.0,
+        connect_timeout: float = 10.0,
+        http2: bool = True
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        # HTTP/2 needs the optional "h2" package (httpx[http2])
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logger.warning("h2 is not installed, falling back to HTTP/1.1 keep-alive")
+        self._client: Optional[httpx.AsyncClient] = None
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
+        self._errors = 0
+        self._total_ms = 0.0
+
+    @classmethod
+    def from_env(cls, base_url: str, prefix: str = "TEXTURE_HTTP") -> "PooledHTTPClient":
+        """Build a client whose pool limits and timeouts come from <prefix>_* variables"""
+        return cls(
+            base_url,
+            max_connections=_env_int(f"{prefix}_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=_env_int(f"{prefix}_MAX_KEEPALIVE", 10),
+            keepalive_expiry=_env_float(f"{prefix}_KEEPALIVE_EXPIRY", 60.0),
+            timeout=_env_float(f"{prefix}_TIMEOUT", 300.0),
+            connect_timeout=_env_float(f"{prefix}_CONNECT_TIMEOUT", 10.0),
+            http2=os.getenv(f"{prefix}2", "1") == "1"
+        )
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2
+            )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """Send a request over the shared pool, tracking utilization"""
+        if self._client is None:
+            await self.start()
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        started = time.perf_counter()
+        try:
+            return await self._client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self._errors += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._requests += 1
+            self._total_ms += (time.perf_counter() - started) * 1000
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """Stream a response over the shared pool; the body is read by the caller"""
+        if self._client is None:
+            await self.start()
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        started = time.perf_counter()
+        try:
+            async with self._client.stream(method, path, **kwargs) as response:
+                yield response
+        except httpx.HTTPError:
+            self._errors += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._requests += 1
+            self._total_ms += (time.perf_counter() - started) * 1000
+
+    async def get(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool limits, live connection counts and request counters"""
+        open_connections = None
+        idle_connections = None
+        try:
+            # httpcore does not expose pool state publicly; best effort only
+            connections = self._client._transport._pool.connections
+            open_connections = len(connections)
+            idle_connections = sum(1 for c in connections if c.is_idle())
+        except Exception:
+            pass
+
+        return {
+            "baseUrl": self.base_url,
+            "http2": self.http2,
+            "maxConnections": self.limits.max_connections,
+            "maxKeepaliveConnections": self.limits.max_keepalive_connections,
+            "openConnections": open_connections,
+            "idleConnections": idle_connections,
+            "inFlight": self._in_flight,
+            "peakInFlight": self._peak_in_flight,
+            "utilization": round(self._in_flight / self.limits.max_connections, 3) if self.limits.max_connections else None,
+            "requests": self._requests,
+            "errors": self._errors,
+            "avgLatencyMs": round(self._total_ms / self._requests, 2) if self._requests else 0
+        }
@@ -0,0 +1,250 @@
+"""
+Local image embeddings for build similarity search
+
+The TshirtBuild collection has no vectorizer module, so vectors are
+computed here at build time with a CPU ONNX image encoder (for example the
+vision tower of CLIP ViT-B/32 exported to ONNX) and stored on the objects;
+similarity search then runs near_vector against the collection's HNSW
+index.
+
+- Concurrent requests are micro-batched: images queued within
+  EMBEDDING_BATCH_WAIT_MS are run through the model together, up to
+  EMBEDDING_BATCH_SIZE per call, on a worker thread.
+- Embeddings are cached by content hash, so a re-uploaded photo is never
+  encoded twice.
+- A build's vector is the normalized mean of its front, back and texture
+  embeddings.
+
+Needs the optional "onnxruntime", "numpy" and "Pillow" packages and
+EMBEDDING_MODEL_PATH; without them embeddings are disabled and builds are
+stored without vectors.
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-channel normalization used when the model was trained
+NORMALIZATION = {
+    "clip": ((0.48145466, 0.4578275, 0.40821073), (0.26862954, 0.26130258, 0.27577711)),
+    "imagenet": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
+}
+
+HAS_ONNXRUNTIME = importlib.util.find_spec("onnxruntime") is not None
+
+
+class ImageEmbedder:
+    """Batched, cached image embeddings from an ONNX model on CPU"""
+
+    def __init__(
+        self,
+        model_path: str,
+        image_size: int = 224,
+        normalization: str = "clip",
+        batch_size: int = 16,
+        batch_wait_ms: float = 10.0,
+        cache_size: int = 10000,
+        threads: int = 0
+    ):
+        import numpy as np
+        import onnxruntime as ort
+
+        self._np = np
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input = self._session.get_inputs()[0].name
+        self.model_path = model_path
+        self.image_size = image_size
+        mean, std = NORMALIZATION[normalization]
+        self._mean = np.array(mean, dtype=np.float32).reshape(3, 1, 1)
+        self._std = np.array(std, dtype=np.float32).reshape(3, 1, 1)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Sessions are thread-safe, but one inference at a time keeps CPU use predictable
+        self._run_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batches = 0
+        self._images = 0
+        self._hits = 0
+        self._busy_seconds = 0.0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._batcher())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def embed(self, images: Sequence[bytes]) -> List[List[float]]:
+        """Embeddings for encoded images, batched with other concurrent callers"""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        results: List[Optional[List[float]]] = []
+        waiting = []
+        for data in images:
+            key = hashlib.sha256(data).hexdigest()
+            cached = self._cached(key)
+            results.append(cached)
+            if cached is None:
+                future = loop.create_future()
+                await self._queue.put((key, data, future))
+                waiting.append((len(results) - 1, future))
+        for index, future in waiting:
+            results[index] = await future
+        return results
+
+    async def embed_build(self, images: Sequence[bytes]) -> List[float]:
+        """One vector for a build: normalized mean of its image embeddings"""
+        return self.combine(await self.embed(images))
+
+    def combine(self, vectors: Sequence[List[float]]) -> List[float]:
+        np = self._np
+        mean = np.mean(np.array(vectors, dtype=np.float32), axis=0)
+        norm = float(np.linalg.norm(mean))
+        return (mean / norm if norm else mean).tolist()
+
+    def stats(self) -> Dict[str, Any]:
+        encoded = self._images
+        return {
+            "model": os.path.basename(self.model_path),
+            "batches": self._batches,
+            "imagesEncoded": encoded,
+            "avgBatchSize": round(encoded / self._batches, 2) if self._batches else 0,
+            "avgMsPerImage": round(self._busy_seconds * 1000 / encoded, 2) if encoded else 0,
+            "cacheHits": self._hits,
+            "cacheEntries": len(self._cache),
+            "queued": self._queue.qsize() if self._queue else 0
+        }
+
+    async def _batcher(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Identical images queued together are encoded once
+            unique: Dict[str, bytes] = {}
+            for key, data, _ in batch:
+                unique.setdefault(key, data)
+            try:
+                vectors, errors = await asyncio.to_thread(self._infer, unique)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(unique)} images failed: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for key, vector in vectors.items():
+                self._store(key, vector)
+            for key, _, future in batch:
+                if future.done():
+                    continue
+                if key in errors:
+                    future.set_exception(errors[key])
+                else:
+                    future.set_result(vectors[key])
+
+    def _infer(self, images: Dict[str, bytes]) -> Tuple[Dict[str, List[float]], Dict[str, Exception]]:
+        """Vectors by key; an image that cannot be decoded fails alone and the rest still run"""
+        np = self._np
+        keys, pixels, errors = [], [], {}
+        for key, data in images.items():
+            try:
+                pixels.append(self._preprocess(data))
+            except Exception as e:
+                logger.warning(f"Embedding input {key[:12]} could not be decoded: {str(e)}")
+                errors[key] = e
+                continue
+            keys.append(key)
+        if not keys:
+            return {}, errors
+
+        started = time.perf_counter()
+        with self._run_lock:
+            output = self._session.run(None, {self._input: np.stack(pixels)})[0]
+        self._busy_seconds += time.perf_counter() - started
+        self._batches += 1
+        self._images += len(keys)
+        # Pool any spatial/token axes, then L2-normalize for cosine distance
+        output = output.reshape(output.shape[0], output.shape[1], -1).mean(axis=2) if output.ndim > 2 else output
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        vectors = (output / np.maximum(norms, 1e-12)).astype(np.float32).tolist()
+        return dict(zip(keys, vectors)), errors
+
+    def _preprocess(self, data: bytes):
+        """Resize the short side, center-crop and normalize to CHW float32"""
+        from PIL import Image
+
+        np = self._np
+        size = self.image_size
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        scale = size / min(image.size)
+        image = image.resize(
+            (max(size, round(image.width * scale)), max(size, round(image.height * scale))),
+            Image.BICUBIC
+        )
+        left = (image.width - size) // 2
+        top = (image.height - size) // 2
+        image = image.crop((left, top, left + size, top + size))
+        pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        return (pixels - self._mean) / self._std
+
+    def _cached(self, key: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+            return vector
+
+    def _store(self, key: str, vector: List[float]) -> None:
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+def image_embedder_from_env() -> Optional[ImageEmbedder]:
+    """Embedder configured by EMBEDDING_* settings, or None when disabled"""
+    model_path = os.getenv("EMBEDDING_MODEL_PATH")
+    if not model_path:
+        return None
+    if not HAS_ONNXRUNTIME:
+        logger.warning("EMBEDDING_MODEL_PATH is set but onnxruntime is not installed; embeddings disabled")
+        return None
+    return ImageEmbedder(
+        model_path,
+        image_size=int(os.getenv("EMBEDDING_IMAGE_SIZE", "224")),
+        normalization=os.getenv("EMBEDDING_NORMALIZATION", "clip"),
+        batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "16")),
+        batch_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10")),
+        cache_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+        threads=int(os.getenv("EMBEDDING_THREADS", "0"))
+    )
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import modal
+import asyncio
 import os
+import time
 from pathlib import Path
 
 app = modal.App("wiggle-integrated-api")
@@ -13,15 +15,19 @@ image = modal.Image.debian_slim(python_version="3.12").apt_install(
     "fastapi",
     "uvicorn[standard]",
     "python-multipart", 
-    "httpx",
+    "httpx[http2]",
     "weaviate-client",
     "python-dotenv",
     "Pillow",
     "aiofiles",
+    "brotli",
+    "boto3",
     "rembg",
     "numpy",
     "opencv-python-headless"
-])
+]).add_local_file(
+    Path(__file__).parent / "bake_cloth_animation.py", "/root/bake_cloth_animation.py"
+).add_local_python_source("artifact_http", "artifact_store", "build_jobs", "http_pool", "perceptual_hash", "pipeline", "weaviate_pool")
 
 # Environment secrets
 secrets = modal.Secret.from_dict({
@@ -33,33 +39,52 @@ secrets = modal.Secret.from_dict({
 # Storage volume
 volume = modal.Volume.from_name("wiggle-storage", create_if_missing=True)
 blender_volume = modal.Volume.from_name("tshirt-models", create_if_missing=True)
+# Build job snapshots shared by all containers, so status polls and event
+# streams work whichever container they reach
+job_status = modal.Dict.from_name("wiggle-build-jobs", create_if_missing=True)
 
-def apply_texture_with_blender(texture_png_data: bytes) -> bytes:
-    """
-    Apply texture to 3D model using Blender (integrated function)
-    
-    Args:
-        texture_png_data: Binary data of texture PNG
-    
-    Returns: Binary data of model_textured.glb
-    """
-    import tempfile
-    import subprocess
-    
-    # 1. Setup file paths
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Save incoming texture data to temporary file
-        texture_path = f"{tmpdir}/texture.png"
-        with open(texture_path, "wb") as f:
-            f.write(texture_png_data)
-        
-        output_path = f"{tmpdir}/model_textured.glb"
-        
-        # 2. Create improved Blender script
-        blender_script_path = f"{tmpdir}/apply_texture_script.py"
-        
-        # Simple and compatible Blender script
-        blender_script_content = '''
+# Blender concurrency per container; extra builds wait for a free slot
+BLENDER_MAX_CONCURRENCY = int(os.getenv("BLENDER_MAX_CONCURRENCY", "2"))
+BLENDER_TIMEOUT_SECONDS = float(os.getenv("BLENDER_TIMEOUT_SECONDS", "300"))
+# Requests served concurrently by one container (health, downloads, builds)
+API_MAX_CONCURRENT_INPUTS = int(os.getenv("API_MAX_CONCURRENT_INPUTS", "32"))
+
+# Background build workers for /api/texture/submit (0 = match pipeline capacity)
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS", "0"))
+BUILD_QUEUE_SIZE = int(os.getenv("BUILD_QUEUE_SIZE", "100"))
+# Identical requests attach to a running build; completed builds are reused
+# for this many seconds (0 disables reuse, in-flight coalescing always applies)
+BUILD_REUSE_SECONDS = float(os.getenv("BUILD_REUSE_SECONDS", "300"))
+# Finished builds kept for status polls and reuse (oldest are dropped first)
+BUILD_TRACKED_JOBS = int(os.getenv("BUILD_TRACKED_JOBS", "1000"))
+# How often event streams for builds running in another container poll job_status
+BUILD_STATUS_POLL_SECONDS = float(os.getenv("BUILD_STATUS_POLL_SECONDS", "1"))
+# Re-encoded/resized copies of earlier uploads reuse that build too
+# (NEAR_DUPLICATE_HASH / NEAR_DUPLICATE_MAX_DISTANCE / NEAR_DUPLICATE_INDEX_SIZE)
+
+# Workers per pipeline stage and the bounded queue in front of each stage
+TEXTURE_STAGE_WORKERS = int(os.getenv("TEXTURE_STAGE_WORKERS", "4"))
+MODEL_STAGE_WORKERS = int(os.getenv("MODEL_STAGE_WORKERS", str(BLENDER_MAX_CONCURRENCY)))
+FINISH_STAGE_WORKERS = int(os.getenv("FINISH_STAGE_WORKERS", "2"))
+STAGE_QUEUE_SIZE = int(os.getenv("STAGE_QUEUE_SIZE", "4"))
+
+# Uploads are pipeline intermediates: they stay in container-local tmpfs
+# (shared memory) instead of the network volume, which only receives final
+# artifacts and is committed once per build
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", "/dev/shm/wiggle")
+SCRATCH_MAX_MB = float(os.getenv("SCRATCH_MAX_MB", "512"))
+SCRATCH_TTL_SECONDS = float(os.getenv("SCRATCH_TTL_SECONDS", "3600"))
+# Minimum gap between volume reloads triggered by download cache misses
+VOLUME_RELOAD_MIN_SECONDS = float(os.getenv("VOLUME_RELOAD_MIN_SECONDS", "2"))
+
+# Optional baked cloth animation stage (bake_cloth_animation.py inside Blender)
+BAKE_SCRIPT_PATH = "/root/bake_cloth_animation.py"
+BAKE_MOTIONS = ("sway", "spin", "bounce", "shake")
+BAKE_FORMATS = ("morph", "vat")
+BAKE_FRAMES = int(os.getenv("BAKE_FRAMES", "72"))
+BAKE_FPS = int(os.getenv("BAKE_FPS", "24"))
+
+BLENDER_APPLY_TEXTURE_SCRIPT = '''
 import bpy
 import sys
 import os
@@ -195,64 +220,262 @@ except Exception as e:
 
 print("Blender script completed")
 '''
+
+async def apply_texture_with_blender(texture_png_data: bytes, semaphore) -> tuple[bytes, dict]:
+    """
+    Apply texture to 3D model using Blender (integrated function)
+    
+    Blender runs as an asyncio subprocess so the event loop keeps serving
+    other requests, and at most BLENDER_MAX_CONCURRENCY renders run at once.
+    
+    Args:
+        texture_png_data: Binary data of texture PNG
+        semaphore: Async context manager (e.g. asyncio.Semaphore) limiting
+            concurrent Blender processes on this container
+    
+    Returns: (binary data of model_textured.glb, {"queueWaitMs", "blenderRunMs"})
+    """
+    import tempfile
+    import aiofiles
+    
+    # 1. Setup file paths
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Save incoming texture data to temporary file for Blender
+        texture_path = f"{tmpdir}/texture.png"
+        async with aiofiles.open(texture_path, "wb") as f:
+            await f.write(texture_png_data)
+        
+        output_path = f"{tmpdir}/model_textured.glb"
         
-        # 3. Write Blender script to file
+        # 2. Write Blender script to file
+        blender_script_path = f"{tmpdir}/apply_texture_script.py"
         with open(blender_script_path, "w") as f:
-            f.write(blender_script_content)
+            f.write(BLENDER_APPLY_TEXTURE_SCRIPT)
         
-        # 4. Run Blender with the script
-        print(f"Running Blender with script...")
+        # 3. Wait for a Blender slot, then run Blender with the script
+        queued_at = time.perf_counter()
+        async with semaphore:
+            started_at = time.perf_counter()
+            print(f"Running Blender with script (queued {int((started_at - queued_at) * 1000)} ms)...")
+            stdout, stderr = await run_blender(blender_script_path, texture_path, output_path)
+            finished_at = time.perf_counter()
         
-        try:
-            result = subprocess.run([
-                "blender", "--background", "--python", blender_script_path, "--",
-                texture_path, output_path
-            ], capture_output=True, text=True, timeout=300)
-            
-            print(f"Blender stdout: {result.stdout}")
-            if result.stderr:
-                print(f"Blender stderr: {result.stderr}")
-                
-        except subprocess.TimeoutExpired:
-            print("Blender process timed out")
-        except Exception as e:
-            print(f"Error running Blender: {e}")
+        timings = {
+            "queueWaitMs": int((started_at - queued_at) * 1000),
+            "blenderRunMs": int((finished_at - started_at) * 1000)
+        }
         
-        # 5. Read output file
+        # 4. Read output file
         if os.path.exists(output_path):
-            with open(output_path, "rb") as f:
-                model_data = f.read()
+            async with aiofiles.open(output_path, "rb") as f:
+                model_data = await f.read()
             print(f"Successfully generated model: {len(model_data)} bytes")
-            return model_data
+            return model_data, timings
         else:
-            error_msg = f"Output file not found at {output_path}. Blender stdout: {result.stdout if 'result' in locals() else 'N/A'}, stderr: {result.stderr if 'result' in locals() else 'N/A'}"
+            error_msg = f"Output file not found at {output_path}. Blender stdout: {stdout or 'N/A'}, stderr: {stderr or 'N/A'}"
             print(error_msg)
             raise Exception(error_msg)
 
+class _TrackedSlot:
+    """Async context manager wrapping a semaphore and counting running holders"""
+    
+    def __init__(self, semaphore: asyncio.Semaphore, stats: dict):
+        self.semaphore = semaphore
+        self.stats = stats
+    
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        self.stats["running"] += 1
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self.stats["running"] -= 1
+        self.semaphore.release()
+
+class _VolumeSync:
+    """Batches commits of a Modal volume and reloads it on download cache misses"""
+    
+    def __init__(self, volume: modal.Volume, reload_min_seconds: float):
+        self.volume = volume
+        self.reload_min_seconds = reload_min_seconds
+        self._lock = asyncio.Lock()
+        self._requested = 0
+        self._committed = 0
+        self._last_reload = 0.0
+        self.stats = {"commits": 0, "commitRequests": 0, "reloads": 0, "errors": 0}
+    
+    async def commit(self) -> None:
+        """Persist writes made so far; callers queued behind a commit share the next one"""
+        self._requested += 1
+        self.stats["commitRequests"] += 1
+        requested = self._requested
+        async with self._lock:
+            if self._committed >= requested:
+                return
+            target = self._requested
+            await self.volume.commit.aio()
+            self._committed = target
+            self.stats["commits"] += 1
+    
+    async def reload(self) -> bool:
+        """Fetch files committed by other containers; False if skipped or failed"""
+        async with self._lock:
+            if time.monotonic() - self._last_reload < self.reload_min_seconds:
+                return False
+            self._last_reload = time.monotonic()
+            try:
+                await self.volume.reload.aio()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Volume reload failed: {e}")
+                return False
+            self.stats["reloads"] += 1
+            return True
+
+class _DictJobStatus:
+    """Job status store (build_jobs.JobStatusStore) backed by a modal.Dict"""
+    
+    def __init__(self, store: modal.Dict):
+        self.store = store
+    
+    async def put(self, build_id: str, snapshot: dict) -> None:
+        await self.store.put.aio(build_id, snapshot)
+    
+    async def get(self, build_id: str):
+        return await self.store.get.aio(build_id)
+
+async def run_blender(script_path: str, *script_args: str) -> tuple[str, str]:
+    """
+    Run a Blender script in background mode without blocking the event loop
+    
+    Returns: (stdout, stderr); both empty if Blender could not be run
+    """
+    stdout, stderr = "", ""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "blender", "--background", "--python", script_path, "--", *script_args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            out, err = await asyncio.wait_for(process.communicate(), timeout=BLENDER_TIMEOUT_SECONDS)
+            stdout = out.decode(errors="replace")
+            stderr = err.decode(errors="replace")
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            print("Blender process timed out")
+            return stdout, stderr
+        
+        print(f"Blender stdout: {stdout}")
+        if stderr:
+            print(f"Blender stderr: {stderr}")
+            
+    except Exception as e:
+        print(f"Error running Blender: {e}")
+    
+    return stdout, stderr
+
+async def bake_cloth_animation(model_data: bytes, motion: str, fmt: str, semaphore) -> tuple[dict, dict]:
+    """
+    Bake a canned cloth motion for a generated model offline in Blender
+    
+    Args:
+        model_data: Binary data of the generated model (GLB or OBJ)
+        motion: One of BAKE_MOTIONS
+        fmt: "morph" (shape-key animated GLB) or "vat" (GLB + vertex animation texture)
+        semaphore: Shared Blender concurrency limiter
+    
+    Returns: ({suffix: bytes} with ".glb" and for VAT ".vat.exr"/".vat.json", timings)
+    """
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        model_path = f"{tmpdir}/model_input"
+        with open(model_path, "wb") as f:
+            f.write(model_data)
+        
+        output_path = f"{tmpdir}/animated.glb"
+        
+        queued_at = time.perf_counter()
+        async with semaphore:
+            started_at = time.perf_counter()
+            stdout, stderr = await run_blender(
+                BAKE_SCRIPT_PATH, model_path, output_path, motion, fmt, str(BAKE_FRAMES), str(BAKE_FPS)
+            )
+            finished_at = time.perf_counter()
+        
+        timings = {
+            "queueWaitMs": int((started_at - queued_at) * 1000),
+            "blenderRunMs": int((finished_at - started_at) * 1000)
+        }
+        
+        outputs = {".glb": output_path}
+        if fmt == "vat":
+            outputs[".vat.exr"] = f"{tmpdir}/animated.vat.exr"
+            outputs[".vat.json"] = f"{tmpdir}/animated.vat.json"
+        
+        files = {}
+        for suffix, path in outputs.items():
+            if not os.path.exists(path):
+                raise Exception(f"Bake output {suffix} not found for motion {motion}. Blender stderr: {stderr or 'N/A'}")
+            with open(path, "rb") as f:
+                files[suffix] = f.read()
+        
+        return files, timings
+
 @app.function(
     image=image,
     secrets=[secrets],
     volumes={"/storage": volume, "/blender_assets": blender_volume},
     timeout=600
 )
+@modal.concurrent(max_inputs=API_MAX_CONCURRENT_INPUTS)
 @modal.asgi_app()
 def fastapi_app():
-    from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+    from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
     from fastapi.middleware.cors import CORSMiddleware
-    from fastapi.responses import FileResponse
-    import httpx
-    import asyncio
+    from fastapi.responses import StreamingResponse
+    from contextlib import asynccontextmanager
     import logging
     import uuid
     from datetime import datetime
     import weaviate
+    from weaviate.classes.data import DataObject
     from weaviate.classes.init import Auth
+    from weaviate.util import generate_uuid5
+    from artifact_http import artifact_download
+    from artifact_store import LocalArtifactStore, artifact_store_from_env
+    from build_jobs import BuildJob, BuildJobManager, JobQueueFull, build_key, sse_events, sse_stream
+    from perceptual_hash import near_duplicate_index_from_env
+    from pipeline import Stage, StagedPipeline
+    from http_pool import PooledHTTPClient
+    from weaviate_pool import WeaviateClientManager, WeaviateUnavailable
     
     # Setup logging
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
     
-    app = FastAPI(title="Wiggle Complete API", version="1.0.0")
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """Open shared clients and run background build workers for the lifetime of the container"""
+        if texture_http:
+            await texture_http.start()
+        await weaviate_db.start()
+        await artifacts.start()
+        await scratch.start()
+        await build_pipeline.start()
+        await job_manager.start()
+        yield
+        await job_manager.stop()
+        await build_pipeline.stop()
+        await scratch.close()
+        await artifacts.close()
+        await weaviate_db.close()
+        if texture_http:
+            await texture_http.close()
+    
+    app = FastAPI(title="Wiggle Complete API", version="1.0.0", lifespan=lifespan)
     
     # Add CORS middleware
     app.add_middleware(
@@ -263,6 +486,71 @@ def fastapi_app():
         allow_headers=["*"],
     )
     
+    # Shared keep-alive connection pool to the texture service (TEXTURE_HTTP_* settings)
+    modal_api_url = os.getenv("MODAL_API_URL")
+    texture_http = PooledHTTPClient.from_env(modal_api_url) if modal_api_url else None
+    
+    # Files expire after ARTIFACT_TTL_SECONDS (24 h) and storage is kept under
+    # ARTIFACT_MAX_MB by a background LRU sweeper. The volume is the default;
+    # ARTIFACT_BACKEND=s3 uses a bucket and presigned download URLs.
+    artifacts = artifact_store_from_env("/storage", prefix="integrated")
+    
+    # Final artifacts on the volume are committed once per build; a download
+    # that misses reloads the volume to pick up other containers' builds
+    volume_sync = _VolumeSync(volume, VOLUME_RELOAD_MIN_SECONDS)
+    on_volume = isinstance(artifacts, LocalArtifactStore)
+    
+    # Uploaded photos only feed the texture service: keep them container-local
+    scratch = LocalArtifactStore(
+        SCRATCH_DIR,
+        precompress=False,
+        ttl_seconds=SCRATCH_TTL_SECONDS,
+        max_bytes=int(SCRATCH_MAX_MB * 1024 * 1024)
+    )
+    
+    async def gather_or_raise(*aws):
+        """Run awaitables concurrently; wait for all, then re-raise the first failure"""
+        results = await asyncio.gather(*aws, return_exceptions=True)
+        for outcome in results:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        return results
+    
+    # Bounded Blender concurrency shared by all requests on this container
+    blender_semaphore = asyncio.Semaphore(BLENDER_MAX_CONCURRENCY)
+    blender_stats = {"queued": 0, "running": 0, "completed": 0}
+    
+    async def render_model(texture_data: bytes) -> tuple[bytes, dict]:
+        """Run Blender for one build while tracking queue/run counters"""
+        blender_stats["queued"] += 1
+        try:
+            return await apply_texture_with_blender(texture_data, _TrackedSlot(blender_semaphore, blender_stats))
+        finally:
+            blender_stats["queued"] -= 1
+            blender_stats["completed"] += 1
+    
+    async def bake_animations(build_id: str, model_data: bytes, motions: list, fmt: str) -> tuple[dict, dict]:
+        """Bake each requested motion and save the results next to the model"""
+        animations = {}
+        timings = {}
+        for motion in motions:
+            blender_stats["queued"] += 1
+            try:
+                files, timings[motion] = await bake_cloth_animation(
+                    model_data, motion, fmt, _TrackedSlot(blender_semaphore, blender_stats)
+                )
+            finally:
+                blender_stats["queued"] -= 1
+                blender_stats["completed"] += 1
+            
+            urls = {}
+            for suffix, data in files.items():
+                filename = f"anim_{motion}_{build_id}{suffix}"
+                await artifacts.put(filename, data)
+                urls[suffix.lstrip(".").replace(".", "_")] = f"/api/animation/download/{filename}"
+            animations[motion] = urls
+        return animations, timings
+    
     def get_weaviate_client():
         """Get Weaviate client"""
         try:
@@ -282,6 +570,25 @@ def fastapi_app():
             logger.error(f"Failed to connect to Weaviate: {e}")
             return None
     
+    # One shared Weaviate connection per container; calls run on a thread pool
+    weaviate_db = WeaviateClientManager.from_env(get_weaviate_client)
+    
+    def upsert_build(client, properties: dict) -> None:
+        """Write the build's single Build object under generate_uuid5(buildId)"""
+        # insert_many goes through the batch API, which replaces an existing object
+        result = client.collections.get("Build").data.insert_many([
+            DataObject(properties=properties, uuid=generate_uuid5(properties["buildId"]))
+        ])
+        if result.has_errors:
+            raise Exception(f"Build record upsert failed: {result.errors[0].message}")
+    
+    async def record_build(properties: dict) -> None:
+        """Upsert the Build record (one object per build); skipped when Weaviate is unavailable"""
+        try:
+            await weaviate_db.run(upsert_build, properties)
+        except WeaviateUnavailable:
+            logger.warning(f"Weaviate unavailable, build record not saved: {properties.get('buildId')}")
+    
     @app.get("/")
     async def root():
         return {"message": "Wiggle Complete API", "status": "running"}
@@ -289,10 +596,8 @@ def fastapi_app():
     @app.get("/health")
     async def health_check():
         """Health check endpoint"""
-        client_db = get_weaviate_client()
-        weaviate_status = "connected" if client_db else "disconnected"
-        if client_db:
-            client_db.close()
+        weaviate_health = await weaviate_db.health()
+        weaviate_status = "connected" if weaviate_health["status"] == "connected" else "disconnected"
         
         return {
             "status": "healthy",
@@ -301,173 +606,356 @@ def fastapi_app():
                 "weaviate": weaviate_status,
                 "modal_api": os.getenv("MODAL_API_URL", "not_configured"),
                 "blender": "integrated"
-            }
+            },
+            "blender": {
+                "maxConcurrency": BLENDER_MAX_CONCURRENCY,
+                "running": blender_stats["running"],
+                "waiting": blender_stats["queued"] - blender_stats["running"],
+                "completed": blender_stats["completed"]
+            },
+            "jobs": job_manager.stats(),
+            "pipeline": build_pipeline.stats(),
+            "artifacts": artifacts.stats(),
+            "httpPool": texture_http.stats() if texture_http else None,
+            "weaviatePool": weaviate_db.stats()
         }
     
-    @app.post("/api/texture/generate")
-    async def generate_texture_and_model(
-        userId: str = Form(...),
-        front: UploadFile = File(...),
-        back: UploadFile = File(...)
-    ):
-        """Generate texture and 3D model from front and back images"""
-        build_id = str(uuid.uuid4())
+    @app.get("/metrics")
+    async def metrics():
+        """Runtime metrics for connection pools, Blender slots and background workers"""
+        return {
+            "httpPool": {"texture": texture_http.stats() if texture_http else None},
+            "weaviate": weaviate_db.stats(),
+            "blender": dict(blender_stats, maxConcurrency=BLENDER_MAX_CONCURRENCY),
+            "jobs": job_manager.stats(),
+            "pipeline": build_pipeline.stats(),
+            "artifacts": artifacts.stats(),
+            "scratch": scratch.stats(),
+            "volume": volume_sync.stats if on_volume else None,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    async def texture_stage(job: BuildJob, state: dict) -> None:
+        """Pipeline stage 1: record the build and generate its texture"""
+        build_id = job.build_id
+        userId = job.user_id
         logger.info(f"Starting texture/model generation for user: {userId}, build: {build_id}")
         
+        # Create build record
+        await record_build({
+            "buildId": build_id,
+            "userId": userId,
+            "status": "processing",
+            "createdAt": datetime.fromtimestamp(job.created_at).isoformat()
+        })
+        
+        # Uploaded bytes are forwarded from memory and kept in local scratch space
+        front_data = job.inputs["front"]
+        back_data = job.inputs["back"]
+        job.report("uploaded")
+        
+        # Call texture generation API over the shared connection pool
+        if not texture_http:
+            raise Exception("MODAL_API_URL not configured")
+        
+        files = {
+            "front": ("front.png", front_data, "image/png"),
+            "back": ("back.png", back_data, "image/png")
+        }
+        data = {"userId": userId}
+        
+        response, _, _ = await gather_or_raise(
+            texture_http.post("/build-texture", files=files, data=data),
+            scratch.put(f"front_{build_id}.png", front_data),
+            scratch.put(f"back_{build_id}.png", back_data)
+        )
+        logger.info(f"Saved uploaded files for build: {build_id}")
+        
+        if response.status_code != 200:
+            raise Exception(f"Texture generation failed: {response.text}")
+        
+        state["texture"] = response.content
+        job.report("texture_generated", textureUrl=f"/api/texture/download/texture_{build_id}.png")
+    
+    async def model_stage(job: BuildJob, state: dict) -> None:
+        """Pipeline stage 2: apply the texture to the model in Blender"""
+        build_id = job.build_id
+        texture_data = state.pop("texture")
+        texture_filename = f"texture_{build_id}.png"
+        
+        # Apply texture using integrated Blender function; the texture
+        # bytes go to Blender from memory while being saved in parallel
+        logger.info(f"Calling integrated Blender function with texture data ({len(texture_data)} bytes)")
+        
+        # Call the integrated Blender function (waits for a free Blender slot)
+        (model_data, blender_timings), _ = await gather_or_raise(
+            render_model(texture_data),
+            artifacts.put(texture_filename, texture_data)
+        )
+        logger.info(f"Texture saved as {texture_filename}")
+        
+        logger.info(
+            f"Blender processing completed successfully, received {len(model_data)} bytes "
+            f"(queued {blender_timings['queueWaitMs']} ms, ran {blender_timings['blenderRunMs']} ms)"
+        )
+        
+        # Save the GLB model
+        model_filename = f"model_{build_id}.glb"
+        model_path = await artifacts.put(model_filename, model_data)
+        
+        logger.info(f"3D model saved to {model_path}")
+        job.report("model_generated", modelUrl=f"/api/model/download/{model_filename}", timings=dict(blender_timings))
+        state.update(model=model_data, modelFilename=model_filename, timings=blender_timings)
+    
+    async def finish_stage(job: BuildJob, state: dict) -> dict:
+        """Pipeline stage 3: optional animation bake, then the completed record"""
+        build_id = job.build_id
+        userId = job.user_id
+        model_filename = state["modelFilename"]
+        blender_timings = state["timings"]
+        model_data = state.pop("model")
+        bake_animation = job.inputs["bakeAnimation"]
+        
+        # Optional stage: bake cloth animation offline. A failed bake
+        # does not fail the build; the static model is still usable.
+        animations = None
+        animation_error = None
+        if bake_animation:
+            try:
+                animations, animation_timings = await bake_animations(
+                    build_id, model_data, job.inputs["motions"], job.inputs["animationFormat"]
+                )
+                blender_timings["animations"] = animation_timings
+                logger.info(f"Baked {len(animations)} cloth animation(s) for build: {build_id}")
+            except Exception as e:
+                animation_error = str(e)
+                logger.error(f"Cloth animation bake failed for build {build_id}: {e}")
+        
+        # One volume commit covers the texture, model and animations
+        if on_volume:
+            await volume_sync.commit()
+        
+        # Update build record with success
+        await record_build({
+            "buildId": build_id,
+            "userId": userId,
+            "status": "completed",
+            # Uploads live only in scratch for SCRATCH_TTL_SECONDS, so their
+            # URLs are not persisted; the record links durable artifacts only
+            "textureUrl": f"/api/texture/download/texture_{build_id}.png",
+            "modelUrl": f"/api/model/download/{model_filename}",
+            "createdAt": datetime.fromtimestamp(job.created_at).isoformat(),
+            "completedAt": datetime.now().isoformat()
+        })
+        
+        result = {
+            "status": "completed",
+            "buildId": build_id,
+            "modelUrl": f"/api/model/download/{model_filename}",
+            "textureUrl": f"/api/texture/download/texture_{build_id}.png",
+            "timings": blender_timings,
+            "message": "3D model with texture generated successfully"
+        }
+        if bake_animation:
+            result["animations"] = animations
+            if animation_error:
+                result["animationError"] = animation_error
+        return result
+    
+    # Texture, Blender and bake/finish stages each have their own workers and
+    # bounded queues, so builds overlap: while one renders the next is already
+    # generating its texture. Blender work is still capped by blender_semaphore.
+    build_pipeline = StagedPipeline([
+        Stage("texture", texture_stage, workers=TEXTURE_STAGE_WORKERS, queue_size=STAGE_QUEUE_SIZE),
+        Stage("model", model_stage, workers=MODEL_STAGE_WORKERS, queue_size=STAGE_QUEUE_SIZE),
+        Stage("finish", finish_stage, workers=FINISH_STAGE_WORKERS, queue_size=STAGE_QUEUE_SIZE)
+    ])
+    
+    async def run_build_pipeline(job: BuildJob) -> dict:
+        """Generate texture, 3D model and optional baked animations for one build"""
         try:
-            # Create build record
-            client_db = get_weaviate_client()
-            if client_db:
-                builds = client_db.collections.get("Build")
-                builds.data.insert({
-                    "buildId": build_id,
-                    "userId": userId,
-                    "status": "processing",
-                    "createdAt": datetime.now().isoformat()
-                })
-                client_db.close()
-            
-            # Save uploaded files
-            front_path = f"/storage/front_{build_id}.png"
-            back_path = f"/storage/back_{build_id}.png"
-            
-            with open(front_path, "wb") as f:
-                f.write(await front.read())
-            with open(back_path, "wb") as f:
-                f.write(await back.read())
-            
-            logger.info(f"Saved uploaded files for build: {build_id}")
-            
-            # Call texture generation API
-            modal_api_url = os.getenv("MODAL_API_URL")
-            if not modal_api_url:
-                raise Exception("MODAL_API_URL not configured")
-            
-            async with httpx.AsyncClient(timeout=300.0) as client_http:
-                with open(front_path, "rb") as f1, open(back_path, "rb") as f2:
-                    files = {
-                        "front": ("front.png", f1, "image/png"),
-                        "back": ("back.png", f2, "image/png")
-                    }
-                    data = {"userId": userId}
-                    
-                    response = await client_http.post(
-                        f"{modal_api_url}/build-texture",
-                        files=files,
-                        data=data
-                    )
-                    
-                    if response.status_code != 200:
-                        raise Exception(f"Texture generation failed: {response.text}")
-                    
-                    # Save texture directly from response content
-                    texture_path = f"/storage/texture_{build_id}.png"
-                    with open(texture_path, "wb") as f:
-                        f.write(response.content)
-                    logger.info(f"Texture saved to {texture_path}")
-                    
-                    # Create texture URL for response
-                    texture_url = f"/api/download/{build_id}/texture_{build_id}.png"
-            
-            # Apply texture using integrated Blender function
-            logger.info(f"Applying texture to 3D model using integrated Blender")
-            
-            # Read texture data
-            with open(texture_path, "rb") as f:
-                texture_data = f.read()
-            
-            logger.info(f"Calling integrated Blender function with texture data ({len(texture_data)} bytes)")
-            
-            # Call the integrated Blender function
-            model_data = apply_texture_with_blender(texture_data)
-            
-            logger.info(f"Blender processing completed successfully, received {len(model_data)} bytes")
-            
-            # Save the GLB model
-            model_filename = f"model_{build_id}.glb"
-            model_path = f"/storage/{model_filename}"
-            
-            with open(model_path, "wb") as f:
-                f.write(model_data)
-            
-            logger.info(f"3D model saved to {model_path}")
-            
-            # Update build record with success
-            client_db = get_weaviate_client()
-            if client_db:
-                builds = client_db.collections.get("Build")
-                builds.data.insert({
-                    "buildId": build_id,
-                    "userId": userId,
-                    "status": "completed",
-                    "frontImageUrl": f"/api/texture/download/front_{build_id}.png",
-                    "backImageUrl": f"/api/texture/download/back_{build_id}.png",
-                    "textureUrl": f"/api/texture/download/texture_{build_id}.png",
-                    "modelUrl": f"/api/model/download/{model_filename}",
-                    "createdAt": datetime.now().isoformat(),
-                    "completedAt": datetime.now().isoformat()
-                })
-                client_db.close()
-            
-            return {
-                "status": "completed",
-                "buildId": build_id,
-                "modelUrl": f"/api/model/download/{model_filename}",
-                "textureUrl": f"/api/texture/download/texture_{build_id}.png",
-                "message": "3D model with texture generated successfully"
-            }
+            return await build_pipeline.run(job)
             
         except Exception as e:
             logger.error(f"Error in texture/model generation: {e}")
             
             # Update build record with error
-            client_db = get_weaviate_client()
-            if client_db:
-                builds = client_db.collections.get("Build")
-                builds.data.insert({
-                    "buildId": build_id,
-                    "userId": userId,
-                    "status": "failed",
-                    "error": str(e),
-                    "createdAt": datetime.now().isoformat(),
-                    "failedAt": datetime.now().isoformat()
-                })
-                client_db.close()
+            await record_build({
+                "buildId": job.build_id,
+                "userId": job.user_id,
+                "status": "failed",
+                "error": str(e),
+                "createdAt": datetime.fromtimestamp(job.created_at).isoformat(),
+                "failedAt": datetime.now().isoformat()
+            })
             
+            raise
+    
+    # Admits builds into the pipeline; enough workers to keep every stage busy
+    job_manager = BuildJobManager(
+        run_build_pipeline,
+        workers=BUILD_WORKERS or build_pipeline.capacity,
+        max_queued=BUILD_QUEUE_SIZE,
+        reuse_seconds=BUILD_REUSE_SECONDS,
+        near_duplicates=near_duplicate_index_from_env(),
+        max_tracked=BUILD_TRACKED_JOBS,
+        shared_status=_DictJobStatus(job_status),
+        shared_poll_seconds=BUILD_STATUS_POLL_SECONDS
+    )
+    
+    async def read_build_inputs(front: UploadFile, back: UploadFile, bakeAnimation: bool, motions: str, animationFormat: str) -> dict:
+        """Validate options and read uploads so the pipeline can outlive the request"""
+        requested_motions = [m.strip() for m in motions.split(",") if m.strip()]
+        if bakeAnimation:
+            unknown = [m for m in requested_motions if m not in BAKE_MOTIONS]
+            if unknown or not requested_motions:
+                raise HTTPException(status_code=400, detail=f"motions must be a comma-separated subset of {', '.join(BAKE_MOTIONS)}")
+            if animationFormat not in BAKE_FORMATS:
+                raise HTTPException(status_code=400, detail=f"animationFormat must be one of {', '.join(BAKE_FORMATS)}")
+        
+        return {
+            "front": await front.read(),
+            "back": await back.read(),
+            "bakeAnimation": bakeAnimation,
+            "motions": requested_motions,
+            "animationFormat": animationFormat
+        }
+    
+    async def new_build_job(userId: str, inputs: dict, reuse_similar: bool = True) -> BuildJob:
+        """Create a job keyed by user, image content and options for de-duplication"""
+        options = (inputs["bakeAnimation"], inputs["motions"], inputs["animationFormat"])
+        key = build_key(userId, inputs["front"], inputs["back"], *options)
+        near_duplicates = job_manager.near_duplicates
+        fingerprint = None
+        if near_duplicates:
+            fingerprint = await asyncio.to_thread(near_duplicates.fingerprint, [inputs["front"], inputs["back"]])
+        return BuildJob(
+            str(uuid.uuid4()), userId, inputs, key=key,
+            fingerprint=fingerprint, scope=build_key(userId, *options), reuse_similar=reuse_similar
+        )
+    
+    @app.post("/api/texture/generate")
+    async def generate_texture_and_model(
+        userId: str = Form(...),
+        front: UploadFile = File(...),
+        back: UploadFile = File(...),
+        bakeAnimation: bool = Form(default=False),
+        motions: str = Form(default="sway"),
+        animationFormat: str = Form(default="morph"),
+        reuseSimilar: bool = Form(default=True)
+    ):
+        """Generate texture and 3D model from front and back images
+        
+        With bakeAnimation=true, cloth motions (comma-separated, see BAKE_MOTIONS)
+        are additionally baked in Blender so clients can play them back
+        without simulating cloth in the browser. With reuseSimilar (default),
+        near-duplicates of a recent build's uploads with the same options
+        reuse that build's texture and model.
+        """
+        inputs = await read_build_inputs(front, back, bakeAnimation, motions, animationFormat)
+        job = await new_build_job(userId, inputs, reuseSimilar)
+        
+        try:
+            result = await job_manager.run(job)
+        except Exception as e:
             return {
                 "status": "failed",
-                "buildId": build_id,
+                "buildId": job.build_id,
                 "error": "Model generation failed",
                 "details": str(e)
             }
+        
+        # Duplicate of a running or recent build: same result, no new work
+        if result["buildId"] != job.build_id:
+            result = dict(result, deduplicated=True, nearDuplicate=job.near_duplicate)
+        return result
     
-    @app.get("/api/model/download/{filename}")
-    async def download_model(filename: str):
-        """Download generated 3D model file"""
-        file_path = f"/storage/{filename}"
+    @app.post("/api/texture/submit", status_code=202)
+    async def submit_texture_and_model(
+        userId: str = Form(...),
+        front: UploadFile = File(...),
+        back: UploadFile = File(...),
+        bakeAnimation: bool = Form(default=False),
+        motions: str = Form(default="sway"),
+        animationFormat: str = Form(default="morph"),
+        reuseSimilar: bool = Form(default=True)
+    ):
+        """Queue a build and return immediately; follow progress via /api/texture/jobs/{build_id}/events"""
+        inputs = await read_build_inputs(front, back, bakeAnimation, motions, animationFormat)
+        requested = await new_build_job(userId, inputs, reuseSimilar)
+        
+        try:
+            job = job_manager.submit(requested)
+        except JobQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
         
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Model file not found")
+        if job is requested:
+            logger.info(f"Queued build {job.build_id} for user: {userId}")
+        return {
+            "buildId": job.build_id,
+            "status": job.stage,
+            "deduplicated": job is not requested,
+            "nearDuplicate": requested.near_duplicate,
+            "statusUrl": f"/api/texture/jobs/{job.build_id}",
+            "eventsUrl": f"/api/texture/jobs/{job.build_id}/events"
+        }
+    
+    @app.get("/api/texture/jobs/{build_id}")
+    async def get_texture_job(build_id: str):
+        """Get current stage and result of a queued build, whichever container runs it"""
+        snapshot = await job_manager.snapshot(build_id)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail="Build job not found")
+        return snapshot
+    
+    @app.get("/api/texture/jobs/{build_id}/events")
+    async def stream_texture_job(build_id: str):
+        """Stream build progress as Server-Sent Events"""
+        job = job_manager.get(build_id)
+        if job:
+            events = sse_events(job)
+        elif await job_manager.snapshot(build_id) is not None:
+            # Running in another container: follow its shared snapshots
+            events = sse_stream(job_manager.shared_events(build_id))
+        else:
+            raise HTTPException(status_code=404, detail="Build job not found")
         
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type="model/gltf-binary"
+        return StreamingResponse(
+            events,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
     
-    @app.get("/api/texture/download/{filename}")
-    async def download_texture(filename: str):
-        """Download texture file"""
-        file_path = f"/storage/{filename}"
+    async def reload_volume() -> bool:
+        """Download cache miss: the file may have been committed by another container"""
+        return on_volume and await volume_sync.reload()
+    
+    @app.get("/api/model/download/{filename}")
+    async def download_model(filename: str, request: Request):
+        """Download generated 3D model file"""
+        return await artifact_download(request, artifacts, filename, "Model", "model/gltf-binary", on_miss=reload_volume)
+    
+    @app.get("/api/animation/download/{filename}")
+    async def download_animation(filename: str, request: Request):
+        """Download baked cloth animation (GLB, VAT texture or VAT metadata)"""
+        if not filename.startswith("anim_"):
+            raise HTTPException(status_code=404, detail="Animation file not found")
         
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Texture file not found")
+        if filename.endswith(".vat.exr"):
+            media_type = "image/x-exr"
+        elif filename.endswith(".vat.json"):
+            media_type = "application/json"
+        else:
+            media_type = "model/gltf-binary"
         
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type="image/png"
-        )
+        return await artifact_download(request, artifacts, filename, "Animation", media_type, on_miss=reload_volume)
+    
+    @app.get("/api/texture/download/{filename}")
+    async def download_texture(filename: str, request: Request):
+        """Download texture file (uploaded photos are served from this container's scratch space)"""
+        if filename.startswith(("front_", "back_")):
+            return await artifact_download(request, scratch, filename, "Texture", "image/png")
+        return await artifact_download(request, artifacts, filename, "Texture", "image/png", on_miss=reload_volume)
     
     return app
 
@@ -0,0 +1,248 @@
+"""
+Perceptual hashes for reusing builds of near-duplicate uploads
+
+Exact content keys (build_jobs.build_key) miss the common case of the same
+product photo uploaded again after being re-encoded, resized or lightly
+compressed. Every upload is therefore also given a 64-bit perceptual hash
+(pHash by default, dHash optionally) when the request arrives, and builds
+are indexed by the hashes of their front and back images.
+
+Two builds are near-duplicates when both images are within
+NEAR_DUPLICATE_MAX_DISTANCE differing bits. The distance of a pair is the
+larger of its two per-image Hamming distances, which is itself a metric,
+so the index is a BK-tree: lookups only visit subtrees whose edge distance
+is within the threshold of the query. One tree is kept per scope (user and
+build options), so only builds with the same options are ever matched.
+"""
+
+import io
+import logging
+import math
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+HASH_ALGORITHMS = ("phash", "dhash")
+
+# DCT basis for pHash: 32x32 image, lowest 8x8 frequencies
+_DCT_SIZE = 32
+_DCT_LOW = 8
+_DCT_BASIS = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)]
+    for u in range(_DCT_LOW)
+]
+
+Fingerprint = Tuple[int, ...]
+
+
+def _grayscale(data: bytes, size: Tuple[int, int]) -> List[int]:
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    # JPEG decoders can downscale while decoding, far cheaper than a full decode
+    image.draft("L", (size[0] * 4, size[1] * 4))
+    return list(image.convert("L").resize(size, Image.LANCZOS).getdata())
+
+
+def dhash(data: bytes) -> int:
+    """Difference hash: 64 bits comparing horizontally adjacent pixels"""
+    pixels = _grayscale(data, (9, 8))
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            value = (value << 1) | (left > pixels[row * 9 + col + 1])
+    return value
+
+
+def phash(data: bytes) -> int:
+    """DCT hash: 64 bits, low frequencies of a 32x32 image against their median"""
+    pixels = _grayscale(data, (_DCT_SIZE, _DCT_SIZE))
+    # Separable DCT, keeping only the low frequencies in each direction
+    rows = [
+        [sum(basis[x] * pixels[y * _DCT_SIZE + x] for x in range(_DCT_SIZE)) for basis in _DCT_BASIS]
+        for y in range(_DCT_SIZE)
+    ]
+    low = [
+        sum(_DCT_BASIS[u][y] * rows[y][v] for y in range(_DCT_SIZE))
+        for u in range(_DCT_LOW)
+        for v in range(_DCT_LOW)
+    ]
+    ordered = sorted(low)
+    median = (ordered[len(low) // 2 - 1] + ordered[len(low) // 2]) / 2
+    value = 0
+    for coefficient in low:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+def distance(a: Fingerprint, b: Fingerprint) -> int:
+    """Largest per-image Hamming distance between two fingerprints"""
+    return max(bin(x ^ y).count("1") for x, y in zip(a, b))
+
+
+class _Node:
+    __slots__ = ("fingerprint", "value", "children")
+
+    def __init__(self, fingerprint: Fingerprint, value: Any):
+        self.fingerprint = fingerprint
+        self.value = value
+        self.children: Dict[int, "_Node"] = {}
+
+
+class BKTree:
+    """BK-tree over fingerprints; removals leave tombstones until the next rebuild"""
+
+    def __init__(self):
+        self.root: Optional[_Node] = None
+        self.size = 0
+        self.removed = 0
+
+    def add(self, fingerprint: Fingerprint, value: Any) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = _Node(fingerprint, value)
+            return
+        node = self.root
+        while True:
+            d = distance(fingerprint, node.fingerprint)
+            child = node.children.get(d)
+            if child is None:
+                node.children[d] = _Node(fingerprint, value)
+                return
+            node = child
+
+    def nearest(self, fingerprint: Fingerprint, max_distance: int) -> Optional[Tuple[Any, int]]:
+        """Closest live value within max_distance, with its distance"""
+        best = None
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = distance(fingerprint, node.fingerprint)
+            if node.value is not None and d <= max_distance and (best is None or d < best[1]):
+                best = (node.value, d)
+                if d == 0:
+                    break
+            limit = best[1] if best else max_distance
+            # Triangle inequality: only edges within the radius can hold matches
+            for edge, child in node.children.items():
+                if d - limit <= edge <= d + limit:
+                    stack.append(child)
+        return best
+
+    def remove(self, fingerprint: Fingerprint, value: Any) -> bool:
+        node = self.root
+        while node is not None:
+            d = distance(fingerprint, node.fingerprint)
+            if d == 0 and node.value == value:
+                node.value = None
+                self.size -= 1
+                self.removed += 1
+                return True
+            node = node.children.get(d)
+        return False
+
+    def items(self) -> List[Tuple[Fingerprint, Any]]:
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            if node.value is not None:
+                found.append((node.fingerprint, node.value))
+            stack.extend(node.children.values())
+        return found
+
+
+class NearDuplicateIndex:
+    """Perceptual-hash index of recent builds, one BK-tree per scope"""
+
+    def __init__(self, algorithm: str = "phash", max_distance: int = 6, max_entries: int = 10000):
+        if algorithm not in HASH_ALGORITHMS:
+            raise ValueError(f"Unknown perceptual hash {algorithm!r} (expected one of {', '.join(HASH_ALGORITHMS)})")
+        self.algorithm = algorithm
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._hash = phash if algorithm == "phash" else dhash
+        self._trees: Dict[str, BKTree] = {}
+        # value -> (scope, fingerprint), oldest first, for eviction and removal
+        self._entries: "OrderedDict[Any, Tuple[str, Fingerprint]]" = OrderedDict()
+        self._hashed = 0
+        self._hash_errors = 0
+        self._lookups = 0
+        self._hits = 0
+        self._hit_distances: Dict[int, int] = {}
+
+    def fingerprint(self, images: Sequence[bytes]) -> Optional[Fingerprint]:
+        """Hashes of a build's images (blocking; run off the event loop), None if undecodable"""
+        try:
+            hashes = tuple(self._hash(data) for data in images)
+        except Exception as e:
+            self._hash_errors += 1
+            logger.warning(f"Perceptual hash failed: {str(e)}")
+            return None
+        self._hashed += len(images)
+        return hashes
+
+    def find(self, scope: str, fingerprint: Fingerprint) -> Optional[Tuple[Any, int]]:
+        """Closest indexed value in the scope within max_distance, with its distance"""
+        self._lookups += 1
+        tree = self._trees.get(scope)
+        match = tree.nearest(fingerprint, self.max_distance) if tree else None
+        if match is not None:
+            self._hits += 1
+            self._hit_distances[match[1]] = self._hit_distances.get(match[1], 0) + 1
+        return match
+
+    def add(self, scope: str, fingerprint: Fingerprint, value: Any) -> None:
+        self.remove(value)
+        self._trees.setdefault(scope, BKTree()).add(fingerprint, value)
+        self._entries[value] = (scope, fingerprint)
+        while len(self._entries) > self.max_entries:
+            self.remove(next(iter(self._entries)))
+
+    def remove(self, value: Any) -> None:
+        entry = self._entries.pop(value, None)
+        if entry is None:
+            return
+        scope, fingerprint = entry
+        tree = self._trees[scope]
+        tree.remove(fingerprint, value)
+        if tree.size == 0:
+            del self._trees[scope]
+        elif tree.removed > tree.size:
+            self._rebuild(scope)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "algorithm": self.algorithm,
+            "maxDistance": self.max_distance,
+            "entries": len(self._entries),
+            "scopes": len(self._trees),
+            "imagesHashed": self._hashed,
+            "hashErrors": self._hash_errors,
+            "lookups": self._lookups,
+            "hits": self._hits,
+            "hitRate": round(self._hits / self._lookups, 3) if self._lookups else 0,
+            "hitsByDistance": dict(sorted(self._hit_distances.items()))
+        }
+
+    def _rebuild(self, scope: str) -> None:
+        """Rebuild a scope's tree from its live entries, without tombstones"""
+        tree = BKTree()
+        for fingerprint, value in self._trees[scope].items():
+            tree.add(fingerprint, value)
+        self._trees[scope] = tree
+
+
+def near_duplicate_index_from_env() -> Optional[NearDuplicateIndex]:
+    """Index configured by NEAR_DUPLICATE_* settings, or None when NEAR_DUPLICATE_HASH=none"""
+    algorithm = os.getenv("NEAR_DUPLICATE_HASH", "phash")
+    if algorithm == "none":
+        return None
+    return NearDuplicateIndex(
+        algorithm,
+        max_distance=int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "6")),
+        max_entries=int(os.getenv("NEAR_DUPLICATE_INDEX_SIZE", "10000"))
+    )
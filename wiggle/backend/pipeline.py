@@ -0,0 +1,181 @@
+"""
+Staged build pipeline
+
+A build is split into stages (e.g. texture -> model). Each stage has its own
+pool of asyncio workers and is fed by a bounded queue, so different builds
+occupy different stages at the same time: while build N is in Blender,
+build N+1 can already be generating its texture. A full downstream queue
+blocks the upstream workers, which bounds the work in flight.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Window used for the throughput figure in stats()
+THROUGHPUT_WINDOW_SECONDS = 60.0
+
+
+class Stage:
+    """One pipeline stage: handler(job, state) run by a fixed number of workers"""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        workers: int = 1,
+        queue_size: int = 4
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self._busy_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._running_since: Dict[int, float] = {}
+
+    def stats(self, uptime: float) -> Dict[str, Any]:
+        now = time.perf_counter()
+        busy_seconds = self._busy_seconds + sum(now - t for t in self._running_since.values())
+        handled = self.processed + self.failed
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "queued": self.queue.qsize(),
+            "queueSize": self.queue.maxsize,
+            "processed": self.processed,
+            "failed": self.failed,
+            "utilization": round(busy_seconds / (self.workers * uptime), 3) if uptime > 0 else 0,
+            "avgServiceMs": round(self._busy_seconds * 1000 / handled, 2) if handled else 0,
+            "avgQueueWaitMs": round(self._wait_seconds * 1000 / handled, 2) if handled else 0
+        }
+
+
+class _Item:
+    """A build travelling through the stages"""
+
+    __slots__ = ("job", "state", "future", "enqueued_at")
+
+    def __init__(self, job: Any, state: Dict[str, Any], future: asyncio.Future):
+        self.job = job
+        self.state = state
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class StagedPipeline:
+    """Runs builds through a fixed sequence of stages connected by bounded queues
+
+    Every handler receives the job and a state dict shared by all stages of
+    that build; the value returned by the last stage is the build result.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self._tasks: List[asyncio.Task] = []
+        self._started_at: Optional[float] = None
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._finished_at: deque = deque()
+
+    @property
+    def capacity(self) -> int:
+        """Builds that can be in the pipeline at once (workers + queue slots)"""
+        return sum(stage.workers + stage.queue.maxsize for stage in self.stages)
+
+    async def start(self) -> None:
+        self._started_at = time.perf_counter()
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                self._tasks.append(asyncio.create_task(self._worker(index, worker)))
+        logger.info(
+            "Started pipeline: " + " -> ".join(f"{s.name} x{s.workers}" for s in self.stages)
+        )
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run(self, job: Any, state: Optional[Dict[str, Any]] = None) -> Any:
+        """Queue a build at the first stage and wait for its result
+
+        Waits for room when the first stage's queue is full; exceptions
+        raised by any stage are re-raised here and skip the later stages.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight += 1
+        try:
+            await self.stages[0].queue.put(_Item(job, state if state is not None else {}, future))
+            return await future
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage utilization and queue depth plus overall throughput"""
+        uptime = time.perf_counter() - self._started_at if self._started_at else 0.0
+        cutoff = time.monotonic() - THROUGHPUT_WINDOW_SECONDS
+        while self._finished_at and self._finished_at[0] < cutoff:
+            self._finished_at.popleft()
+        return {
+            "inFlight": self._in_flight,
+            "capacity": self.capacity,
+            "completed": self._completed,
+            "failed": self._failed,
+            "throughputPerMinute": len(self._finished_at) * 60.0 / THROUGHPUT_WINDOW_SECONDS,
+            "stages": {stage.name: stage.stats(uptime) for stage in self.stages}
+        }
+
+    async def _worker(self, index: int, worker: int) -> None:
+        stage = self.stages[index]
+        is_last = index == len(self.stages) - 1
+        slot = id(asyncio.current_task())
+        while True:
+            item = await stage.queue.get()
+            started = time.perf_counter()
+            stage._wait_seconds += started - item.enqueued_at
+            stage.busy += 1
+            stage._running_since[slot] = started
+            try:
+                result = await stage.handler(item.job, item.state)
+            except asyncio.CancelledError:
+                if not item.future.done():
+                    item.future.cancel()
+                raise
+            except Exception as e:
+                stage.failed += 1
+                self._failed += 1
+                logger.error(f"Stage {stage.name} (worker {worker}) failed: {str(e)}")
+                if not item.future.done():
+                    item.future.set_exception(e)
+                continue
+            else:
+                stage.processed += 1
+            finally:
+                stage.busy -= 1
+                stage._busy_seconds += time.perf_counter() - started
+                del stage._running_since[slot]
+                stage.queue.task_done()
+
+            if item.future.done():
+                # Caller went away (e.g. request cancelled); drop the build
+                continue
+            if is_last:
+                self._completed += 1
+                self._finished_at.append(time.monotonic())
+                item.future.set_result(result)
+            else:
+                # Blocks while the next stage is full (backpressure)
+                item.enqueued_at = time.perf_counter()
+                await self.stages[index + 1].queue.put(item)
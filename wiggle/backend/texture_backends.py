@@ -0,0 +1,170 @@
+"""
+Pluggable texture generation backends
+
+- RemoteTextureBackend: multipart POST to the Modal texture service (app.py)
+- LocalTextureBackend: runs texture_engine in-process on a process pool,
+  avoiding the upload, cold start and network hop when the API host has
+  spare CPU (needs numpy, scipy and rembg installed locally)
+
+The backend is chosen with TEXTURE_BACKEND=remote|local.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from http_pool import PooledHTTPClient
+
+logger = logging.getLogger(__name__)
+
+# (filename, bytes, content_type), as received from the upload
+UploadTuple = Tuple[str, bytes, Optional[str]]
+
+
+class TextureBackendError(Exception):
+    """Raised when a backend cannot produce a texture"""
+
+
+class TextureBackend:
+    """Produces a texture PNG from front/back photos"""
+
+    name = "base"
+
+    def __init__(self):
+        self._calls = 0
+        self._errors = 0
+        self._total_ms = 0.0
+        self.last_latency_ms: Optional[int] = None
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def health(self) -> str:
+        return "ok"
+
+    async def generate(self, front: UploadTuple, back: UploadTuple, style: str = "preserve") -> Tuple[bytes, int]:
+        """Return (texture PNG bytes, latency in ms)"""
+        started = time.perf_counter()
+        self._calls += 1
+        try:
+            texture = await self._generate(front, back, style)
+        except Exception:
+            self._errors += 1
+            raise
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        self._total_ms += latency_ms
+        self.last_latency_ms = latency_ms
+        return texture, latency_ms
+
+    async def _generate(self, front: UploadTuple, back: UploadTuple, style: str) -> bytes:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "calls": self._calls,
+            "errors": self._errors,
+            "avgLatencyMs": round(self._total_ms / (self._calls - self._errors), 2) if self._calls > self._errors else 0
+        }
+
+
+class RemoteTextureBackend(TextureBackend):
+    """Calls the Modal texture service over a shared connection pool"""
+
+    name = "remote"
+
+    def __init__(self, http: PooledHTTPClient):
+        super().__init__()
+        self.http = http
+
+    async def start(self) -> None:
+        await self.http.start()
+
+    async def close(self) -> None:
+        await self.http.close()
+
+    async def health(self) -> str:
+        try:
+            response = await self.http.get("/health", timeout=5.0)
+            return "connected" if response.status_code == 200 else f"error: {response.status_code}"
+        except Exception as e:
+            return f"error: {str(e)}"
+
+    async def _generate(self, front: UploadTuple, back: UploadTuple, style: str) -> bytes:
+        try:
+            logger.info(f"Calling Modal API: {self.http.base_url}/build-texture")
+            response = await self.http.post(
+                "/build-texture",
+                files={"front": front, "back": back},
+                data={"style": style}
+            )
+            logger.info(f"Modal API response status: {response.status_code}")
+        except httpx.TimeoutException as e:
+            raise TextureBackendError(f"Modal API timeout: {str(e)}")
+        except httpx.RequestError as e:
+            raise TextureBackendError(f"Modal API request error: {str(e)}")
+
+        if response.status_code != 200:
+            raise TextureBackendError(
+                f"Texture generation failed with status {response.status_code}: {response.text}"
+            )
+        return response.content
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(super().stats(), httpPool=self.http.stats())
+
+
+class LocalTextureBackend(TextureBackend):
+    """Runs texture_engine.build_texture on a local process pool"""
+
+    name = "local"
+
+    def __init__(self, workers: int = 2):
+        super().__init__()
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def start(self) -> None:
+        if self._pool is None:
+            # Fail at startup rather than on the first build if deps are missing
+            import texture_engine  # noqa: F401
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def health(self) -> str:
+        return "in-process" if self._pool is not None else "not started"
+
+    async def _generate(self, front: UploadTuple, back: UploadTuple, style: str) -> bytes:
+        from texture_engine import build_texture
+
+        await self.start()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool, build_texture, front[1], back[1], style)
+        except Exception as e:
+            raise TextureBackendError(f"Local texture engine failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(super().stats(), workers=self.workers)
+
+
+def texture_backend_from_env(remote_url: str) -> TextureBackend:
+    """Select the backend from TEXTURE_BACKEND (remote by default)"""
+    kind = os.getenv("TEXTURE_BACKEND", "remote")
+    if kind == "local":
+        return LocalTextureBackend(workers=int(os.getenv("TEXTURE_LOCAL_WORKERS", "2")))
+    if kind == "remote":
+        return RemoteTextureBackend(PooledHTTPClient.from_env(remote_url))
+    raise ValueError(f"Unknown TEXTURE_BACKEND: {kind} (expected 'remote' or 'local')")
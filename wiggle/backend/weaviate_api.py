@@ -5,21 +5,63 @@
 - 按构建状态过滤
 - 向量相似度搜索
 - 时间范围查询
+
+基于FastAPI的异步服务：所有请求共享一个长连接的Weaviate客户端（WeaviateClientManager），
+Weaviate调用在专用线程池中执行，不阻塞事件循环；由uvicorn以多进程方式运行（API_WORKERS）。
+
+设置BUILD_TENANCY=user|account时构建按用户（或账户）存放在各自的租户中，
+查询只访问该租户，此时各接口需要传入user_id（account模式可传account_id）。
 """
 
-from flask import Flask, jsonify, request
+from fastapi import Body, FastAPI, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+import uvicorn
 import weaviate
 import weaviate.classes as wvc
-from weaviate.classes.query import Filter
+from weaviate.classes.aggregate import GroupByAggregate
+from weaviate.classes.query import Filter, MetadataQuery, Metrics
+from build_cache import build_cache_from_env
+from build_queries import count_objects, fetch_build_object, fetch_page
+from build_tenants import TenantUnavailable, build_tenancy_from_env
+from http_pool import PooledHTTPClient
+from image_embeddings import image_embedder_from_env
+from weaviate_pool import WeaviateClientManager
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import asyncio
+import base64
+import ipaddress
 import os
-
-app = Flask(__name__)
+import socket
+import threading
+import time
 
 # Weaviate配置
 WEAVIATE_GRPC_ENDPOINT = os.getenv("WEAVIATE_GRPC_ENDPOINT", "grpc-aoj6v69aspmruwn6zlgma.c0.europe-west3.gcp.weaviate.cloud")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "N08rcE1Ua0pJTlB1RVh0cF9XeEJjMVRGZE5MdjF1YkpqanZKc1RHaTV3ajc4c3BaOEZiOTA5ZXBlay9nPV92MjAw")
 
+# 服务配置：端口与uvicorn工作进程数（每个进程各有一个共享的Weaviate连接）
+PORT = int(os.getenv("PORT", "5001"))
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+
+# 构建记录读穿缓存（BUILD_CACHE_*配置，设置BUILD_CACHE_REDIS_URL时多进程共享）
+build_cache = build_cache_from_env()
+
+# 多租户配置（BUILD_TENANCY=off|user|account），需与写入服务一致
+tenancy = build_tenancy_from_env()
+
+# 本地ONNX图片向量模型（EMBEDDING_*配置），未设置EMBEDDING_MODEL_PATH时为None
+image_embedder = image_embedder_from_env()
+SEARCH_IMAGE_MAX_BYTES = int(os.getenv("SEARCH_IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+SEARCH_IMAGE_TIMEOUT = float(os.getenv("SEARCH_IMAGE_TIMEOUT", "10"))
+
+# 拉取image_url的共享连接池（SEARCH_IMAGE_HTTP_*配置），不设base_url，请求使用完整URL
+image_http = PooledHTTPClient.from_env("", prefix="SEARCH_IMAGE_HTTP")
+
 def get_weaviate_client():
     """获取Weaviate客户端"""
     return weaviate.connect_to_weaviate_cloud(
@@ -27,26 +69,90 @@ def get_weaviate_client():
         auth_credentials=wvc.init.Auth.api_key(WEAVIATE_API_KEY)
     )
 
-@app.route('/api/builds', methods=['GET'])
-def get_builds():
+# 进程内共享的Weaviate客户端，调用在线程池中执行（WEAVIATE_THREADS配置）
+weaviate_db = WeaviateClientManager.from_env(get_weaviate_client)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """在应用生命周期内打开共享客户端"""
+    await weaviate_db.start()
+    if image_embedder:
+        await image_embedder.start()
+        await image_http.start()
+    yield
+    if image_embedder:
+        await image_http.close()
+        await image_embedder.close()
+    await weaviate_db.close()
+
+app = FastAPI(title="Wiggle Weaviate Query API", lifespan=lifespan)
+
+def error(message, status_code):
+    """与原接口一致的错误响应格式"""
+    return JSONResponse({'success': False, 'error': message}, status_code=status_code)
+
+def failure(e):
+    """异常对应的错误响应：缺少租户参数为400，租户恢复中为503"""
+    if isinstance(e, ValueError):
+        return error(str(e), 400)
+    if isinstance(e, TenantUnavailable):
+        return error(str(e), 503)
+    return error(str(e), 500)
+
+def build_summary(obj):
+    """列表与详情接口返回的构建字段"""
+    return {
+        'id': str(obj.uuid),
+        'buildId': obj.properties.get('buildId'),
+        'userId': obj.properties.get('userId'),
+        'accountId': obj.properties.get('accountId'),
+        'timestamp': obj.properties.get('timestamp'),
+        'frontImageUrl': obj.properties.get('frontImageUrl'),
+        'backImageUrl': obj.properties.get('backImageUrl'),
+        'textureUrl': obj.properties.get('textureUrl'),
+        'modelUrl': obj.properties.get('modelUrl'),
+        'status': obj.properties.get('status'),
+        'processingTimeMs': obj.properties.get('processingTimeMs'),
+        'errorMessage': obj.properties.get('errorMessage')
+    }
+
+def query_builds(client, tenant, filters, limit, cursor, offset, total_mode, count_key):
+    """键集分页查询一页构建及可选总数（在Weaviate线程池中执行）"""
+    collection = tenancy.readable(client, tenant)
+    if collection is None:
+        # 租户尚不存在：该用户还没有构建
+        return [], None, 0 if total_mode else None
+    objects, next_cursor = fetch_page(collection, filters, limit, cursor, offset=offset)
+    total = count_objects(collection, filters, total_mode, count_key)
+    return [build_summary(obj) for obj in objects], next_cursor, total
+
+@app.get('/api/builds')
+async def get_builds(
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    total: Optional[str] = None,
+    offset: int = 0,
+    days: int = 7
+):
     """获取构建列表
     
     Query参数:
-    - user_id: 用户ID（可选）
+    - user_id: 用户ID（可选；启用多租户时必需，account模式下可只传account_id）
+    - account_id: 账户ID（可选，仅account模式）
     - status: 状态过滤 pending/processing/completed/failed（可选）
     - limit: 返回数量限制（默认10，最大100）
-    - offset: 偏移量（默认0）
+    - cursor: 上一页返回的next游标（可选），按timestamp倒序做键集分页，每页代价恒定
+    - total: exact返回精确总数，estimate返回缓存的近似总数（可选）
+    - offset: 偏移量（仅兼容旧客户端，只作用于第一页）
     - days: 时间范围（天数，默认7）
     """
-    user_id = request.args.get('user_id')
-    status = request.args.get('status')
-    limit = min(int(request.args.get('limit', 10)), 100)
-    offset = int(request.args.get('offset', 0))
-    days = int(request.args.get('days', 7))
+    limit = min(limit, 100)
     
     try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
+        tenant = tenancy.tenant(user_id, account_id)
         
         # 构建过滤条件
         filters = []
@@ -57,8 +163,8 @@ def get_builds():
             Filter.by_property("timestamp").greater_or_equal(start_date)
         )
         
-        # 用户ID过滤
-        if user_id:
+        # 用户ID过滤（每用户一个租户时由租户隔离，无需过滤）
+        if user_id and not tenancy.per_user:
             filters.append(
                 Filter.by_property("userId").equal(user_id)
             )
@@ -74,240 +180,388 @@ def get_builds():
         for f in filters[1:]:
             combined_filter = combined_filter & f
         
-        # 查询
-        result = collection.query.fetch_objects(
-            filters=combined_filter,
-            limit=limit,
-            offset=offset
+        # 键集分页查询
+        builds, next_cursor, total_count = await weaviate_db.run(
+            query_builds, tenant, combined_filter, limit, cursor, offset, total,
+            f"{tenant}:{user_id}:{status}:{days}"
         )
         
-        # 格式化结果
-        builds = []
-        for obj in result.objects:
-            builds.append({
-                'id': str(obj.uuid),
-                'buildId': obj.properties.get('buildId'),
-                'userId': obj.properties.get('userId'),
-                'timestamp': obj.properties.get('timestamp'),
-                'frontImageUrl': obj.properties.get('frontImageUrl'),
-                'backImageUrl': obj.properties.get('backImageUrl'),
-                'textureUrl': obj.properties.get('textureUrl'),
-                'modelUrl': obj.properties.get('modelUrl'),
-                'status': obj.properties.get('status'),
-                'processingTimeMs': obj.properties.get('processingTimeMs'),
-                'errorMessage': obj.properties.get('errorMessage')
-            })
-        
-        client.close()
-        
-        return jsonify({
+        return {
             'success': True,
             'data': builds,
             'count': len(builds),
+            'total': total_count,
             'limit': limit,
-            'offset': offset
-        })
+            'next': next_cursor
+        }
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
-
-@app.route('/api/builds/<build_id>', methods=['GET'])
-def get_build(build_id):
-    """获取单个构建详情"""
-    try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        result = collection.query.fetch_objects(
-            filters=Filter.by_property("buildId").equal(build_id),
-            limit=1
-        )
-        
-        if not result.objects:
-            client.close()
-            return jsonify({
-                'success': False,
-                'error': 'Build not found'
-            }), 404
-        
-        obj = result.objects[0]
-        build = {
+        return failure(e)
+
+def nearest_builds(client, tenant, build_id, vector, limit, certainty):
+    """对HNSW索引执行near_vector；传入build_id时复用该构建已存储的向量（在Weaviate线程池中执行）"""
+    collection = tenancy.readable(client, tenant)
+    if collection is None:
+        return None if build_id else []
+    if build_id:
+        source = fetch_build_object(collection, build_id, include_vector=True)
+        vector = source.vector.get('default') if source else None
+        if not vector:
+            return None
+    
+    result = collection.query.near_vector(
+        near_vector=vector,
+        limit=limit,
+        certainty=certainty,
+        return_metadata=MetadataQuery(certainty=True)
+    )
+    
+    builds = []
+    for obj in result.objects:
+        builds.append({
             'id': str(obj.uuid),
             'buildId': obj.properties.get('buildId'),
             'userId': obj.properties.get('userId'),
+            'accountId': obj.properties.get('accountId'),
             'timestamp': obj.properties.get('timestamp'),
             'frontImageUrl': obj.properties.get('frontImageUrl'),
             'backImageUrl': obj.properties.get('backImageUrl'),
             'textureUrl': obj.properties.get('textureUrl'),
             'modelUrl': obj.properties.get('modelUrl'),
             'status': obj.properties.get('status'),
-            'processingTimeMs': obj.properties.get('processingTimeMs'),
-            'errorMessage': obj.properties.get('errorMessage')
-        }
-        
-        client.close()
-        
-        return jsonify({
-            'success': True,
-            'data': build
+            'similarity': obj.metadata.certainty if hasattr(obj.metadata, 'certainty') else None
         })
-        
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return builds
+
+async def check_public_url(url):
+    """只允许http(s)且解析到公网地址的URL，避免通过image_url访问内网或本机服务"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('image_url must be an http(s) URL')
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    try:
+        infos = await asyncio.to_thread(socket.getaddrinfo, parts.hostname, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise ValueError('image_url host cannot be resolved')
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not address.is_global:
+            raise ValueError('image_url must point to a public host')
 
-@app.route('/api/builds/search/similar', methods=['POST'])
-def search_similar_builds():
+async def fetch_search_image(url):
+    """流式下载搜索图片，超过SEARCH_IMAGE_MAX_BYTES立即中止并返回None；不跟随重定向"""
+    await check_public_url(url)
+    async with image_http.stream('GET', url, timeout=SEARCH_IMAGE_TIMEOUT, follow_redirects=False) as response:
+        response.raise_for_status()
+        if int(response.headers.get('content-length') or 0) > SEARCH_IMAGE_MAX_BYTES:
+            return None
+        chunks = []
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > SEARCH_IMAGE_MAX_BYTES:
+                return None
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+@app.post('/api/builds/search/similar')
+async def search_similar_builds(data: dict = Body(default={})):
     """通过图片向量相似度搜索
     
-    Body:
+    查询向量由本地模型计算，再对集合的HNSW索引执行near_vector；
+    启用多租户时在user_id（或account_id）对应租户内搜索
+    
+    Body（三选一）:
     {
         "image_url": "https://example.com/image.png",
+        "image_base64": "<base64编码的图片>",
+        "build_id": "build_123",
+        "user_id": "user_001",  # 启用多租户时必需
         "limit": 5,
         "certainty": 0.7
     }
     """
-    data = request.json
     image_url = data.get('image_url')
+    image_base64 = data.get('image_base64')
+    build_id = data.get('build_id')
     limit = min(int(data.get('limit', 5)), 20)
     certainty = float(data.get('certainty', 0.7))
     
-    if not image_url:
-        return jsonify({
-            'success': False,
-            'error': 'image_url is required'
-        }), 400
+    if not (image_url or image_base64 or build_id):
+        return error('image_url, image_base64 or build_id is required', 400)
+    
+    if not build_id and image_embedder is None:
+        return error('Image embeddings are not configured (EMBEDDING_MODEL_PATH)', 503)
     
     try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
+        tenant = tenancy.tenant(data.get('user_id'), data.get('account_id'))
         
-        # 向量搜索
-        result = collection.query.near_image(
-            near_image=image_url,
-            limit=limit,
-            certainty=certainty
-        )
-        
-        # 格式化结果
-        builds = []
-        for obj in result.objects:
-            builds.append({
-                'id': str(obj.uuid),
-                'buildId': obj.properties.get('buildId'),
-                'userId': obj.properties.get('userId'),
-                'timestamp': obj.properties.get('timestamp'),
-                'frontImageUrl': obj.properties.get('frontImageUrl'),
-                'backImageUrl': obj.properties.get('backImageUrl'),
-                'textureUrl': obj.properties.get('textureUrl'),
-                'modelUrl': obj.properties.get('modelUrl'),
-                'status': obj.properties.get('status'),
-                'similarity': obj.metadata.certainty if hasattr(obj.metadata, 'certainty') else None
-            })
+        # 查询向量：已有构建直接复用存储的向量，否则现算图片向量（按内容哈希缓存，与并发请求合批）
+        vector = None
+        if not build_id:
+            if image_base64:
+                image = base64.b64decode(image_base64)
+            else:
+                image = await fetch_search_image(image_url)
+            if image is None or len(image) > SEARCH_IMAGE_MAX_BYTES:
+                return error('Image is too large', 413)
+            vector = (await image_embedder.embed([image]))[0]
         
-        client.close()
+        # 向量搜索
+        builds = await weaviate_db.run(nearest_builds, tenant, build_id, vector, limit, certainty)
+        if builds is None:
+            return error('Build not found or has no embedding', 404)
         
-        return jsonify({
+        return {
             'success': True,
             'data': builds,
             'count': len(builds)
-        })
+        }
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        return failure(e)
 
-@app.route('/api/builds/stats', methods=['GET'])
-def get_stats():
-    """获取构建统计信息
+# 统计缓存：已结束的日期桶很少变化，长时间缓存；当天的桶按短TTL刷新
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "60"))
+STATS_CLOSED_DAY_TTL = float(os.getenv("STATS_CLOSED_DAY_TTL", "3600"))
+STATS_CACHE_SIZE = int(os.getenv("STATS_CACHE_SIZE", "5000"))
+# 每个未缓存的日期都要一次聚合查询，限制窗口长度避免单个请求打出成百上千次查询
+STATS_MAX_DAYS = int(os.getenv("STATS_MAX_DAYS", "365"))
+BUILD_STATUSES = ('pending', 'processing', 'completed', 'failed')
+
+def aggregate_builds(collection, filters):
+    """按status分组的服务端聚合：数量及processingTimeMs的均值/最小/最大值"""
+    response = collection.aggregate.over_all(
+        filters=filters,
+        group_by=GroupByAggregate(prop="status"),
+        total_count=True,
+        return_metrics=Metrics("processingTimeMs").integer(count=True, mean=True, minimum=True, maximum=True)
+    )
     
-    Query参数:
-    - user_id: 用户ID（可选）
-    - days: 时间范围（天数，默认30）
+    groups = {}
+    for group in response.groups:
+        metrics = group.properties.get("processingTimeMs")
+        groups[group.grouped_by.value] = {
+            'count': group.total_count or 0,
+            'timed': (metrics.count or 0) if metrics else 0,
+            'mean': metrics.mean if metrics else None,
+            'min': metrics.minimum if metrics else None,
+            'max': metrics.maximum if metrics else None
+        }
+    return groups
+
+def merge_groups(buckets):
+    """合并多个分组聚合结果（按计时样本数加权平均）"""
+    merged = {}
+    for groups in buckets:
+        for status, g in groups.items():
+            m = merged.setdefault(status, {'count': 0, 'timed': 0, 'sum': 0.0, 'min': None, 'max': None})
+            m['count'] += g['count']
+            if g['timed'] and g['mean'] is not None:
+                m['timed'] += g['timed']
+                m['sum'] += g['mean'] * g['timed']
+                m['min'] = g['min'] if m['min'] is None else min(m['min'], g['min'])
+                m['max'] = g['max'] if m['max'] is None else max(m['max'], g['max'])
+    return {
+        status: {
+            'count': m['count'],
+            'timed': m['timed'],
+            'mean': m['sum'] / m['timed'] if m['timed'] else None,
+            'min': m['min'],
+            'max': m['max']
+        }
+        for status, m in merged.items()
+    }
+
+def summarize(groups):
+    """把分组聚合转换为接口返回的统计格式"""
+    total = sum(g['count'] for g in groups.values())
+    overall = merge_groups([{'all': g} for g in groups.values()]).get('all', {})
+    completed = groups.get('completed', {}).get('count', 0)
+    summary = {'total': total}
+    for status in BUILD_STATUSES:
+        summary[status] = groups.get(status, {}).get('count', 0)
+    summary.update({
+        'successRate': round(completed / total * 100, 2) if total > 0 else 0,
+        'avgProcessingTimeMs': round(overall['mean'], 2) if overall.get('mean') is not None else 0,
+        'minProcessingTimeMs': overall.get('min'),
+        'maxProcessingTimeMs': overall.get('max')
+    })
+    return summary
+
+class DailyStatsCache:
+    """按(租户, 用户, 日期)缓存每日聚合结果，滚动窗口由日期桶合并而成
+    
+    仪表盘轮询时只有过期的桶（通常只有当天）会重新查询Weaviate。
     """
-    user_id = request.args.get('user_id')
-    days = int(request.args.get('days', 30))
     
-    try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        # 时间范围过滤
-        start_date = datetime.now() - timedelta(days=days)
-        filters = Filter.by_property("timestamp").greater_or_equal(start_date)
+    def __init__(self, ttl, closed_day_ttl, max_entries):
+        self.ttl = ttl
+        self.closed_day_ttl = closed_day_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def daily(self, collection, user_id, days, refresh=False, tenant=None):
+        """返回最近days天（含今天）的[(日期, 分组聚合)]，按日期升序；collection为None（租户不存在）时各天为空"""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        buckets = []
+        for offset in range(days - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            groups = self._bucket(collection, tenant, user_id, day, offset == 0, refresh) if collection is not None else {}
+            buckets.append((day.date().isoformat(), groups))
+        return buckets
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRatio': round(self.hits / lookups, 3) if lookups else 0
+        }
+    
+    def _bucket(self, collection, tenant, user_id, day, is_today, refresh):
+        key = (tenant, user_id, day.date())
+        ttl = self.ttl if is_today else self.closed_day_ttl
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not refresh and now - entry[0] < ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
         
-        if user_id:
+        filters = (
+            Filter.by_property("timestamp").greater_or_equal(day)
+            & Filter.by_property("timestamp").less_than(day + timedelta(days=1))
+        )
+        if user_id and not tenancy.per_user:
             filters = filters & Filter.by_property("userId").equal(user_id)
+        groups = aggregate_builds(collection, filters)
         
-        # 获取所有记录
-        result = collection.query.fetch_objects(
-            filters=filters,
-            limit=1000  # 假设不会超过1000条
+        with self._lock:
+            self._entries[key] = (now, groups)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return groups
+
+stats_cache = DailyStatsCache(STATS_CACHE_TTL, STATS_CLOSED_DAY_TTL, STATS_CACHE_SIZE)
+
+@app.get('/api/builds/stats')
+async def get_stats(
+    user_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+    days: int = Query(30, ge=1, le=STATS_MAX_DAYS),
+    refresh: Optional[str] = None
+):
+    """获取构建统计信息
+    
+    由Weaviate聚合查询按status分组计算（不再拉取对象），并按天缓存。
+    
+    Query参数:
+    - user_id: 用户ID（可选；启用多租户时必需，account模式下可只传account_id）
+    - account_id: 账户ID（可选，仅account模式）
+    - days: 时间范围（天数，默认30，范围1~STATS_MAX_DAYS，按自然日对齐，含今天）
+    - refresh: 为1时忽略缓存重新聚合（可选）
+    """
+    try:
+        tenant = tenancy.tenant(user_id, account_id)
+        buckets = await weaviate_db.run(
+            lambda client: stats_cache.daily(tenancy.readable(client, tenant), user_id, days, refresh == '1', tenant)
         )
         
-        # 计算统计信息
-        total = len(result.objects)
-        completed = sum(1 for obj in result.objects if obj.properties.get('status') == 'completed')
-        failed = sum(1 for obj in result.objects if obj.properties.get('status') == 'failed')
-        processing = sum(1 for obj in result.objects if obj.properties.get('status') == 'processing')
-        pending = sum(1 for obj in result.objects if obj.properties.get('status') == 'pending')
-        
-        # 平均处理时间
-        processing_times = [obj.properties.get('processingTimeMs') for obj in result.objects 
-                          if obj.properties.get('processingTimeMs') is not None]
-        avg_processing_time = sum(processing_times) / len(processing_times) if processing_times else 0
-        
-        client.close()
+        # 窗口统计由每日分组聚合合并得到
+        groups = merge_groups(groups for _, groups in buckets)
+        data = summarize(groups)
+        data.update({
+            'byStatus': {
+                status: {
+                    'count': g['count'],
+                    'avgProcessingTimeMs': round(g['mean'], 2) if g['mean'] is not None else None,
+                    'minProcessingTimeMs': g['min'],
+                    'maxProcessingTimeMs': g['max']
+                }
+                for status, g in groups.items()
+            },
+            'daily': [dict(summarize(day_groups), date=date) for date, day_groups in buckets],
+            'timeRangeDays': days,
+            'cache': stats_cache.stats()
+        })
         
-        return jsonify({
+        return {
             'success': True,
-            'data': {
-                'total': total,
-                'completed': completed,
-                'failed': failed,
-                'processing': processing,
-                'pending': pending,
-                'successRate': round(completed / total * 100, 2) if total > 0 else 0,
-                'avgProcessingTimeMs': round(avg_processing_time, 2),
-                'timeRangeDays': days
-            }
-        })
+            'data': data
+        }
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    """健康检查"""
+        return failure(e)
+
+def load_build(client, tenant, build_id):
+    """从Weaviate读取单个构建（缓存未命中时调用）"""
+    collection = tenancy.readable(client, tenant)
+    if collection is None:
+        return None
+    # 构建对象以generate_uuid5(buildId)为ID，直接按ID读取；更早写入的随机UUID记录按buildId查询
+    obj = fetch_build_object(collection, build_id)
+    return build_summary(obj) if obj is not None else None
+
+# 放在/api/builds/stats之后注册，避免stats被当作build_id匹配
+@app.get('/api/builds/{build_id}')
+async def get_build(build_id: str, user_id: Optional[str] = None, account_id: Optional[str] = None):
+    """获取单个构建详情
+    
+    前端在构建过程中会轮询此接口，结果经读穿缓存返回，命中时不访问Weaviate。
+    启用多租户时需传入user_id（或account_id）以定位租户。
+    """
     try:
-        client = get_weaviate_client()
-        is_ready = client.is_ready()
-        client.close()
+        tenant = tenancy.tenant(user_id, account_id)
+        build = build_cache.lookup(build_id)
+        if build is not None and tenancy.tenant_of(build) != tenant:
+            # 缓存按buildId共享，不返回其他租户的构建
+            build = None
+        if build is None:
+            build = await weaviate_db.run(load_build, tenant, build_id)
+            if build is not None:
+                build = jsonable_encoder(build)
+                build_cache.put(build_id, build)
         
-        return jsonify({
-            'status': 'healthy' if is_ready else 'unhealthy',
-            'weaviate': 'connected' if is_ready else 'disconnected'
-        }), 200 if is_ready else 503
+        if build is None:
+            return error('Build not found', 404)
+        
+        return {
+            'success': True,
+            'data': build
+        }
         
     except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 503
+        return failure(e)
+
+@app.get('/health')
+async def health_check():
+    """健康检查（连接状态按WEAVIATE_HEALTH_TTL缓存）"""
+    health = await weaviate_db.health()
+    is_ready = health['status'] == 'connected'
+    
+    body = {
+        'status': 'healthy' if is_ready else 'unhealthy',
+        'weaviate': 'connected' if is_ready else 'disconnected',
+        'buildCache': build_cache.stats(),
+        'tenancy': tenancy.stats(),
+        'pool': weaviate_db.stats()
+    }
+    if not is_ready:
+        body['error'] = health['status']
+    return JSONResponse(body, status_code=200 if is_ready else 503)
 
 if __name__ == '__main__':
     print("🚀 启动Weaviate查询API")
-    print(f"📍 Weaviate: {WEAVIATE_HOST}:{WEAVIATE_PORT}")
+    print(f"📍 Weaviate Cloud: {WEAVIATE_GRPC_ENDPOINT}")
+    print(f"🌐 服务端口: {PORT}，工作进程: {API_WORKERS}")
     print("\n可用端点:")
     print("  GET  /api/builds - 获取构建列表")
     print("  GET  /api/builds/<build_id> - 获取构建详情")
@@ -316,4 +570,5 @@ if __name__ == '__main__':
     print("  GET  /health - 健康检查")
     print("\n" + "=" * 50)
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # 多进程生产服务器；每个进程独立的事件循环与共享Weaviate连接
+    uvicorn.run("weaviate_api:app", host='0.0.0.0', port=PORT, workers=API_WORKERS)
@@ -0,0 +1,565 @@
+"""Weaviate Schema版本迁移工具
+
+weaviate_schema.create_schema只在集合不存在时创建，已上线的集合收不到后续的schema调整。
+本工具为TshirtBuild维护版本号（记录在SchemaMigration集合中），按顺序执行未应用的迁移。
+
+Weaviate不支持修改已有属性的类型、分词方式和索引设置，所以涉及这些内容的迁移会重建集合:
+先把数据（含向量）复制到备份集合，再按新配置重建TshirtBuild并把数据复制回来（即重新建立索引）。
+重建期间写入会失败或丢失，请在维护窗口执行。
+
+版本:
+- v1: 初始schema（weaviate_schema.py最初的定义）
+- v2: 按查询方式调整索引
+  - timestamp/processingTimeMs/textureLatencyMs启用范围过滤索引，processingTimeMs改为INT（统计接口按整数聚合）
+  - buildId/userId/status等ID类字段使用field分词（整值精确匹配），只建过滤索引，不建BM25索引
+  - URL字段不参与向量化、不建索引
+  - 关闭不用的倒排索引选项（null状态、属性长度、内置时间戳）
+- v3: 新增accountId属性（按账户划分租户时使用）
+
+多租户（BUILD_TENANCY=user|account）: 每个用户（或账户）的构建存放在各自的租户中，
+查询只访问一个租户的分片和索引。是否多租户无法在已有集合上修改，tenancy命令重建集合，
+把已有对象按userId（或accountId）复制到对应租户；长期不活跃的租户可以设为INACTIVE
+（不占内存，访问时自动激活）或OFFLOADED（卸载到对象存储，需要offload-s3模块）。
+
+使用方法:
+    python weaviate_migrations.py status                  # 查看当前版本
+    python weaviate_migrations.py migrate --benchmark     # 迁移到最新版本，前后各测一次过滤查询延迟
+    python weaviate_migrations.py reindex                 # 按当前配置重建集合并重新索引已有数据
+    python weaviate_migrations.py bench --output before.json
+    python weaviate_migrations.py bench --baseline before.json
+    python weaviate_migrations.py tenancy --mode user --benchmark   # 把已有数据迁移到每用户一个租户
+    python weaviate_migrations.py tenants list
+    python weaviate_migrations.py tenants offload --idle-days 30 --to inactive
+    python weaviate_migrations.py tenants activate user_001
+"""
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import weaviate
+import weaviate.classes as wvc
+from weaviate.classes.aggregate import GroupByAggregate
+from weaviate.classes.query import Filter, Sort
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+import os
+
+from build_tenants import TENANCY_MODES, BuildTenancy
+
+# Weaviate连接配置
+WEAVIATE_GRPC_ENDPOINT = os.getenv("WEAVIATE_GRPC_ENDPOINT", "grpc-aoj6v69aspmruwn6zlgma.c0.europe-west3.gcp.weaviate.cloud")
+WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "N08rcE1Ua0pJTlB1RVh0cF9XeEJjMVRGZE5MdjF1YkpqanZKc1RHaTV3ajc4c3BaOEZiOTA5ZXBlay9nPV92MjAw")
+
+COLLECTION = "TshirtBuild"
+VERSION_COLLECTION = "SchemaMigration"
+COPY_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "200"))
+# 缺少userId的对象迁移到多租户集合时放入此租户
+UNASSIGNED_TENANT = "unassigned"
+READABLE_STATUSES = (TenantActivityStatus.ACTIVE, TenantActivityStatus.INACTIVE)
+
+def get_weaviate_client():
+    """获取Weaviate客户端"""
+    return weaviate.connect_to_weaviate_cloud(
+        cluster_url=f"https://{WEAVIATE_GRPC_ENDPOINT.replace('grpc-', '')}",
+        auth_credentials=wvc.init.Auth.api_key(WEAVIATE_API_KEY)
+    )
+
+def id_property(name, description):
+    """ID/枚举类文本：整值精确匹配，只建过滤索引"""
+    return wvc.config.Property(
+        name=name,
+        description=description,
+        data_type=wvc.config.DataType.TEXT,
+        tokenization=wvc.config.Tokenization.FIELD,
+        index_filterable=True,
+        index_searchable=False,
+        skip_vectorization=True
+    )
+
+def url_property(name, description):
+    """URL：只随对象返回，不参与向量化也不建索引"""
+    return wvc.config.Property(
+        name=name,
+        description=description,
+        data_type=wvc.config.DataType.TEXT,
+        index_filterable=False,
+        index_searchable=False,
+        skip_vectorization=True
+    )
+
+def range_property(name, description, data_type):
+    """列表/统计按范围过滤的字段：启用范围过滤索引"""
+    return wvc.config.Property(
+        name=name,
+        description=description,
+        data_type=data_type,
+        index_filterable=True,
+        index_range_filters=True
+    )
+
+def message_property(name, description):
+    """错误信息：按词检索，不做过滤"""
+    return wvc.config.Property(
+        name=name,
+        description=description,
+        data_type=wvc.config.DataType.TEXT,
+        tokenization=wvc.config.Tokenization.WORD,
+        index_filterable=False,
+        index_searchable=True,
+        skip_vectorization=True
+    )
+
+def build_properties():
+    """最新版本（v2）的TshirtBuild属性定义"""
+    return [
+        id_property("buildId", "构建的唯一标识符"),
+        id_property("userId", "用户ID"),
+        id_property("accountId", "账户ID（按账户划分租户时使用）"),
+        id_property("status", "构建状态: pending/processing/completed/failed"),
+        id_property("textureBackend", "生成纹理的后端: remote/local"),
+        range_property("timestamp", "构建创建时间", wvc.config.DataType.DATE),
+        range_property("processingTimeMs", "处理时间（毫秒）", wvc.config.DataType.INT),
+        range_property("textureLatencyMs", "纹理生成耗时（毫秒）", wvc.config.DataType.INT),
+        # 构建服务写入的ISO 8601字符串，按字典序即时间序，可排序和过滤
+        id_property("createdAt", "创建时间（ISO 8601）"),
+        id_property("updatedAt", "更新时间（ISO 8601）"),
+        id_property("completedAt", "完成时间（ISO 8601）"),
+        id_property("failedAt", "失败时间（ISO 8601）"),
+        url_property("frontImageUrl", "前面图片的URL（可以是临时URL）"),
+        url_property("backImageUrl", "后面图片的URL（可以是临时URL）"),
+        url_property("textureUrl", "生成的纹理图片URL（24小时过期）"),
+        url_property("modelUrl", "生成的带纹理模型URL（24小时过期）"),
+        message_property("errorMessage", "错误信息（如果失败）"),
+        message_property("error", "错误信息（集成部署写入）"),
+    ]
+
+def create_build_collection(client, name=COLLECTION, multi_tenant=False):
+    """按最新配置创建TshirtBuild集合；多租户时租户由首次批量写入自动创建，访问时自动激活"""
+    return client.collections.create(
+        name=name,
+        description="存储T恤纹理构建的元数据和向量",
+        properties=build_properties(),
+        # 不使用向量化模块：图片向量由image_embeddings在构建时本地计算后随对象写入
+        vectorizer_config=wvc.config.Configure.Vectorizer.none(),
+        vector_index_config=wvc.config.Configure.VectorIndex.hnsw(
+            distance_metric=wvc.config.VectorDistances.COSINE,
+            ef_construction=128,
+            max_connections=64
+        ),
+        # 查询不使用这些内置索引，关闭以减少写入和存储开销
+        inverted_index_config=wvc.config.Configure.inverted_index(
+            index_null_state=False,
+            index_property_length=False,
+            index_timestamps=False
+        ),
+        multi_tenancy_config=wvc.config.Configure.multi_tenancy(
+            enabled=True,
+            auto_tenant_creation=True,
+            auto_tenant_activation=True
+        ) if multi_tenant else None
+    )
+
+def is_multi_tenant(client, name=COLLECTION):
+    config = client.collections.get(name).config.get()
+    return bool(config.multi_tenancy_config and config.multi_tenancy_config.enabled)
+
+def tenant_handles(client, name):
+    """[(租户名, 集合句柄)]；非多租户集合为[(None, 集合)]。已卸载的租户需先激活"""
+    collection = client.collections.get(name)
+    if not is_multi_tenant(client, name):
+        return [(None, collection)]
+    handles = []
+    for tenant in collection.tenants.get().values():
+        if tenant.activity_status not in READABLE_STATUSES:
+            raise RuntimeError(f"租户 {tenant.name} 处于 {tenant.activity_status.value}，请先执行 tenants activate")
+        handles.append((tenant.name, collection.with_tenant(tenant.name)))
+    return handles
+
+def convert_v2(properties):
+    """v2数据转换：毫秒字段由NUMBER改为INT"""
+    for name in ("processingTimeMs", "textureLatencyMs"):
+        if properties.get(name) is not None:
+            properties[name] = int(round(properties[name]))
+    return properties
+
+def copy_objects(client, source_name, target_name, convert=None, tenant_of=None):
+    """按游标遍历源集合（逐个租户），把对象（含向量，保持UUID）批量写入目标集合，返回复制数量
+    
+    tenant_of(properties, 源租户)给出目标租户（目标非多租户时返回None）；不传时保持源租户。
+    """
+    target = client.collections.get(target_name)
+    created_tenants = set()
+    copied = 0
+    with client.batch.fixed_size(batch_size=COPY_BATCH_SIZE) as batch:
+        for source_tenant, source in tenant_handles(client, source_name):
+            for obj in source.iterator(include_vector=True):
+                properties = dict(obj.properties)
+                if convert:
+                    properties = convert(properties)
+                tenant = tenant_of(properties, source_tenant) if tenant_of else source_tenant
+                if tenant and tenant not in created_tenants:
+                    target.tenants.create([Tenant(name=tenant)])
+                    created_tenants.add(tenant)
+                vector = obj.vector.get("default") if obj.vector else None
+                batch.add_object(
+                    collection=target_name, properties=properties, uuid=obj.uuid, vector=vector, tenant=tenant
+                )
+                copied += 1
+                if copied % 1000 == 0:
+                    print(f"   已复制 {copied} 条")
+    failed = client.batch.failed_objects
+    if failed:
+        raise RuntimeError(f"{len(failed)} 条对象复制失败，例如: {failed[0].message}")
+    return copied
+
+def count_objects(client, name=COLLECTION):
+    """对象总数（多租户集合为各租户之和）"""
+    return sum(
+        collection.aggregate.over_all(total_count=True).total_count or 0
+        for _, collection in tenant_handles(client, name)
+    )
+
+def rebuild_collection(client, convert=None, keep_backup=False, tenancy_mode=None):
+    """重建TshirtBuild：备份 → 按最新配置重建 → 复制回来（重新建立全部索引）
+    
+    tenancy_mode为None时保持原有的多租户设置；为user/account时按该方式把对象分配到租户，为off时合并为单一集合。
+    """
+    multi_tenant = is_multi_tenant(client) if tenancy_mode is None else tenancy_mode != "off"
+    backup_name = f"{COLLECTION}Backup{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+    # 备份集合沿用旧配置（包括租户），出问题时可以原样恢复
+    config = client.collections.get(COLLECTION).config.get().to_dict()
+    config["class"] = backup_name
+    client.collections.create_from_dict(config)
+
+    print(f"📦 备份到 {backup_name}...")
+    total = count_objects(client)
+    copied = copy_objects(client, COLLECTION, backup_name)
+    if copied != total or count_objects(client, backup_name) != total:
+        raise RuntimeError(f"备份数量不一致（源 {total}，备份 {count_objects(client, backup_name)}），已中止，原集合未改动")
+
+    tenant_of = None
+    if not multi_tenant:
+        tenant_of = lambda properties, source_tenant: None
+    elif tenancy_mode is not None:
+        tenancy = BuildTenancy(tenancy_mode)
+        tenant_of = lambda properties, source_tenant: tenancy.tenant_of(properties) or UNASSIGNED_TENANT
+
+    print(f"🔨 按新配置重建 {COLLECTION}{'（多租户）' if multi_tenant else ''}...")
+    client.collections.delete(COLLECTION)
+    create_build_collection(client, multi_tenant=multi_tenant)
+
+    print(f"📥 复制 {copied} 条数据并重新建立索引...")
+    copy_objects(client, backup_name, COLLECTION, convert, tenant_of)
+    restored = count_objects(client)
+    if restored != total:
+        raise RuntimeError(f"重建后数量不一致（期望 {total}，实际 {restored}），备份保留在 {backup_name}")
+
+    if keep_backup:
+        print(f"💾 备份保留在 {backup_name}")
+    else:
+        client.collections.delete(backup_name)
+    return restored
+
+def migration_2(client, keep_backup=False):
+    rebuild_collection(client, convert=convert_v2, keep_backup=keep_backup)
+
+def migration_3(client, keep_backup=False):
+    # 新增属性不需要重建；v2重建时已按最新属性创建的集合跳过
+    collection = client.collections.get(COLLECTION)
+    if "accountId" not in {p.name for p in collection.config.get().properties}:
+        collection.config.add_property(id_property("accountId", "账户ID（按账户划分租户时使用）"))
+
+# 版本号 -> (说明, 迁移函数)；v1为初始schema，无需迁移函数
+MIGRATIONS = {
+    2: ("范围过滤索引、ID字段field分词、URL不向量化、processingTimeMs改为INT", migration_2),
+    3: ("新增accountId属性", migration_3),
+}
+SCHEMA_VERSION = max(MIGRATIONS)
+
+def ensure_version_collection(client):
+    if not client.collections.exists(VERSION_COLLECTION):
+        client.collections.create(
+            name=VERSION_COLLECTION,
+            description="Schema迁移记录",
+            properties=[
+                id_property("collection", "集合名称"),
+                wvc.config.Property(name="version", data_type=wvc.config.DataType.INT),
+                wvc.config.Property(name="description", data_type=wvc.config.DataType.TEXT),
+                wvc.config.Property(name="appliedAt", data_type=wvc.config.DataType.DATE),
+                wvc.config.Property(name="durationMs", data_type=wvc.config.DataType.INT),
+            ],
+            vectorizer_config=wvc.config.Configure.Vectorizer.none()
+        )
+    return client.collections.get(VERSION_COLLECTION)
+
+def current_version(client):
+    """当前schema版本：0为集合不存在，已存在但没有迁移记录的视为v1"""
+    if not client.collections.exists(COLLECTION):
+        return 0
+    if not client.collections.exists(VERSION_COLLECTION):
+        return 1
+    response = client.collections.get(VERSION_COLLECTION).query.fetch_objects(
+        filters=Filter.by_property("collection").equal(COLLECTION),
+        sort=Sort.by_property("version", ascending=False),
+        limit=1
+    )
+    return response.objects[0].properties["version"] if response.objects else 1
+
+def record_version(client, version, description, duration_ms):
+    ensure_version_collection(client).data.insert({
+        "collection": COLLECTION,
+        "version": version,
+        "description": description,
+        "appliedAt": datetime.now(timezone.utc),
+        "durationMs": duration_ms
+    })
+
+def migrate(client, target=SCHEMA_VERSION, dry_run=False, keep_backup=False):
+    """执行current_version之后、target及之前的迁移；新库直接按最新配置创建"""
+    version = current_version(client)
+    if version == 0:
+        multi_tenant = BuildTenancy.from_env().enabled
+        print(f"📝 {COLLECTION}不存在，按v{SCHEMA_VERSION}配置创建{'（多租户）' if multi_tenant else ''}")
+        if not dry_run:
+            create_build_collection(client, multi_tenant=multi_tenant)
+            record_version(client, SCHEMA_VERSION, "初始创建", 0)
+        return SCHEMA_VERSION
+
+    pending = [v for v in sorted(MIGRATIONS) if version < v <= target]
+    if not pending:
+        print(f"✅ {COLLECTION}已是v{version}，无需迁移")
+        return version
+
+    for v in pending:
+        description, apply = MIGRATIONS[v]
+        print(f"🚚 v{version} → v{v}: {description}")
+        if dry_run:
+            continue
+        started = time.perf_counter()
+        apply(client, keep_backup=keep_backup)
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        record_version(client, v, description, duration_ms)
+        print(f"✅ 已迁移到v{v}（{duration_ms} ms）")
+        version = v
+    return version
+
+def reindex(client, keep_backup=False):
+    """不改版本，按当前代码中的配置重建集合并重新索引全部数据"""
+    print(f"🔁 重新索引 {COLLECTION}（v{current_version(client)}）")
+    rebuild_collection(client, convert=convert_v2, keep_backup=keep_backup)
+
+def sample_user(collection):
+    """任取一个构建的属性（基准测试以它的用户为查询对象）"""
+    sample = collection.query.fetch_objects(limit=1).objects
+    return dict(sample[0].properties) if sample else {}
+
+def switch_tenancy(client, mode, keep_backup=False):
+    """按mode重建集合：user/account时把已有对象复制到各自的租户，off时合并回单一集合"""
+    print(f"🏘️  {COLLECTION} 切换为 BUILD_TENANCY={mode}")
+    rebuild_collection(client, convert=convert_v2, keep_backup=keep_backup, tenancy_mode=mode)
+    print(f"✅ 已完成，请把各服务的BUILD_TENANCY设为 {mode}")
+
+def is_idle(collection, idle_days):
+    """租户最近idle_days天内没有新构建（n8n写入timestamp，构建服务写入createdAt字符串，两者都检查）"""
+    recent = collection.query.fetch_objects(
+        filters=Filter.by_property("timestamp").greater_or_equal(datetime.now(timezone.utc) - timedelta(days=idle_days)),
+        limit=1
+    )
+    if recent.objects:
+        return False
+    recent = collection.query.fetch_objects(
+        filters=Filter.by_property("createdAt").greater_or_equal((datetime.now() - timedelta(days=idle_days)).isoformat()),
+        limit=1
+    )
+    return not recent.objects
+
+def offload_idle_tenants(client, idle_days, status=TenantActivityStatus.INACTIVE, dry_run=False):
+    """把idle_days天内没有新构建的活跃租户设为INACTIVE（释放内存）或OFFLOADED（移到对象存储），返回租户名"""
+    collection = client.collections.get(COLLECTION)
+    idle = [
+        name for name, tenant in collection.tenants.get().items()
+        if tenant.activity_status == TenantActivityStatus.ACTIVE and is_idle(collection.with_tenant(name), idle_days)
+    ]
+    if not dry_run:
+        for start in range(0, len(idle), 100):
+            collection.tenants.update([Tenant(name=name, activity_status=status) for name in idle[start:start + 100]])
+    return idle
+
+def activate_tenants(client, names):
+    """激活租户；已卸载的租户开始从对象存储恢复（ONLOADING），完成前不可读"""
+    client.collections.get(COLLECTION).tenants.update(
+        [Tenant(name=name, activity_status=TenantActivityStatus.ACTIVE) for name in names]
+    )
+
+def filter_queries(collection, user_id=None):
+    """列表和统计接口实际使用的过滤查询"""
+    now = datetime.now(timezone.utc)
+    week_ago = now - timedelta(days=7)
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if user_id is None:
+        user_id = sample_user(collection).get("userId", "")
+
+    # 毫秒字段迁移前为NUMBER，过滤值类型需与属性类型一致
+    data_types = {p.name: p.data_type for p in collection.config.get().properties}
+    slow = 5000 if data_types.get("processingTimeMs") == wvc.config.DataType.INT else 5000.0
+
+    recent = Filter.by_property("timestamp").greater_or_equal(week_ago)
+    return {
+        "list_recent": lambda: collection.query.fetch_objects(
+            filters=recent, sort=Sort.by_property("timestamp", ascending=False), limit=10
+        ),
+        "list_user_status": lambda: collection.query.fetch_objects(
+            filters=recent & Filter.by_property("userId").equal(user_id) & Filter.by_property("status").equal("completed"),
+            sort=Sort.by_property("timestamp", ascending=False),
+            limit=10
+        ),
+        "stats_day_by_status": lambda: collection.aggregate.over_all(
+            filters=Filter.by_property("timestamp").greater_or_equal(day_start)
+            & Filter.by_property("timestamp").less_than(day_start + timedelta(days=1)),
+            group_by=GroupByAggregate(prop="status"),
+            total_count=True
+        ),
+        "slow_builds": lambda: collection.query.fetch_objects(
+            filters=Filter.by_property("processingTimeMs").greater_than(slow), limit=10
+        ),
+    }
+
+def benchmark(client, runs=30, tenant=None, user_id=None):
+    """各过滤查询执行runs次（先预热一次），返回延迟统计（毫秒）；多租户集合在tenant（默认第一个租户）内查询"""
+    collection = client.collections.get(COLLECTION)
+    if is_multi_tenant(client):
+        if tenant is None:
+            tenant = next(iter(collection.tenants.get()), None)
+            if tenant is None:
+                raise RuntimeError("集合中还没有租户")
+        collection = collection.with_tenant(tenant)
+    else:
+        tenant = None
+    results = {}
+    for name, query in filter_queries(collection, user_id).items():
+        query()
+        latencies = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            query()
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        results[name] = {
+            "p50Ms": round(statistics.median(latencies), 2),
+            "p95Ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+            "meanMs": round(statistics.fmean(latencies), 2)
+        }
+    return {"version": current_version(client), "tenant": tenant, "runs": runs, "queries": results}
+
+def print_benchmark(result, baseline=None):
+    scope = f"，租户 {result['tenant']}" if result.get("tenant") else ""
+    print(f"\n⏱️  过滤查询延迟（v{result['version']}{scope}，每项 {result['runs']} 次）")
+    for name, stats in result["queries"].items():
+        line = f"   {name:<22} p50 {stats['p50Ms']:>8} ms   p95 {stats['p95Ms']:>8} ms"
+        before = (baseline or {}).get("queries", {}).get(name)
+        if before and stats["p50Ms"]:
+            line += f"   （v{baseline['version']} p50 {before['p50Ms']} ms，{before['p50Ms'] / stats['p50Ms']:.2f}x）"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="TshirtBuild schema迁移")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("status", help="显示当前schema版本")
+
+    migrate_parser = commands.add_parser("migrate", help="迁移到最新（或指定）版本")
+    migrate_parser.add_argument("--target", type=int, default=SCHEMA_VERSION)
+    migrate_parser.add_argument("--dry-run", action="store_true", help="只列出将执行的迁移")
+    migrate_parser.add_argument("--keep-backup", action="store_true", help="保留重建前的备份集合")
+    migrate_parser.add_argument("--benchmark", action="store_true", help="迁移前后各测一次过滤查询延迟")
+    migrate_parser.add_argument("--runs", type=int, default=30)
+
+    reindex_parser = commands.add_parser("reindex", help="按当前配置重建集合并重新索引")
+    reindex_parser.add_argument("--keep-backup", action="store_true")
+
+    bench_parser = commands.add_parser("bench", help="测量过滤查询延迟")
+    bench_parser.add_argument("--runs", type=int, default=30)
+    bench_parser.add_argument("--tenant", help="多租户集合中要测量的租户（默认第一个）")
+    bench_parser.add_argument("--output", help="把结果写入JSON文件")
+    bench_parser.add_argument("--baseline", help="与之前保存的结果对比")
+
+    tenancy_parser = commands.add_parser("tenancy", help="重建集合并把已有对象复制到每用户/每账户的租户")
+    tenancy_parser.add_argument("--mode", choices=TENANCY_MODES, required=True)
+    tenancy_parser.add_argument("--keep-backup", action="store_true")
+    tenancy_parser.add_argument("--benchmark", action="store_true", help="切换前后测量同一用户的查询延迟")
+    tenancy_parser.add_argument("--runs", type=int, default=30)
+
+    tenants_parser = commands.add_parser("tenants", help="查看、卸载或激活租户")
+    tenant_commands = tenants_parser.add_subparsers(dest="tenant_command", required=True)
+    tenant_commands.add_parser("list", help="列出租户及其状态")
+    offload_parser = tenant_commands.add_parser("offload", help="卸载长期没有新构建的租户")
+    offload_parser.add_argument("--idle-days", type=int, default=30)
+    offload_parser.add_argument("--to", choices=("inactive", "offloaded"), default="inactive",
+                                help="inactive: 留在本地磁盘、释放内存；offloaded: 移到对象存储（需offload-s3模块）")
+    offload_parser.add_argument("--dry-run", action="store_true")
+    activate_parser = tenant_commands.add_parser("activate", help="激活（或从对象存储恢复）租户")
+    activate_parser.add_argument("names", nargs="+")
+
+    args = parser.parse_args()
+    client = get_weaviate_client()
+    try:
+        if args.command == "status":
+            print(f"{COLLECTION}: v{current_version(client)}（最新 v{SCHEMA_VERSION}）")
+
+        elif args.command == "migrate":
+            before = benchmark(client, args.runs) if args.benchmark and not args.dry_run else None
+            migrate(client, args.target, args.dry_run, args.keep_backup)
+            if before:
+                print_benchmark(before)
+                print_benchmark(benchmark(client, args.runs), baseline=before)
+
+        elif args.command == "reindex":
+            reindex(client, args.keep_backup)
+
+        elif args.command == "bench":
+            baseline = None
+            if args.baseline:
+                with open(args.baseline) as f:
+                    baseline = json.load(f)
+            result = benchmark(client, args.runs, tenant=args.tenant)
+            print_benchmark(result, baseline)
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump(result, f, indent=2)
+
+        elif args.command == "tenancy":
+            before = sample = None
+            if args.benchmark:
+                # 以同一用户为对象：切换前在整个集合中按userId过滤，切换后只查询其租户
+                sample = sample_user(tenant_handles(client, COLLECTION)[0][1])
+                before = benchmark(client, args.runs, user_id=sample.get("userId", ""))
+            switch_tenancy(client, args.mode, args.keep_backup)
+            if before:
+                tenant = BuildTenancy(args.mode).tenant_of(sample)
+                print_benchmark(before)
+                print_benchmark(benchmark(client, args.runs, tenant, sample.get("userId", "")), baseline=before)
+
+        elif args.command == "tenants":
+            if args.tenant_command == "list":
+                tenants = client.collections.get(COLLECTION).tenants.get()
+                for name, tenant in sorted(tenants.items()):
+                    print(f"   {name:<48} {tenant.activity_status.value}")
+                print(f"共 {len(tenants)} 个租户")
+            elif args.tenant_command == "offload":
+                status = TenantActivityStatus.OFFLOADED if args.to == "offloaded" else TenantActivityStatus.INACTIVE
+                idle = offload_idle_tenants(client, args.idle_days, status, args.dry_run)
+                action = "将设为" if args.dry_run else "已设为"
+                print(f"💤 {len(idle)} 个租户 {args.idle_days} 天内没有新构建，{action} {status.value}")
+                for name in idle:
+                    print(f"   {name}")
+            else:
+                activate_tenants(client, args.names)
+                print(f"✅ 已激活 {len(args.names)} 个租户")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
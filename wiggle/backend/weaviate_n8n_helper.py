@@ -18,21 +18,52 @@ const response = await $http.request({
   }
 });
 ```
+
+基于FastAPI的异步服务：所有请求共享一个长连接的Weaviate客户端（WeaviateClientManager），
+由uvicorn以多进程方式运行（API_WORKERS）。
+
+设置BUILD_TENANCY=user|account时构建写入用户（或账户）对应的租户，
+更新类请求需要同时传入userId（account模式可传accountId）。
 """
 
-from flask import Flask, jsonify, request
+from fastapi import Body, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
+import uvicorn
 import weaviate
 import weaviate.classes as wvc
+from weaviate.exceptions import UnexpectedStatusCodeError
+from weaviate.util import generate_uuid5
+from build_cache import build_cache_from_env
+from build_queries import legacy_build_uuid
+from build_tenants import TenantUnavailable, build_tenancy_from_env
+from weaviate_pool import WeaviateClientManager
 from datetime import datetime
+import json
 import uuid
 import os
 
-app = Flask(__name__)
-
 # Weaviate配置
 WEAVIATE_GRPC_ENDPOINT = os.getenv("WEAVIATE_GRPC_ENDPOINT", "grpc-aoj6v69aspmruwn6zlgma.c0.europe-west3.gcp.weaviate.cloud")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "N08rcE1Ua0pJTlB1RVh0cF9XeEJjMVRGZE5MdjF1YkpqanZKc1RHaTV3ajc4c3BaOEZiOTA5ZXBlay9nPV92MjAw")
 
+# 服务配置：端口与uvicorn工作进程数
+PORT = int(os.getenv("PORT", "5001"))
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+
+# 批量接口：每批写入的条目数，以及JSON请求体的条目上限（更大的回填请使用NDJSON流式输入）
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "100"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+
+BUILD_STATUSES = ['pending', 'processing', 'completed', 'failed']
+UPDATE_FIELDS = ['status', 'textureUrl', 'modelUrl', 'processingTimeMs', 'errorMessage']
+
+# 与查询API共享的构建缓存（设置BUILD_CACHE_REDIS_URL时生效），写入后使其失效
+build_cache = build_cache_from_env()
+
+# 多租户配置（BUILD_TENANCY=off|user|account），需与查询服务一致
+tenancy = build_tenancy_from_env()
+
 def get_weaviate_client():
     """获取Weaviate客户端"""
     return weaviate.connect_to_weaviate_cloud(
@@ -40,81 +71,139 @@ def get_weaviate_client():
         auth_credentials=wvc.init.Auth.api_key(WEAVIATE_API_KEY)
     )
 
-@app.route('/api/builds/create', methods=['POST'])
-def create_build():
+# 进程内共享的Weaviate客户端，调用在线程池中执行（WEAVIATE_THREADS配置）
+weaviate_db = WeaviateClientManager.from_env(get_weaviate_client)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """在应用生命周期内打开共享客户端"""
+    await weaviate_db.start()
+    yield
+    await weaviate_db.close()
+
+app = FastAPI(title="Wiggle Weaviate n8n Helper", lifespan=lifespan)
+
+def error(message, status_code):
+    """与原接口一致的错误响应格式"""
+    return JSONResponse({'success': False, 'error': message}, status_code=status_code)
+
+def failure(e):
+    """异常对应的错误响应：缺少租户参数为400，租户恢复中为503"""
+    if isinstance(e, ValueError):
+        return error(str(e), 400)
+    if isinstance(e, TenantUnavailable):
+        return error(str(e), 503)
+    return error(str(e), 500)
+
+def request_tenant(data):
+    """请求所属的租户（未启用多租户时为None）"""
+    return tenancy.tenant(data.get('userId'), data.get('accountId'))
+
+def new_build_data(data):
+    """创建请求对应的完整构建对象（未提供buildId时自动生成）"""
+    build_id = data.get('buildId', f"build_{uuid.uuid4().hex[:12]}")
+    build_data = {
+        "buildId": build_id,
+        "userId": data['userId'],
+        "timestamp": datetime.now(),
+        "frontImageUrl": data['frontImageUrl'],
+        "backImageUrl": data['backImageUrl'],
+        "textureUrl": None,
+        "modelUrl": None,
+        "status": "pending",
+        "processingTimeMs": None,
+        "errorMessage": None
+    }
+    if data.get('accountId'):
+        build_data["accountId"] = data['accountId']
+    return build_id, build_data
+
+def update_fields(data):
+    """更新请求中允许修改的字段"""
+    return {field: data[field] for field in UPDATE_FIELDS if field in data}
+
+def insert_build(client, tenant, build_id, build_data):
+    """以buildId派生的确定性UUID写入（批量接口为upsert，重复创建不会产生多行；新租户由首次写入自动创建）"""
+    obj_uuid = generate_uuid5(build_id)
+    result = tenancy.collection(client, tenant).data.insert_many([
+        wvc.data.DataObject(properties=build_data, uuid=obj_uuid)
+    ])
+    if result.has_errors:
+        raise Exception(result.errors[0].message)
+    return obj_uuid
+
+def patch_build(client, tenant, build_id, update_data):
+    """直接按确定性UUID更新，无需先查询；对象（或租户）不存在时返回False"""
+    collection = tenancy.readable(client, tenant)
+    if collection is None:
+        return False
+    return update_object(collection, build_id, update_data)
+
+def update_object(collection, build_id, update_data):
+    """部分更新一个构建（只写传入的字段，不覆盖并发写入的其他字段）；对象不存在时返回False"""
+    try:
+        collection.data.update(
+            uuid=generate_uuid5(build_id),
+            properties=update_data
+        )
+    except UnexpectedStatusCodeError as e:
+        if e.status_code != 404:
+            raise
+        # 以确定性UUID写入之前创建的记录（随机UUID），按buildId查到后更新
+        legacy_uuid = legacy_build_uuid(collection, build_id)
+        if legacy_uuid is None:
+            return False
+        collection.data.update(uuid=legacy_uuid, properties=update_data)
+    return True
+
+@app.post('/api/builds/create')
+async def create_build(data: dict = Body(...)):
     """创建新的构建记录
     
     Body:
     {
         "buildId": "build_123",  # 可选，不提供则自动生成
         "userId": "user_001",
+        "accountId": "acct_01",  # 可选，account模式下作为租户
         "frontImageUrl": "https://...",
         "backImageUrl": "https://..."
     }
     """
-    data = request.json
-    
     # 验证必需字段
     if not data.get('userId'):
-        return jsonify({
-            'success': False,
-            'error': 'userId is required'
-        }), 400
+        return error('userId is required', 400)
     
     if not data.get('frontImageUrl') or not data.get('backImageUrl'):
-        return jsonify({
-            'success': False,
-            'error': 'frontImageUrl and backImageUrl are required'
-        }), 400
+        return error('frontImageUrl and backImageUrl are required', 400)
     
     try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        # 生成buildId（如果未提供）
-        build_id = data.get('buildId', f"build_{uuid.uuid4().hex[:12]}")
-        
         # 构建数据对象
-        build_data = {
-            "buildId": build_id,
-            "userId": data['userId'],
-            "timestamp": datetime.now(),
-            "frontImageUrl": data['frontImageUrl'],
-            "backImageUrl": data['backImageUrl'],
-            "textureUrl": None,
-            "modelUrl": None,
-            "status": "pending",
-            "processingTimeMs": None,
-            "errorMessage": None
-        }
+        build_id, build_data = new_build_data(data)
         
-        # 插入数据
-        obj_uuid = collection.data.insert(build_data)
+        obj_uuid = await weaviate_db.run(insert_build, request_tenant(data), build_id, build_data)
         
-        client.close()
+        build_cache.invalidate(build_id)
         
-        return jsonify({
+        return JSONResponse({
             'success': True,
             'data': {
                 'uuid': str(obj_uuid),
                 'buildId': build_id,
                 'status': 'pending'
             }
-        }), 201
+        }, status_code=201)
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        return failure(e)
 
-@app.route('/api/builds/update', methods=['POST'])
-def update_build():
+@app.post('/api/builds/update')
+async def update_build(data: dict = Body(...)):
     """更新构建状态
     
     Body:
     {
         "buildId": "build_123",
+        "userId": "user_001",  # 启用多租户时必需（account模式可传accountId）
         "status": "completed",  # 可选
         "textureUrl": "https://...",  # 可选
         "modelUrl": "https://...",  # 可选
@@ -122,71 +211,38 @@ def update_build():
         "errorMessage": "error details"  # 可选
     }
     """
-    data = request.json
+    return await apply_update(data)
+
+async def apply_update(data):
+    """各更新端点共用的更新逻辑"""
     build_id = data.get('buildId')
     
     if not build_id:
-        return jsonify({
-            'success': False,
-            'error': 'buildId is required'
-        }), 400
+        return error('buildId is required', 400)
     
     try:
-        client = get_weaviate_client()
-        collection = client.collections.get("TshirtBuild")
-        
-        # 查找对象
-        result = collection.query.fetch_objects(
-            filters=wvc.query.Filter.by_property("buildId").equal(build_id),
-            limit=1
-        )
-        
-        if not result.objects:
-            client.close()
-            return jsonify({
-                'success': False,
-                'error': 'Build not found'
-            }), 404
-        
-        obj_uuid = result.objects[0].uuid
-        
         # 构建更新数据
-        update_data = {}
-        if 'status' in data:
-            update_data['status'] = data['status']
-        if 'textureUrl' in data:
-            update_data['textureUrl'] = data['textureUrl']
-        if 'modelUrl' in data:
-            update_data['modelUrl'] = data['modelUrl']
-        if 'processingTimeMs' in data:
-            update_data['processingTimeMs'] = data['processingTimeMs']
-        if 'errorMessage' in data:
-            update_data['errorMessage'] = data['errorMessage']
+        update_data = update_fields(data)
         
-        # 更新对象
-        collection.data.update(
-            uuid=obj_uuid,
-            properties=update_data
-        )
+        # 对象不存在时返回404
+        if not await weaviate_db.run(patch_build, request_tenant(data), build_id, update_data):
+            return error('Build not found', 404)
         
-        client.close()
+        build_cache.invalidate(build_id)
         
-        return jsonify({
+        return {
             'success': True,
             'data': {
                 'buildId': build_id,
                 'updated': list(update_data.keys())
             }
-        })
+        }
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        return failure(e)
 
-@app.route('/api/builds/update-status', methods=['POST'])
-def update_build_status():
+@app.post('/api/builds/update-status')
+async def update_build_status(data: dict = Body(...)):
     """快速更新构建状态（简化版）
     
     Body:
@@ -195,26 +251,19 @@ def update_build_status():
         "status": "processing"  # pending/processing/completed/failed
     }
     """
-    data = request.json
     build_id = data.get('buildId')
     status = data.get('status')
     
     if not build_id or not status:
-        return jsonify({
-            'success': False,
-            'error': 'buildId and status are required'
-        }), 400
+        return error('buildId and status are required', 400)
     
-    if status not in ['pending', 'processing', 'completed', 'failed']:
-        return jsonify({
-            'success': False,
-            'error': 'Invalid status. Must be one of: pending, processing, completed, failed'
-        }), 400
+    if status not in BUILD_STATUSES:
+        return error('Invalid status. Must be one of: pending, processing, completed, failed', 400)
     
-    return update_build()
+    return await apply_update(data)
 
-@app.route('/api/builds/complete', methods=['POST'])
-def complete_build():
+@app.post('/api/builds/complete')
+async def complete_build(data: dict = Body(...)):
     """标记构建为完成状态
     
     Body:
@@ -225,21 +274,16 @@ def complete_build():
         "processingTimeMs": 3500
     }
     """
-    data = request.json
-    
     if not all(key in data for key in ['buildId', 'textureUrl', 'modelUrl']):
-        return jsonify({
-            'success': False,
-            'error': 'buildId, textureUrl, and modelUrl are required'
-        }), 400
+        return error('buildId, textureUrl, and modelUrl are required', 400)
     
     # 添加completed状态
     data['status'] = 'completed'
     
-    return update_build()
+    return await apply_update(data)
 
-@app.route('/api/builds/fail', methods=['POST'])
-def fail_build():
+@app.post('/api/builds/fail')
+async def fail_build(data: dict = Body(...)):
     """标记构建为失败状态
     
     Body:
@@ -248,49 +292,231 @@ def fail_build():
         "errorMessage": "Error details..."
     }
     """
-    data = request.json
-    
     if not data.get('buildId'):
-        return jsonify({
-            'success': False,
-            'error': 'buildId is required'
-        }), 400
+        return error('buildId is required', 400)
     
     # 添加failed状态
     data['status'] = 'failed'
     
-    return update_build()
+    return await apply_update(data)
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """健康检查"""
-    try:
-        client = get_weaviate_client()
-        is_ready = client.is_ready()
-        client.close()
-        
-        return jsonify({
-            'status': 'healthy' if is_ready else 'unhealthy',
-            'service': 'weaviate-n8n-helper',
-            'weaviate': 'connected' if is_ready else 'disconnected'
-        }), 200 if is_ready else 503
+def validate_bulk_item(op, data):
+    """批量条目的校验，返回错误信息或None"""
+    if not isinstance(data, dict):
+        return 'Item must be a JSON object'
+    if op == 'create':
+        if not data.get('userId'):
+            return 'userId is required'
+        if not data.get('frontImageUrl') or not data.get('backImageUrl'):
+            return 'frontImageUrl and backImageUrl are required'
+    elif op == 'update':
+        if not data.get('buildId'):
+            return 'buildId is required'
+        if tenancy.enabled and not (data.get('userId') or data.get('accountId')):
+            return 'userId is required when builds are stored per tenant'
+        if 'status' in data and data['status'] not in BUILD_STATUSES:
+            return f"Invalid status. Must be one of: {', '.join(BUILD_STATUSES)}"
+    else:
+        return 'op must be create or update'
+    return None
+
+def write_bulk(client, items):
+    """一批已校验的条目经Weaviate批量接口写入（在Weaviate线程池中执行）
+    
+    items: [(key, op, data)]，返回 {key: (status_code, buildId, error)}。
+    创建走批量接口；更新逐条执行部分更新，不会覆盖并发写入。
+    创建先于更新执行，同一批中先创建再更新同一构建也能生效。
+    启用多租户时按租户分组，每个租户各自批量写入。
+    """
+    groups = {}
+    for key, op, data in items:
+        groups.setdefault(request_tenant(data), []).append((key, op, data))
+    
+    results = {}
+    for tenant, group in groups.items():
+        results.update(write_tenant_bulk(client, tenant, group))
+    return results
+
+def write_tenant_bulk(client, tenant, items):
+    """同一租户内的一批条目：创建批量upsert，更新逐条部分更新"""
+    collection = tenancy.collection(client, tenant)
+    results = {}
+    
+    # 创建：完整对象按确定性UUID批量upsert
+    creates = []
+    for key, op, data in items:
+        if op == 'create':
+            build_id, build_data = new_build_data(data)
+            creates.append((key, build_id, build_data))
+    if creates:
+        with collection.batch.fixed_size(batch_size=len(creates)) as batch:
+            for _, build_id, build_data in creates:
+                batch.add_object(properties=build_data, uuid=generate_uuid5(build_id))
+        failed = {str(e.object_.uuid): e.message for e in collection.batch.failed_objects}
+        for key, build_id, _ in creates:
+            message = failed.get(str(generate_uuid5(build_id)))
+            results[key] = (500, build_id, message) if message else (201, build_id, None)
+    
+    # 更新：批量接口会替换整个对象，读出合并再写回会丢失期间的并发修改，所以逐条部分更新
+    updates = [(key, data['buildId'], update_fields(data)) for key, op, data in items if op == 'update']
+    if updates:
+        # 租户不存在（该用户尚无构建）时所有更新都是404
+        collection = tenancy.readable(client, tenant)
+        for key, build_id, fields in updates:
+            if collection is None:
+                results[key] = (404, build_id, 'Build not found')
+                continue
+            try:
+                found = update_object(collection, build_id, fields)
+            except Exception as e:
+                results[key] = (500, build_id, str(e))
+                continue
+            results[key] = (200, build_id, None) if found else (404, build_id, 'Build not found')
+    return results
+
+async def apply_bulk(items):
+    """校验并写入一批条目[(位置信息, op, data)]，返回与输入顺序一致的逐条结果"""
+    results = {}
+    valid = []
+    for key, (_, op, data) in enumerate(items):
+        message = validate_bulk_item(op, data)
+        if message:
+            results[key] = (400, data.get('buildId') if isinstance(data, dict) else None, message)
+        else:
+            valid.append((key, op, data))
+    
+    if valid:
+        try:
+            results.update(await weaviate_db.run(write_bulk, valid))
+        except Exception as e:
+            for key, op, data in valid:
+                results[key] = (500, data.get('buildId'), str(e))
+    
+    output = []
+    for key, (position, op, data) in enumerate(items):
+        status_code, build_id, message = results[key]
+        if status_code < 300:
+            build_cache.invalidate(build_id)
+        item = dict(position, op=op, buildId=build_id, status=status_code, success=status_code < 300)
+        if message:
+            item['error'] = message
+        output.append(item)
+    return output
+
+async def read_ndjson(request):
+    """逐行读取NDJSON请求体，不把整个请求体读入内存"""
+    buffer = b''
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line
+    if buffer.strip():
+        yield buffer
+
+def bulk_summary(results):
+    return {
+        'total': len(results),
+        'created': sum(1 for r in results if r['op'] == 'create' and r['success']),
+        'updated': sum(1 for r in results if r['op'] == 'update' and r['success']),
+        'failed': sum(1 for r in results if not r['success'])
+    }
+
+@app.post('/api/builds/bulk')
+async def bulk_builds(request: Request):
+    """批量创建/更新构建记录（Weaviate批量接口，每批BULK_BATCH_SIZE条）
+    
+    JSON Body:
+    {
+        "creates": [{"userId": "...", "frontImageUrl": "...", "backImageUrl": "..."}],
+        "updates": [{"buildId": "build_123", "status": "completed", "modelUrl": "..."}]
+    }
+    返回每条的结果（index为在各自数组中的位置）及汇总。
+    
+    NDJSON（Content-Type: application/x-ndjson），用于大批量回填，每行一个条目:
+    {"op": "create", "userId": "...", "frontImageUrl": "...", "backImageUrl": "..."}
+    {"op": "update", "buildId": "build_123", "status": "failed", "errorMessage": "..."}
+    请求体边读边分批写入；返回NDJSON，每行一个结果（line为输入行号），最后一行为汇总。
+    """
+    content_type = request.headers.get('content-type', '')
+    
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        results = []
+        chunk = []
+        line_number = 0
+        async for line in read_ndjson(request):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                op = data.pop('op', None) if isinstance(data, dict) else None
+            except ValueError:
+                data, op = None, 'invalid'
+            chunk.append(({'line': line_number}, op, data))
+            if len(chunk) >= BULK_BATCH_SIZE:
+                results.extend(await apply_bulk(chunk))
+                chunk = []
+        if chunk:
+            results.extend(await apply_bulk(chunk))
         
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 503
+        lines = [json.dumps(r) for r in results]
+        lines.append(json.dumps({'summary': bulk_summary(results)}))
+        return Response('\n'.join(lines) + '\n', media_type='application/x-ndjson')
+    
+    try:
+        body = await request.json()
+    except ValueError:
+        return error('Invalid JSON body', 400)
+    if not isinstance(body, dict):
+        return error('Body must be an object with creates and/or updates', 400)
+    
+    items = [({'index': i}, 'create', data) for i, data in enumerate(body.get('creates') or [])]
+    items += [({'index': i}, 'update', data) for i, data in enumerate(body.get('updates') or [])]
+    if not items:
+        return error('creates or updates is required', 400)
+    if len(items) > BULK_MAX_ITEMS:
+        return error(f'At most {BULK_MAX_ITEMS} items per request; use NDJSON for larger backfills', 413)
+    
+    results = []
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        results.extend(await apply_bulk(items[start:start + BULK_BATCH_SIZE]))
+    
+    return {
+        'success': True,
+        'data': {
+            'results': results,
+            'summary': bulk_summary(results)
+        }
+    }
+
+@app.get('/health')
+async def health_check():
+    """健康检查（连接状态按WEAVIATE_HEALTH_TTL缓存）"""
+    health = await weaviate_db.health()
+    is_ready = health['status'] == 'connected'
+    
+    body = {
+        'status': 'healthy' if is_ready else 'unhealthy',
+        'service': 'weaviate-n8n-helper',
+        'weaviate': 'connected' if is_ready else 'disconnected',
+        'pool': weaviate_db.stats()
+    }
+    if not is_ready:
+        body['error'] = health['status']
+    return JSONResponse(body, status_code=200 if is_ready else 503)
 
 if __name__ == '__main__':
     print("🚀 启动Weaviate n8n辅助服务")
     print(f"📍 Weaviate Cloud: {WEAVIATE_GRPC_ENDPOINT}")
-    print(f"🌐 服务端口: 5001")
+    print(f"🌐 服务端口: {PORT}，工作进程: {API_WORKERS}")
     print("\n可用端点:")
     print("  POST /api/builds/create - 创建构建记录")
     print("  POST /api/builds/update - 更新构建记录")
     print("  POST /api/builds/update-status - 更新状态")
     print("  POST /api/builds/complete - 标记完成")
     print("  POST /api/builds/fail - 标记失败")
+    print("  POST /api/builds/bulk - 批量创建/更新（JSON或NDJSON）")
     print("  GET  /health - 健康检查")
     print("\n💡 n8n集成示例:")
     print("""\n  在n8n的HTTP Request节点中:
@@ -300,4 +526,5 @@ if __name__ == '__main__':
   """)
     print("\n" + "=" * 50)
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # 多进程生产服务器；每个进程独立的事件循环与共享Weaviate连接
+    uvicorn.run("weaviate_n8n_helper:app", host='0.0.0.0', port=PORT, workers=API_WORKERS)
\ No newline at end of file
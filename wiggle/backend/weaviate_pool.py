@@ -0,0 +1,140 @@
+"""
+Shared, non-blocking Weaviate access for the FastAPI services
+
+One Weaviate client is opened for the lifetime of the app and shared by all
+endpoints instead of connecting per call. The v4 batch API used for build
+records is only available on the synchronous client, so calls run on a
+small dedicated thread pool and never block the event loop. Connection
+failures trigger a reconnect and one retry, and the health status is cached
+so probes do not hit the cluster every time.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import weaviate
+from weaviate.exceptions import WeaviateClosedClientError, WeaviateConnectionError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Errors after which the client is dropped and a fresh connection is opened
+RECONNECT_ERRORS = (WeaviateConnectionError, WeaviateClosedClientError, ConnectionError)
+
+
+class WeaviateUnavailable(Exception):
+    """Raised when no Weaviate connection is configured or can be opened"""
+
+
+class WeaviateClientManager:
+    """Lifespan-managed Weaviate client with reconnects and cached health"""
+
+    def __init__(
+        self,
+        connect: Callable[[], Optional[weaviate.WeaviateClient]],
+        max_workers: int = 8,
+        health_ttl: float = 15.0
+    ):
+        self._connect = connect
+        self._client: Optional[weaviate.WeaviateClient] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="weaviate")
+        self.max_workers = max_workers
+        self.health_ttl = health_ttl
+        self._health: Optional[Dict[str, Any]] = None
+        self._health_checked_at = 0.0
+        self._connects = 0
+        self._reconnects = 0
+        self._calls = 0
+        self._errors = 0
+
+    @classmethod
+    def from_env(cls, connect: Callable[[], Optional[weaviate.WeaviateClient]]) -> "WeaviateClientManager":
+        return cls(
+            connect,
+            max_workers=int(os.getenv("WEAVIATE_THREADS", "8")),
+            health_ttl=float(os.getenv("WEAVIATE_HEALTH_TTL", "15"))
+        )
+
+    async def start(self) -> None:
+        """Open the connection eagerly; failures are retried on first use"""
+        try:
+            await self._in_thread(self._get_client)
+        except Exception as e:
+            logger.warning(f"Weaviate not reachable at startup: {str(e)}")
+
+    async def close(self) -> None:
+        await self._in_thread(self._drop_client)
+        self._executor.shutdown(wait=False)
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Call fn(client, *args) on the Weaviate thread pool"""
+        self._calls += 1
+        try:
+            return await self._in_thread(self._call, fn, args)
+        except Exception:
+            self._errors += 1
+            raise
+
+    async def health(self) -> Dict[str, Any]:
+        """Connection status, refreshed at most every health_ttl seconds"""
+        now = time.monotonic()
+        if self._health is None or now - self._health_checked_at > self.health_ttl:
+            try:
+                ready = await self._in_thread(self._call, lambda client: client.is_ready(), ())
+                status = "connected" if ready else "not ready"
+            except Exception as e:
+                status = f"error: {str(e)}"
+            self._health = {"status": status, "checkedAt": datetime.now().isoformat()}
+            self._health_checked_at = now
+        return self._health
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self._client is not None,
+            "threads": self.max_workers,
+            "connects": self._connects,
+            "reconnects": self._reconnects,
+            "calls": self._calls,
+            "errors": self._errors
+        }
+
+    async def _in_thread(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _get_client(self) -> weaviate.WeaviateClient:
+        with self._lock:
+            if self._client is None:
+                client = self._connect()
+                if client is None:
+                    raise WeaviateUnavailable("Weaviate is not configured")
+                self._client = client
+                self._connects += 1
+            return self._client
+
+    def _drop_client(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                try:
+                    self._client.close()
+                except Exception:
+                    pass
+                self._client = None
+
+    def _call(self, fn: Callable[..., T], args: tuple) -> T:
+        client = self._get_client()
+        try:
+            return fn(client, *args)
+        except RECONNECT_ERRORS as e:
+            logger.warning(f"Weaviate connection lost, reconnecting: {str(e)}")
+            self._drop_client()
+            self._reconnects += 1
+            return fn(self._get_client(), *args)
@@ -5,19 +5,27 @@
 使用方法:
 1. 启动Weaviate实例: docker run -d -p 8080:8080 -p 50051:50051 semitechnologies/weaviate:latest
 2. 运行此脚本创建schema: python weaviate_schema.py
+3. schema调整通过迁移下发到已有集合: python weaviate_migrations.py migrate
 """
 
 import weaviate
 import weaviate.classes as wvc
+from weaviate.util import generate_uuid5
 from datetime import datetime
 import os
 
+from weaviate_migrations import migrate
+
 # Weaviate连接配置
 WEAVIATE_GRPC_ENDPOINT = os.getenv("WEAVIATE_GRPC_ENDPOINT", "grpc-aoj6v69aspmruwn6zlgma.c0.europe-west3.gcp.weaviate.cloud")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "N08rcE1Ua0pJTlB1RVh0cF9XeEJjMVRGZE5MdjF1YkpqanZKc1RHaTV3ajc4c3BaOEZiOTA5ZXBlay9nPV92MjAw")
 
 def create_schema():
-    """创建Weaviate schema"""
+    """创建或升级Weaviate schema
+
+    集合定义和版本迁移在weaviate_migrations.py中维护：新库按最新配置创建，
+    已有集合执行未应用的迁移（需要重建时会复制全部数据，请在维护窗口运行）。
+    """
     
     # 连接到Weaviate Cloud
     client = weaviate.connect_to_weaviate_cloud(
@@ -26,101 +34,20 @@ def create_schema():
     )
     
     try:
-        # 检查集合是否已存在
-        if client.collections.exists("TshirtBuild"):
-            print("⚠️  TshirtBuild集合已存在，跳过创建")
-            return client
-        
-        # 创建TshirtBuild集合
-        print("📝 正在创建TshirtBuild集合...")
-        tshirt_build = client.collections.create(
-            name="TshirtBuild",
-            description="存储T恤纹理构建的元数据和向量",
-            
-            # 定义属性
-            properties=[
-                wvc.config.Property(
-                    name="buildId",
-                    description="构建的唯一标识符",
-                    data_type=wvc.config.DataType.TEXT,
-                    skip_vectorization=True
-                ),
-                wvc.config.Property(
-                    name="userId",
-                    description="用户ID",
-                    data_type=wvc.config.DataType.TEXT,
-                    skip_vectorization=True
-                ),
-                wvc.config.Property(
-                    name="timestamp",
-                    description="构建创建时间",
-                    data_type=wvc.config.DataType.DATE
-                ),
-                wvc.config.Property(
-                    name="frontImageUrl",
-                    description="前面图片的URL（可以是临时URL）",
-                    data_type=wvc.config.DataType.TEXT
-                ),
-                wvc.config.Property(
-                    name="backImageUrl",
-                    description="后面图片的URL（可以是临时URL）",
-                    data_type=wvc.config.DataType.TEXT
-                ),
-                wvc.config.Property(
-                    name="textureUrl",
-                    description="生成的纹理图片URL（24小时过期）",
-                    data_type=wvc.config.DataType.TEXT,
-                    skip_vectorization=True
-                ),
-                wvc.config.Property(
-                    name="modelUrl",
-                    description="生成的带纹理模型URL（24小时过期）",
-                    data_type=wvc.config.DataType.TEXT,
-                    skip_vectorization=True
-                ),
-                wvc.config.Property(
-                    name="status",
-                    description="构建状态: pending/processing/completed/failed",
-                    data_type=wvc.config.DataType.TEXT,
-                    skip_vectorization=True
-                ),
-                wvc.config.Property(
-                    name="processingTimeMs",
-                    description="处理时间（毫秒）",
-                    data_type=wvc.config.DataType.NUMBER
-                ),
-                wvc.config.Property(
-                    name="errorMessage",
-                    description="错误信息（如果失败）",
-                    data_type=wvc.config.DataType.TEXT,
-                    skip_vectorization=True
-                ),
-            ],
-            
-            # 注意：远程集群可能不支持multi2vec-clip，改为使用none（不自动向量化）
-            # 如需向量搜索功能，请在集群中启用相应的向量化模块
-            vectorizer_config=wvc.config.Configure.Vectorizer.none(),
-            
-            # 配置向量索引
-            vector_index_config=wvc.config.Configure.VectorIndex.hnsw(
-                distance_metric=wvc.config.VectorDistances.COSINE,
-                ef_construction=128,
-                max_connections=64
-            )
-        )
-        
-        print("✅ TshirtBuild集合创建成功")
+        version = migrate(client)
         
         # 打印schema信息
         collection = client.collections.get("TshirtBuild")
         print(f"\n📊 集合信息:")
         print(f"   名称: {collection.name}")
-        print(f"   向量化器: multi2vec_clip")
+        print(f"   Schema版本: v{version}")
+        print(f"   向量化器: none（向量由image_embeddings本地计算）")
         
         return client
         
     except Exception as e:
         print(f"❌ 创建schema失败: {e}")
+        client.close()
         raise
 
 def add_sample_data(client):
@@ -156,8 +83,9 @@ def add_sample_data(client):
         }
     ]
     
+    # 以buildId派生的确定性UUID写入，重复写入同一buildId会被拒绝而不是产生重复数据
     for build in sample_builds:
-        collection.data.insert(build)
+        collection.data.insert(build, uuid=generate_uuid5(build["buildId"]))
     
     print(f"✅ 成功添加 {len(sample_builds)} 条示例数据")
 